@@ -0,0 +1,6 @@
+"""Offline benchmark suite for the economy and persistence hot paths.
+
+Run ``python -m benchmarks`` from the project root.  Every case works against
+synthetic data in a temporary directory, so the live ``idol_agency.db`` and
+``data/girls.json`` are never touched.
+"""
@@ -0,0 +1,98 @@
+"""Command line entry point: ``python -m benchmarks``.
+
+Examples::
+
+    python -m benchmarks                          # run everything, compare to baseline
+    python -m benchmarks --only compute_tick --users 200 --rosters 10,500
+    python -m benchmarks --update-baseline        # store the run as the new baseline
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Sequence
+
+from benchmarks.cases import CASES, Context
+from benchmarks.runner import DEFAULT_THRESHOLD, compare, format_seconds, load_results, write_results
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+
+
+def _int_list(text: str) -> List[int]:
+    return [int(part) for part in text.split(",") if part.strip()]
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.splitlines()[0])
+    parser.add_argument("--only", action="append", choices=sorted(CASES), help="run only these cases")
+    parser.add_argument("--users", type=int, default=20, help="synthetic agencies per database")
+    parser.add_argument("--rosters", type=_int_list, default=[10, 100], help="comma separated roster sizes")
+    parser.add_argument("--dts", type=_int_list, default=[60, 86_400], help="comma separated offline seconds")
+    parser.add_argument("--pool-sizes", type=_int_list, default=[1_000, 10_000], help="catalog sizes")
+    parser.add_argument("--large-pool", type=int, default=100_000, help="catalog size for load_pool_large")
+    parser.add_argument("--agencies", type=int, default=1_000_000, help="ranking size for the leaderboard case")
+    parser.add_argument("--repeat", type=int, default=5, help="samples per benchmark")
+    parser.add_argument("--output", type=Path, default=Path("bench_output.json"), help="results JSON path")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="allowed slowdown as a fraction of the baseline median (default: %(default)s)",
+    )
+    parser.add_argument("--update-baseline", action="store_true", help="write the results to --baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str]) -> int:
+    args = parse_args(argv)
+    params = {
+        "users": args.users,
+        "rosters": args.rosters,
+        "dts": args.dts,
+        "pool_sizes": args.pool_sizes,
+        "large_pool": args.large_pool,
+        "agencies": args.agencies,
+        "repeat": args.repeat,
+    }
+    results = []
+    with tempfile.TemporaryDirectory(prefix="idol-bench-") as tmp:
+        ctx = Context(workdir=Path(tmp), **params)
+        for name in args.only or sorted(CASES):
+            print(f"== {name}")
+            for result in CASES[name](ctx):
+                line = f"  {result.name:<45} median {format_seconds(result.median):>12}  min {format_seconds(result.minimum):>12}"
+                if "peak_bytes" in result.extra:
+                    line += f"  peak {result.extra['peak_bytes'] / 2**20:.1f}MiB"
+                print(line)
+                results.append(result)
+
+    write_results(args.output, results, params)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        # Merge so refreshing a subset (--only) keeps the other cases.
+        previous = load_results(args.baseline) if args.baseline.exists() else {}
+        write_results(args.baseline, results, params, keep=previous)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print("No baseline found; skipping comparison.")
+        return 0
+
+    regressions = compare(results, load_results(args.baseline), args.threshold)
+    if not regressions:
+        print(f"No regressions beyond {args.threshold:.0%} of baseline.")
+        return 0
+    print(f"Regressions beyond {args.threshold:.0%} of baseline:")
+    for name, before, after, ratio in regressions:
+        print(f"  {name}: {format_seconds(before)} -> {format_seconds(after)} ({ratio:.2f}x)")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
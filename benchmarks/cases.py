@@ -0,0 +1,373 @@
+"""Benchmark cases for the economy and persistence hot paths.
+
+Each case is a function taking a :class:`Context` and returning a list of
+:class:`~benchmarks.runner.Result`.  Register new cases with ``@case``.
+"""
+
+from __future__ import annotations
+
+import random
+import tracemalloc
+from dataclasses import dataclass, field
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+from benchmarks.runner import Result, measure
+from benchmarks.synthetic import populate_db, rewind_clock, write_pool
+from models.girl_pool import compile_pool, load_pool, snapshot_path
+from services.balance import format_xp, level_xp_required, xp_to_storage
+from services.formatting import format_currency, format_plain, format_rate
+from services.gacha import pick_by_rarity, rarity_roll
+from services.game import compute_tick, forecast, stamina_tick, time_until_pulls
+from services.leaderboard import RankIndex
+from services.render import clear_render_caches, girl_card, girl_line
+from services.roster import RosterFilter, fetch_roster
+from db.database import db, init_db
+from storage import MemoryStorage, set_storage
+
+
+@dataclass
+class Context:
+    workdir: Path
+    users: int = 20
+    rosters: Sequence[int] = (10, 100)
+    dts: Sequence[int] = (60, 86_400)
+    pool_sizes: Sequence[int] = (1_000, 10_000)
+    large_pool: int = 100_000
+    agencies: int = 1_000_000
+    repeat: int = 5
+    extras: Dict[str, object] = field(default_factory=dict)
+
+
+CaseFunc = Callable[[Context], List[Result]]
+CASES: Dict[str, CaseFunc] = {}
+
+
+def case(name: str) -> Callable[[CaseFunc], CaseFunc]:
+    def register(func: CaseFunc) -> CaseFunc:
+        CASES[name] = func
+        return func
+
+    return register
+
+
+@case("stamina_tick")
+def bench_stamina_tick(ctx: Context) -> List[Result]:
+    results = []
+    for dt in ctx.dts:
+        results.append(
+            measure(
+                f"stamina_tick[dt={dt}]",
+                lambda dt=dt: stamina_tick(42.5, True, dt),
+                number=2_000,
+                repeat=ctx.repeat,
+            )
+        )
+    return results
+
+
+@case("compute_tick")
+def bench_compute_tick(ctx: Context) -> List[Result]:
+    results = []
+    for roster in ctx.rosters:
+        for dt in ctx.dts:
+            path = ctx.workdir / f"tick_{roster}_{dt}.db"
+            user_ids = populate_db(path, ctx.users, roster, dt)
+
+            def run(user_ids=user_ids) -> None:
+                for uid in user_ids:
+                    compute_tick(uid)
+
+            results.append(
+                measure(
+                    f"compute_tick[roster={roster},dt={dt}]",
+                    run,
+                    repeat=ctx.repeat,
+                    setup=lambda user_ids=user_ids, dt=dt: rewind_clock(user_ids, dt),
+                    extra={"users": len(user_ids), "per": "all users"},
+                )
+            )
+    return results
+
+
+@case("forecast")
+def bench_forecast(ctx: Context) -> List[Result]:
+    """Read-only projections for the largest roster size."""
+
+    roster = max(ctx.rosters)
+    user_ids = populate_db(ctx.workdir / f"forecast_{roster}.db", ctx.users, roster, 3600)
+    uid = user_ids[0]
+    extra = {"girls": roster}
+    return [
+        measure(
+            f"forecast[roster={roster},hours=8]",
+            lambda: forecast(uid, 8 * 3600),
+            number=20,
+            repeat=ctx.repeat,
+            extra=extra,
+        ),
+        measure(
+            f"time_until_pulls[roster={roster},pulls=1000]",
+            lambda: time_until_pulls(uid, 1000),
+            number=5,
+            repeat=ctx.repeat,
+            extra=extra,
+        ),
+    ]
+
+
+@case("roster_query")
+def bench_roster_query(ctx: Context) -> List[Result]:
+    """Filtered /girls queries against the largest roster size."""
+
+    roster = max(ctx.rosters)
+    user_ids = populate_db(ctx.workdir / f"roster_{roster}.db", ctx.users, roster, 60)
+    init_db()  # refresh planner statistics as a restart would
+    uid = user_ids[0]
+    filters = {
+        "all": RosterFilter(),
+        "rarity": RosterFilter(rarity="UR", sort="income"),
+        "specialty": RosterFilter(specialty="dancer"),
+        "resting": RosterFilter(working=False),
+        "min_level": RosterFilter(min_level=35, sort="level"),
+        "search": RosterFilter(search="Girl0000"),
+    }
+    results = []
+    con = db()
+    try:
+        cur = con.cursor()
+        for label, flt in filters.items():
+            results.append(
+                measure(
+                    f"roster_query[roster={roster},{label}]",
+                    lambda flt=flt: fetch_roster(cur, uid, flt),
+                    number=20,
+                    repeat=ctx.repeat,
+                    extra={"rows": len(fetch_roster(cur, uid, flt))},
+                )
+            )
+    finally:
+        con.close()
+    return results
+
+
+@case("memory_storage")
+def bench_memory_storage(ctx: Context) -> List[Result]:
+    """compute_tick and roster filters against the in-memory engine."""
+
+    results = []
+    roster = max(ctx.rosters)
+    previous = set_storage(None)
+    try:
+        for dt in ctx.dts:
+            path = ctx.workdir / f"memory_{roster}_{dt}.db"
+            user_ids = populate_db(path, ctx.users, roster, dt)
+
+            def run(user_ids=user_ids) -> None:
+                for uid in user_ids:
+                    compute_tick(uid)
+
+            results.append(
+                measure(
+                    f"compute_tick_memory[roster={roster},dt={dt}]",
+                    run,
+                    repeat=ctx.repeat,
+                    setup=lambda path=path: set_storage(MemoryStorage.from_sqlite(path)),
+                    extra={"users": len(user_ids), "per": "all users"},
+                )
+            )
+        store = MemoryStorage.from_sqlite(path)
+        uid = user_ids[0]
+        for label, flt in (("all", RosterFilter()), ("rarity", RosterFilter(rarity="UR", sort="income"))):
+            results.append(
+                measure(
+                    f"roster_query_memory[roster={roster},{label}]",
+                    lambda flt=flt: store.roster(uid, flt),
+                    number=20,
+                    repeat=ctx.repeat,
+                )
+            )
+    finally:
+        set_storage(previous)
+    return results
+
+
+@case("xp_math")
+def bench_xp_math(ctx: Context) -> List[Result]:
+    results = []
+    for level in (1, 500, 9_998):
+        results.append(
+            measure(
+                f"level_xp_required[level={level}]",
+                lambda level=level: level_xp_required(level),
+                number=500,
+                repeat=ctx.repeat,
+            )
+        )
+    for label, value in (("small", Decimal("12345.5")), ("huge", level_xp_required(9_998))):
+        results.append(
+            measure(f"xp_to_storage[{label}]", lambda value=value: xp_to_storage(value), number=500, repeat=ctx.repeat)
+        )
+        results.append(
+            measure(f"format_xp[{label}]", lambda value=value: format_xp(value), number=500, repeat=ctx.repeat)
+        )
+    return results
+
+
+@case("load_pool")
+def bench_load_pool(ctx: Context) -> List[Result]:
+    results = []
+    for size in ctx.pool_sizes:
+        path = write_pool(ctx.workdir / f"pool_{size}" / "girls.json", size, with_images=True)
+        results.append(
+            measure(f"load_pool[entries={size}]", lambda path=path: load_pool(str(path)), repeat=ctx.repeat)
+        )
+    return results
+
+
+@case("load_pool_large")
+def bench_load_pool_large(ctx: Context) -> List[Result]:
+    """Cold load of a big catalog, reporting wall time and peak traced memory."""
+
+    size = ctx.large_pool
+    path = write_pool(ctx.workdir / f"pool_large_{size}" / "girls.json", size, with_images=True)
+    result = measure(f"load_pool[entries={size}]", lambda: load_pool(str(path)), repeat=min(ctx.repeat, 3))
+    tracemalloc.start()
+    try:
+        load_pool(str(path))
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    result.extra["peak_bytes"] = peak
+    return [result]
+
+
+@case("compile_pool")
+def bench_compile_pool(ctx: Context) -> List[Result]:
+    """Cold start with and without a matching compiled snapshot."""
+
+    size = ctx.large_pool
+    path = write_pool(ctx.workdir / f"pool_snapshot_{size}" / "girls.json", size, with_images=True)
+    target = snapshot_path(str(path))
+
+    def drop_snapshot() -> None:
+        if target.exists():
+            target.unlink()
+
+    miss = measure(
+        f"compile_pool[entries={size},snapshot=miss]",
+        lambda: compile_pool(str(path), use_snapshot=True),
+        repeat=min(ctx.repeat, 3),
+        setup=drop_snapshot,
+    )
+    compile_pool(str(path), use_snapshot=True)
+    hit = measure(
+        f"compile_pool[entries={size},snapshot=hit]",
+        lambda: compile_pool(str(path), use_snapshot=True),
+        repeat=ctx.repeat,
+    )
+    hit.extra["snapshot_bytes"] = target.stat().st_size
+    return [miss, hit]
+
+
+@case("leaderboard")
+def bench_leaderboard(ctx: Context) -> List[Result]:
+    """Top-N, rank and update lookups on a ranking of ``ctx.agencies``."""
+
+    size = ctx.agencies
+    rng = random.Random(11)
+    entries = [(uid, rng.lognormvariate(10, 3)) for uid in range(1, size + 1)]
+    index = RankIndex()
+    build = measure(f"rank_index_build[agencies={size}]", lambda: index.build(entries), repeat=1)
+    members = set(rng.sample(range(1, size + 1), min(size, 1_000)))
+    member = next(iter(members))
+    return [
+        build,
+        measure(f"rank_index_top10[agencies={size}]", lambda: index.top(10), number=1_000, repeat=ctx.repeat),
+        measure(
+            f"rank_index_rank[agencies={size}]",
+            lambda: index.rank(rng.randint(1, size)),
+            number=1_000,
+            repeat=ctx.repeat,
+        ),
+        measure(
+            f"rank_index_update[agencies={size}]",
+            lambda: index.update(rng.randint(1, size), rng.lognormvariate(10, 3)),
+            number=1_000,
+            repeat=ctx.repeat,
+        ),
+        measure(
+            f"rank_index_guild[agencies={size},members={len(members)}]",
+            lambda: index.subset(members, 10, member),
+            number=100,
+            repeat=ctx.repeat,
+        ),
+    ]
+
+
+@case("gacha_roll")
+def bench_gacha_roll(ctx: Context) -> List[Result]:
+    results = [measure("rarity_roll", rarity_roll, number=10_000, repeat=ctx.repeat)]
+    rng = random.Random(3)
+    for size in ctx.pool_sizes:
+        path = write_pool(ctx.workdir / f"roll_{size}" / "girls.json", size)
+        pool, _ = load_pool(str(path))
+        results.append(
+            measure(
+                f"pick_by_rarity[pool={size}]",
+                lambda pool=pool: pick_by_rarity(pool, rng.choice(("N", "SR", "UR"))),
+                number=200,
+                repeat=ctx.repeat,
+            )
+        )
+    return results
+
+
+@case("formatting")
+def bench_formatting(ctx: Context) -> List[Result]:
+    values = (0.00042, 3.5, 12_345.678, 9_876_543_210.0)
+    return [
+        measure("format_plain", lambda: [format_plain(v) for v in values], number=2_000, repeat=ctx.repeat),
+        measure("format_currency", lambda: [format_currency(v) for v in values], number=2_000, repeat=ctx.repeat),
+        measure("format_rate", lambda: [format_rate(v) for v in values], number=2_000, repeat=ctx.repeat),
+    ]
+
+
+@case("render")
+def bench_render(ctx: Context) -> List[Result]:
+    """Roster lines and /girls cards, rendered cold and from the render cache."""
+
+    rng = random.Random(5)
+    rows = [
+        {
+            "name": f"Girl {index}",
+            "rarity": rng.choice(("N", "R", "SR", "SSR", "UR")),
+            "level": rng.choice((1, 40, 900, 5000, 9000)),
+            "income": rng.uniform(1, 1e9),
+            "popularity": rng.uniform(1, 500),
+            "fans": rng.uniform(0, 1e7),
+            "xp": str(rng.randint(0, 10**9)),
+            "specialty": rng.choice((None, "Singer", "Dancer")),
+            "is_working": index % 3 != 0,
+            "stamina": round(rng.uniform(0, 100), 3),
+        }
+        for index in range(100)
+    ]
+
+    def cold() -> None:
+        clear_render_caches()
+        for row in rows:
+            girl_line(row)
+            girl_card(row)
+
+    def warm() -> None:
+        for row in rows:
+            girl_line(row)
+            girl_card(row)
+
+    warm()
+    return [
+        measure("render_roster[rows=100,cold]", cold, number=5, repeat=ctx.repeat),
+        measure("render_roster[rows=100,cached]", warm, number=50, repeat=ctx.repeat),
+    ]
@@ -0,0 +1,118 @@
+"""Local stand-ins for ``discord.Interaction`` used by the load harness.
+
+The fakes implement just the surface the cogs touch (``response``,
+``followup``, ``original_response`` and friends) and record when the
+interaction was first acknowledged, so the harness can report both the total
+handler time and the time-to-ack that Discord's 3 second deadline applies to.
+An optional ``api_latency`` emulates the round trip of every REST call.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+import discord
+
+
+class FakeUser:
+    def __init__(self, user_id: int) -> None:
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.roles: List[Any] = []
+
+
+class FakeMessage:
+    def __init__(self, interaction: "FakeInteraction") -> None:
+        self._interaction = interaction
+
+    async def edit(self, **kwargs: Any) -> "FakeMessage":
+        await self._interaction._round_trip("message.edit", kwargs)
+        return self
+
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction") -> None:
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def _ack(self, kind: str, payload: Dict[str, Any]) -> None:
+        if self._done:
+            raise discord.InteractionResponded(self._interaction)  # type: ignore[arg-type]
+        self._done = True
+        self._interaction.acked_at = time.perf_counter()
+        await self._interaction._round_trip(kind, payload)
+
+    async def defer(self, *, ephemeral: bool = False, thinking: bool = False) -> None:
+        await self._ack("response.defer", {"ephemeral": ephemeral, "thinking": thinking})
+
+    async def send_message(self, content: Optional[str] = None, **kwargs: Any) -> None:
+        view = kwargs.get("view")
+        if view is not None:
+            self._interaction.sent_view = view
+        await self._ack("response.send_message", {"content": content, **kwargs})
+
+    async def edit_message(self, **kwargs: Any) -> None:
+        await self._ack("response.edit_message", kwargs)
+
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction") -> None:
+        self._interaction = interaction
+
+    async def send(self, content: Optional[str] = None, **kwargs: Any) -> FakeMessage:
+        view = kwargs.get("view")
+        if view is not None:
+            self._interaction.sent_view = view
+        await self._interaction._round_trip("followup.send", {"content": content, **kwargs})
+        return FakeMessage(self._interaction)
+
+
+class FakeInteraction:
+    """Records every outgoing call instead of talking to Discord."""
+
+    def __init__(
+        self,
+        client: Any,
+        user_id: int,
+        guild_id: Optional[int] = None,
+        api_latency: float = 0.0,
+    ) -> None:
+        self.client = client
+        self.user = FakeUser(user_id)
+        self.guild_id = guild_id
+        self.guild = None
+        self.channel = None
+        self.created_at = discord.utils.utcnow()
+        self.created = time.perf_counter()
+        self.acked_at: Optional[float] = None
+        self.api_latency = api_latency
+        self.calls: List[tuple[str, Dict[str, Any]]] = []
+        self.sent_view: Optional[discord.ui.View] = None
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    async def _round_trip(self, kind: str, payload: Dict[str, Any]) -> None:
+        self.calls.append((kind, payload))
+        if self.api_latency > 0:
+            await asyncio.sleep(self.api_latency)
+
+    @property
+    def ack_latency(self) -> Optional[float]:
+        if self.acked_at is None:
+            return None
+        return self.acked_at - self.created
+
+    async def original_response(self) -> FakeMessage:
+        await self._round_trip("original_response", {})
+        return FakeMessage(self)
+
+    async def edit_original_response(self, **kwargs: Any) -> FakeMessage:
+        await self._round_trip("edit_original_response", kwargs)
+        return FakeMessage(self)
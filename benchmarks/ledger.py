@@ -0,0 +1,123 @@
+"""Group commit vs one commit per write: ``python -m benchmarks.ledger``.
+
+Seeds a database, then runs ``--threads`` threads that settle disjoint sets
+of agencies with :func:`services.game.compute_tick`, once with every write
+committed on its own thread (``LEDGER_GROUP_COMMIT=0``) and once through the
+group-commit writer.  Each settlement pays out and appends a ledger event.
+Reports settlements, commits and ledger events per second and the average
+number of events per commit.
+
+Example::
+
+    python -m benchmarks.ledger --threads 1,4,16 --duration 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+from benchmarks.partitions import parse_counts
+from benchmarks.synthetic import populate_db, rewind_clock
+from db.database import init_db
+from services import game, ledger
+from services.metrics import Metric
+from storage import SQLiteStorage, set_storage
+
+MODES = ("single", "group")
+
+
+def _total(metric: Metric) -> float:
+    return sum(child.value for _, child in metric.samples())
+
+
+def run(user_ids: List[int], threads: int, mode: str, config: argparse.Namespace) -> Dict[str, Any]:
+    os.environ["LEDGER_GROUP_COMMIT"] = "1" if mode == "group" else "0"
+    set_storage(SQLiteStorage())
+    lock = threading.Lock()
+    clock = [int(time.time())]
+
+    def fake_now() -> int:
+        with lock:
+            clock[0] += config.step
+            return clock[0]
+
+    game.now_ts = fake_now
+    rewind_clock(user_ids, 3600)
+    ticks = [0] * threads
+    start = threading.Barrier(threads + 1)
+    deadline: List[float] = []
+
+    def worker(index: int) -> None:
+        mine = user_ids[index::threads]
+        start.wait()
+        while time.perf_counter() < deadline[0]:
+            for uid in mine:
+                game.compute_tick(uid)
+                ticks[index] += 1
+                if time.perf_counter() >= deadline[0]:
+                    break
+
+    pool = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    commits, events = _total(ledger.LEDGER_COMMITS), _total(ledger.LEDGER_EVENTS)
+    deadline.append(time.perf_counter() + config.duration)
+    start.wait()
+    for thread in pool:
+        thread.join()
+    commits = _total(ledger.LEDGER_COMMITS) - commits
+    events = _total(ledger.LEDGER_EVENTS) - events
+    ledger.close_writers()
+    done = sum(ticks)
+    return {
+        "ticks_per_s": done / config.duration,
+        "commits_per_s": commits / config.duration,
+        "events_per_s": events / config.duration,
+        "events_per_commit": events / commits if commits else 0.0,
+    }
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ledger", description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=parse_counts, default=[1, 4, 16], help="comma-separated thread counts")
+    parser.add_argument("--users", type=int, default=2000, help="agencies to seed")
+    parser.add_argument("--roster", type=int, default=10, help="girls per agency")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per combination")
+    parser.add_argument("--step", type=int, default=60, help="simulated seconds between settlements")
+    parser.add_argument("--dir", type=Path, help="where to create the database (default: a temporary directory)")
+    parser.add_argument("--json", type=Path, help="write the results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str]) -> int:
+    config = parse_args(argv)
+    results = []
+    print(f"{'threads':>8}{'mode':>8}{'ticks/s':>10}{'commits/s':>11}{'events/s':>10}{'per commit':>12}")
+    with tempfile.TemporaryDirectory(prefix="idol-ledger-", dir=config.dir) as tmp:
+        db_path = Path(tmp) / "bench.db"
+        user_ids = populate_db(db_path, config.users, config.roster, 3600)
+        init_db()
+        for threads in config.threads:
+            for mode in MODES:
+                result = {"threads": threads, "mode": mode, **run(user_ids, threads, mode, config)}
+                results.append(result)
+                print(
+                    f"{threads:>8}{mode:>8}{result['ticks_per_s']:>10.0f}{result['commits_per_s']:>11.0f}"
+                    f"{result['events_per_s']:>10.0f}{result['events_per_commit']:>12.1f}"
+                )
+    if config.json:
+        with open(config.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,423 @@
+"""Headless load harness: ``python -m benchmarks.load``.
+
+Loads the real cogs into an offline ``commands.Bot``, then lets thousands of
+simulated players issue a weighted mix of ``/agency``, ``/gacha``, ``/girls``,
+``/leaderboard`` and roster button presses through :mod:`benchmarks.interactions`.  Reports
+latency histograms per action, event-loop lag and SQLite lock waits.
+
+Example::
+
+    python -m benchmarks.load --users 2000 --duration 30 --processes 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import discord
+from discord.ext import commands
+
+from benchmarks.interactions import FakeInteraction
+from bot.instrumentation import instrument_commands
+from benchmarks.synthetic import populate_db, write_pool
+from db.database import init_db, partition_paths, set_connection_factory, set_db_path
+from db.instrumented import SQL_SECONDS, InstrumentedConnection, InstrumentedCursor
+from storage import MemoryStorage, set_storage
+
+COGS: Sequence[str] = ("cogs.core", "cogs.gacha", "cogs.girls", "cogs.admin", "cogs.leaderboard", "cogs.alerts")
+DEFAULT_MIX = "agency=4,gacha=2,girls=2,girls_next=3,girls_toggle=1,leaderboard=1"
+HISTOGRAM_BOUNDS: Sequence[float] = (
+    0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 3.0, 5.0,
+)
+LOCK_WAIT_CAP = 5.0
+
+
+class LockStats:
+    waits = 0
+    wait_time = 0.0
+    max_wait = 0.0
+    failures = 0
+
+
+def _is_lock_error(exc: sqlite3.OperationalError) -> bool:
+    text = str(exc).lower()
+    return "locked" in text or "busy" in text
+
+
+def _with_lock_retry(fn: Any, *args: Any) -> Any:
+    """Call ``fn`` and spin on SQLITE_BUSY, accounting the time spent waiting."""
+
+    waited = 0.0
+    started: Optional[float] = None
+    try:
+        while True:
+            try:
+                return fn(*args)
+            except sqlite3.OperationalError as exc:
+                if not _is_lock_error(exc):
+                    raise
+                if started is None:
+                    started = time.perf_counter()
+                waited = time.perf_counter() - started
+                if waited >= LOCK_WAIT_CAP:
+                    LockStats.failures += 1
+                    raise
+                time.sleep(0.0005)
+    finally:
+        if started is not None:
+            waited = time.perf_counter() - started
+            LockStats.waits += 1
+            LockStats.wait_time += waited
+            LockStats.max_wait = max(LockStats.max_wait, waited)
+
+
+class LockTimedCursor(InstrumentedCursor):
+    def execute(self, *args: Any) -> sqlite3.Cursor:  # type: ignore[override]
+        return _with_lock_retry(super().execute, *args)
+
+    def executemany(self, *args: Any) -> sqlite3.Cursor:  # type: ignore[override]
+        return _with_lock_retry(super().executemany, *args)
+
+    def executescript(self, *args: Any) -> sqlite3.Cursor:  # type: ignore[override]
+        return _with_lock_retry(super().executescript, *args)
+
+
+class LockTimedConnection(InstrumentedConnection):
+    """Connection that never blocks inside SQLite so lock waits can be timed.
+
+    The busy timeout is forced to zero and every ``SQLITE_BUSY`` is retried
+    here instead, which makes the wait visible to the harness.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        kwargs["timeout"] = 0
+        super().__init__(*args, **kwargs)
+
+    def cursor(self, factory: Any = LockTimedCursor) -> sqlite3.Cursor:  # type: ignore[override]
+        return super().cursor(factory)
+
+    def execute(self, *args: Any) -> sqlite3.Cursor:  # type: ignore[override]
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args: Any) -> sqlite3.Cursor:  # type: ignore[override]
+        return self.cursor().executemany(*args)
+
+    def commit(self) -> None:
+        _with_lock_retry(super().commit)
+
+
+def parse_mix(text: str) -> List[Tuple[str, int]]:
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip():
+            mix.append((name.strip(), int(weight or 1)))
+    return mix
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.ack: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.loop_lag: List[float] = []
+
+    def export(self) -> Dict[str, Any]:
+        return {
+            "latency": dict(self.latency),
+            "ack": dict(self.ack),
+            "errors": dict(self.errors),
+            "loop_lag": self.loop_lag,
+            "sql": {
+                labels[0]: [child.count, child.sum] for labels, child in SQL_SECONDS.children.items()
+            },
+            "lock": {
+                "waits": LockStats.waits,
+                "wait_time": LockStats.wait_time,
+                "max_wait": LockStats.max_wait,
+                "failures": LockStats.failures,
+            },
+        }
+
+
+async def _lag_sampler(recorder: Recorder, stop: asyncio.Event, interval: float = 0.01) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        recorder.loop_lag.append(max(0.0, loop.time() - expected))
+
+
+class Player:
+    def __init__(self, bot: commands.Bot, user_id: int, config: argparse.Namespace, rng: random.Random) -> None:
+        self.bot = bot
+        self.user_id = user_id
+        self.config = config
+        self.rng = rng
+        self.view: Optional[discord.ui.View] = None
+
+    def interaction(self) -> FakeInteraction:
+        return FakeInteraction(self.bot, self.user_id, api_latency=self.config.api_latency)
+
+    async def perform(self, action: str, inter: FakeInteraction) -> None:
+        if action == "agency":
+            cog = self.bot.get_cog("Core")
+            await cog.agency.callback(cog, inter)
+        elif action == "gacha":
+            cog = self.bot.get_cog("Gacha")
+            await cog.gacha.callback(cog, inter)
+        elif action == "leaderboard":
+            cog = self.bot.get_cog("Leaderboard")
+            await cog.leaderboard.callback(cog, inter)
+        elif action == "girls":
+            cog = self.bot.get_cog("Girls")
+            await cog.girls.callback(cog, inter)
+            self.view = inter.sent_view
+        elif action in ("girls_next", "girls_prev", "girls_toggle", "girls_rotate"):
+            if self.view is None:
+                await self.perform("girls", inter)
+                return
+            button = {
+                "girls_next": "go_next",
+                "girls_prev": "go_previous",
+                "girls_toggle": "toggle_work",
+                "girls_rotate": "rotate",
+            }[action]
+            await getattr(self.view, button).callback(inter)
+        else:
+            raise ValueError(f"Unknown action: {action}")
+
+    async def run(self, mix: List[Tuple[str, int]], deadline: float, recorder: Recorder) -> None:
+        names = [name for name, _ in mix]
+        weights = [weight for _, weight in mix]
+        # Stagger the first command so the run does not start with a stampede.
+        await asyncio.sleep(self.rng.uniform(0, self.config.think))
+        while time.perf_counter() < deadline:
+            action = self.rng.choices(names, weights)[0]
+            if action.startswith("girls_") and self.view is None:
+                action = "girls"
+            inter = self.interaction()
+            try:
+                await self.perform(action, inter)
+            except Exception as exc:  # pragma: no cover - surfaced in the report
+                recorder.errors[f"{action}: {type(exc).__name__}: {exc}"] += 1
+            recorder.latency[action].append(time.perf_counter() - inter.created)
+            if inter.ack_latency is not None:
+                recorder.ack[action].append(inter.ack_latency)
+            remaining = deadline - time.perf_counter()
+            await asyncio.sleep(max(0.0, min(remaining, self.rng.expovariate(1 / self.config.think))))
+
+
+async def run_worker(config: argparse.Namespace, user_ids: Sequence[int], seed: int) -> Dict[str, Any]:
+    set_db_path(Path(config.db_path))
+    set_connection_factory(LockTimedConnection)
+    os.environ["GIRLS_JSON_PATH"] = config.pool_path
+    if config.storage == "memory":
+        set_storage(MemoryStorage.from_sqlite(*partition_paths()))
+
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.default())
+    for ext in COGS:
+        await bot.load_extension(ext)
+    instrument_commands(bot.tree)
+
+    recorder = Recorder()
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(_lag_sampler(recorder, stop))
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + config.duration
+    mix = parse_mix(config.mix)
+    players = [Player(bot, uid, config, random.Random(rng.random())) for uid in user_ids]
+    started = time.perf_counter()
+    await asyncio.gather(*(p.run(mix, deadline, recorder) for p in players))
+    stop.set()
+    await sampler
+    return {**recorder.export(), "elapsed": time.perf_counter() - started}
+
+
+def _worker_entry(args: Tuple[argparse.Namespace, Sequence[int], int]) -> Dict[str, Any]:
+    config, user_ids, seed = args
+    return asyncio.run(run_worker(config, user_ids, seed))
+
+
+def merge(parts: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    merged: Dict[str, Any] = {
+        "latency": defaultdict(list),
+        "ack": defaultdict(list),
+        "errors": defaultdict(int),
+        "loop_lag": [],
+        "sql": defaultdict(lambda: [0, 0.0]),
+        "lock": {"waits": 0, "wait_time": 0.0, "max_wait": 0.0, "failures": 0},
+        "elapsed": 0.0,
+    }
+    for part in parts:
+        merged["elapsed"] = max(merged["elapsed"], part["elapsed"])
+        for key in ("latency", "ack"):
+            for name, values in part[key].items():
+                merged[key][name].extend(values)
+        for name, count in part["errors"].items():
+            merged["errors"][name] += count
+        merged["loop_lag"].extend(part["loop_lag"])
+        for verb, (count, seconds) in part["sql"].items():
+            merged["sql"][verb][0] += count
+            merged["sql"][verb][1] += seconds
+        lock = part["lock"]
+        merged["lock"]["waits"] += lock["waits"]
+        merged["lock"]["wait_time"] += lock["wait_time"]
+        merged["lock"]["failures"] += lock["failures"]
+        merged["lock"]["max_wait"] = max(merged["lock"]["max_wait"], lock["max_wait"])
+    return merged
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarise(values: Sequence[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def histogram(values: Sequence[float]) -> List[Tuple[str, int]]:
+    buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+    for value in values:
+        for idx, bound in enumerate(HISTOGRAM_BOUNDS):
+            if value <= bound:
+                buckets[idx] += 1
+                break
+        else:
+            buckets[-1] += 1
+    labels = [f"<= {bound * 1000:g}ms" for bound in HISTOGRAM_BOUNDS] + ["> 5000ms"]
+    return list(zip(labels, buckets))
+
+
+def report(merged: Dict[str, Any]) -> Dict[str, Any]:
+    elapsed = merged["elapsed"]
+    total = sum(len(v) for v in merged["latency"].values())
+    summary = {
+        "elapsed": elapsed,
+        "operations": total,
+        "throughput": total / elapsed if elapsed else 0.0,
+        "actions": {name: summarise(values) for name, values in sorted(merged["latency"].items())},
+        "ack": {name: summarise(values) for name, values in sorted(merged["ack"].items())},
+        "ack_deadline_misses": sum(1 for values in merged["ack"].values() for v in values if v > 3.0),
+        "loop_lag": summarise(merged["loop_lag"]),
+        "sql": {verb: {"count": c, "seconds": t} for verb, (c, t) in sorted(merged["sql"].items())},
+        "lock": merged["lock"],
+        "errors": dict(merged["errors"]),
+    }
+
+    print(f"{total} operations in {elapsed:.1f}s ({summary['throughput']:.1f} ops/s)")
+    print(f"{'action':<14}{'count':>8}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    for name, stats in summary["actions"].items():
+        print(
+            f"{name:<14}{stats['count']:>8}"
+            + "".join(f"{stats[key] * 1000:>8.1f}ms" for key in ("p50", "p90", "p99", "max"))
+        )
+    print(f"\n{'time to ack':<14}{'count':>8}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    for name, stats in summary["ack"].items():
+        print(
+            f"{name:<14}{stats['count']:>8}"
+            + "".join(f"{stats[key] * 1000:>8.1f}ms" for key in ("p50", "p90", "p99", "max"))
+        )
+    print("\nLatency histogram (all actions):")
+    all_values = [v for values in merged["latency"].values() for v in values]
+    peak = max((count for _, count in histogram(all_values)), default=0) or 1
+    for label, count in histogram(all_values):
+        print(f"  {label:>10} {count:>7} {'#' * int(40 * count / peak)}")
+    lag = summary["loop_lag"]
+    print(
+        f"\nEvent-loop lag: p50 {lag['p50'] * 1000:.1f}ms p99 {lag['p99'] * 1000:.1f}ms "
+        f"max {lag['max'] * 1000:.1f}ms"
+    )
+    print("SQL: " + ", ".join(
+        f"{verb} {stats['count']} ({stats['seconds']:.2f}s)" for verb, stats in summary["sql"].items()
+    ))
+    lock = summary["lock"]
+    print(
+        f"DB lock waits: {lock['waits']} (total {lock['wait_time']:.3f}s, max {lock['max_wait'] * 1000:.1f}ms, "
+        f"gave up {lock['failures']})"
+    )
+    print(f"Acks slower than 3s: {summary['ack_deadline_misses']}")
+    if summary["errors"]:
+        print("Errors:")
+        for name, count in summary["errors"].items():
+            print(f"  {count:>6} {name}")
+    return summary
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000, help="concurrent simulated players")
+    parser.add_argument("--roster", type=int, default=20, help="girls per synthetic agency")
+    parser.add_argument("--offline", type=int, default=3600, help="initial offline seconds per agency")
+    parser.add_argument("--pool-size", type=int, default=200, help="synthetic catalog size")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run")
+    parser.add_argument("--think", type=float, default=5.0, help="mean think time between commands")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="simulated Discord REST round trip")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted action mix (default: %(default)s)")
+    parser.add_argument("--processes", type=int, default=1, help="bot processes sharing the database")
+    parser.add_argument(
+        "--storage", choices=("sqlite", "memory"), default="sqlite",
+        help="game state backend; memory copies the seeded database into each process",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", type=Path, help="write the summary as JSON")
+    parser.add_argument("--workdir", type=Path, help="keep the generated DB/pool here instead of a temp dir")
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str]) -> int:
+    config = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="idol-load-") as tmp:
+        workdir = config.workdir or Path(tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        config.db_path = str(workdir / "load.db")
+        config.pool_path = str(write_pool(workdir / "girls.json", config.pool_size))
+        if os.path.exists(config.db_path):
+            os.remove(config.db_path)
+        print(f"Seeding {config.users} agencies x {config.roster} girls ...")
+        user_ids = populate_db(Path(config.db_path), config.users, config.roster, config.offline)
+        # Run the startup backfills again now that the agencies exist, so the
+        # leaderboard stats and ledger openings cover them.
+        init_db()
+
+        if config.processes <= 1:
+            parts = [asyncio.run(run_worker(config, user_ids, config.seed))]
+        else:
+            slices = [
+                (config, user_ids[idx :: config.processes], config.seed + idx)
+                for idx in range(config.processes)
+            ]
+            with multiprocessing.Pool(config.processes) as pool:
+                parts = pool.map(_worker_entry, slices)
+
+    summary = report(merge(parts))
+    if config.json:
+        with open(config.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,121 @@
+"""Multi-process tick throughput: ``python -m benchmarks.partitions``.
+
+Seeds a database, spreads it over ``--partitions`` SQLite files with
+:mod:`tools.partitions`, then runs ``--processes`` workers that settle
+disjoint sets of agencies with :func:`services.game.compute_tick` as fast as
+they can.  Each worker advances a private clock by ``--step`` seconds per
+settlement so every call does real work.  Reports aggregate settlements per
+second and time spent waiting on SQLite locks for every combination.
+
+Example::
+
+    python -m benchmarks.partitions --processes 1,2,4 --partitions 1,4 --duration 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+from benchmarks.load import LockStats, LockTimedConnection
+from benchmarks.synthetic import populate_db
+from db.database import SLOT_COUNT, reload_partitions, set_connection_factory, set_db_path
+from services import game
+from tools.partitions import load_map, move_slots, new_partition
+
+
+def partition(path: Path, count: int) -> None:
+    """Deal the slots of a fresh database round-robin over ``count`` files."""
+
+    pmap = load_map(path)
+    for index in range(1, count):
+        new_partition(path, pmap)
+        move_slots(path, pmap, [slot for slot in range(SLOT_COUNT) if slot % count == index], index)
+
+
+def _worker(args: Tuple[str, Sequence[int], float, float, int]) -> Dict[str, Any]:
+    db_path, user_ids, start_at, duration, step = args
+    set_db_path(Path(db_path))
+    reload_partitions()
+    set_connection_factory(LockTimedConnection)
+    clock = [int(time.time())]
+
+    def fake_now() -> int:
+        clock[0] += step
+        return clock[0]
+
+    game.now_ts = fake_now
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = time.perf_counter() + duration
+    ticks = 0
+    while time.perf_counter() < deadline:
+        for uid in user_ids:
+            game.compute_tick(uid)
+            ticks += 1
+            if time.perf_counter() >= deadline:
+                break
+    return {"ticks": ticks, "lock_wait": LockStats.wait_time, "lock_waits": LockStats.waits, "gave_up": LockStats.failures}
+
+
+def run(db_path: Path, user_ids: List[int], processes: int, config: argparse.Namespace) -> Dict[str, Any]:
+    # Workers start together once they have all been forked.
+    start_at = time.time() + 0.5 + 0.1 * processes
+    jobs = [(str(db_path), user_ids[i::processes], start_at, config.duration, config.step) for i in range(processes)]
+    with multiprocessing.Pool(processes) as pool:
+        parts = pool.map(_worker, jobs)
+    ticks = sum(part["ticks"] for part in parts)
+    return {
+        "ticks": ticks,
+        "ticks_per_s": ticks / config.duration,
+        "lock_wait": sum(part["lock_wait"] for part in parts),
+        "lock_waits": sum(part["lock_waits"] for part in parts),
+        "gave_up": sum(part["gave_up"] for part in parts),
+    }
+
+
+def parse_counts(text: str) -> List[int]:
+    return [int(part) for part in text.split(",") if part.strip()]
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.partitions", description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=parse_counts, default=[1, 2, 4], help="comma-separated worker counts")
+    parser.add_argument("--partitions", type=parse_counts, default=[1, 4], help="comma-separated partition counts")
+    parser.add_argument("--users", type=int, default=2000, help="agencies to seed")
+    parser.add_argument("--roster", type=int, default=20, help="girls per agency")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per combination")
+    parser.add_argument("--step", type=int, default=60, help="simulated seconds between settlements")
+    parser.add_argument("--json", type=Path, help="write the results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str]) -> int:
+    config = parse_args(argv)
+    results = []
+    print(f"{'partitions':>10}{'processes':>11}{'ticks/s':>11}{'lock wait':>12}{'waits':>8}")
+    for partitions in config.partitions:
+        with tempfile.TemporaryDirectory(prefix="idol-partitions-") as tmp:
+            db_path = Path(tmp) / "bench.db"
+            user_ids = populate_db(db_path, config.users, config.roster, 3600)
+            partition(db_path, partitions)
+            for processes in config.processes:
+                result = {"partitions": partitions, "processes": processes, **run(db_path, user_ids, processes, config)}
+                results.append(result)
+                print(
+                    f"{partitions:>10}{processes:>11}{result['ticks_per_s']:>11.0f}"
+                    f"{result['lock_wait']:>11.2f}s{result['lock_waits']:>8}"
+                )
+    if config.json:
+        with open(config.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,124 @@
+"""Timing, result serialisation and baseline comparison for benchmarks."""
+
+from __future__ import annotations
+
+import json
+import platform
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_THRESHOLD = 0.25
+
+
+@dataclass
+class Result:
+    """Per-call timings (seconds) for a single benchmark case."""
+
+    name: str
+    median: float
+    minimum: float
+    mean: float
+    repeat: int
+    number: int
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+def measure(
+    name: str,
+    func: Callable[[], Any],
+    *,
+    number: int = 1,
+    repeat: int = 5,
+    setup: Optional[Callable[[], Any]] = None,
+    extra: Optional[Dict[str, Any]] = None,
+) -> Result:
+    """Time ``func`` ``number`` times per sample over ``repeat`` samples.
+
+    ``setup`` runs before every sample and is excluded from the timings.
+    """
+
+    samples: List[float] = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) / number)
+    return Result(
+        name=name,
+        median=statistics.median(samples),
+        minimum=min(samples),
+        mean=statistics.fmean(samples),
+        repeat=repeat,
+        number=number,
+        extra=dict(extra or {}),
+    )
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "timestamp": int(time.time()),
+    }
+
+
+def write_results(
+    path: Path,
+    results: List[Result],
+    params: Dict[str, Any],
+    keep: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> None:
+    """Write ``results`` as JSON; entries in ``keep`` survive unless re-measured."""
+
+    payload = {
+        "meta": {**environment(), "params": params},
+        "results": {**(keep or {}), **{r.name: asdict(r) for r in results}},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load_results(path: Path) -> Dict[str, Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+
+def compare(
+    results: List[Result], baseline: Dict[str, Dict[str, Any]], threshold: float = DEFAULT_THRESHOLD
+) -> List[Tuple[str, float, float, float]]:
+    """Return ``(name, baseline, current, ratio)`` for every regressed case.
+
+    A case regresses when its median is more than ``threshold`` (a fraction)
+    slower than the baseline median.  Cases missing from the baseline are
+    ignored so new benchmarks can land before the baseline is refreshed.
+    """
+
+    regressions: List[Tuple[str, float, float, float]] = []
+    for result in results:
+        reference = baseline.get(result.name)
+        if not reference or not reference.get("median"):
+            continue
+        ratio = result.median / float(reference["median"])
+        if ratio > 1 + threshold:
+            regressions.append((result.name, float(reference["median"]), result.median, ratio))
+    return regressions
+
+
+def format_seconds(value: float) -> str:
+    if value >= 1:
+        return f"{value:.3f}s"
+    if value >= 1e-3:
+        return f"{value * 1e3:.3f}ms"
+    if value >= 1e-6:
+        return f"{value * 1e6:.3f}µs"
+    return f"{value * 1e9:.1f}ns"
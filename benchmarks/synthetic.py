@@ -0,0 +1,120 @@
+"""Synthetic data generators for benchmarks.
+
+Everything here is seeded so repeated runs produce identical datasets.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence
+
+from db.database import db, each_partition, init_db, now_ts, set_db_path
+from models.girl_pool import ALLOWED_RARITIES
+
+SPECIALTIES: Sequence[str] = ("Singer", "Dancer", "Model", "Actress", "Influencer", "Comedian", "Streamer")
+
+
+def girl_entries(count: int, seed: int = 1) -> Iterator[Dict[str, Any]]:
+    """Yield ``count`` catalog entries shaped like ``data/girls.json`` items."""
+
+    rng = random.Random(seed)
+    for idx in range(count):
+        yield {
+            "name": f"Girl{idx:06d}",
+            "rarity": rng.choice(ALLOWED_RARITIES),
+            "income": round(rng.uniform(1.0, 12.0), 2),
+            "popularity": rng.randint(50, 400),
+            "specialty": rng.choice(SPECIALTIES),
+        }
+
+
+def write_pool(path: Path, count: int, seed: int = 1, with_images: bool = False) -> Path:
+    """Write a synthetic pool JSON file and return its path.
+
+    With ``with_images`` every entry references ``<name>.png`` under a
+    sibling ``girls_images`` folder; half of those files are created so the
+    loader exercises both the hit and the miss path.
+    """
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    entries: List[Dict[str, Any]] = []
+    images_dir = path.parent / "girls_images"
+    if with_images:
+        images_dir.mkdir(exist_ok=True)
+    for idx, entry in enumerate(girl_entries(count, seed)):
+        if with_images:
+            entry["image"] = f"{entry['name']}.png"
+            if idx % 2 == 0:
+                (images_dir / entry["image"]).touch()
+        entries.append(entry)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entries, f)
+    return path
+
+
+def populate_db(
+    path: Path,
+    users: int,
+    roster_size: int,
+    offline_dt: int,
+    seed: int = 1,
+    first_user_id: int = 1,
+) -> List[int]:
+    """Create a fresh database at ``path`` filled with synthetic agencies.
+
+    Each agency gets ``roster_size`` girls and a ``last_tick`` that lies
+    ``offline_dt`` seconds in the past.  Returns the generated user ids.
+    """
+
+    set_db_path(path)
+    init_db()
+    rng = random.Random(seed)
+    last_tick = now_ts() - offline_dt
+    user_ids = list(range(first_user_id, first_user_id + users))
+    con = db()
+    cur = con.cursor()
+    cur.executemany(
+        "INSERT INTO users(user_id, money, last_tick, starter_claimed) VALUES(?,?,?,1)",
+        [(uid, rng.uniform(0, 50_000), last_tick) for uid in user_ids],
+    )
+    rows = []
+    for uid in user_ids:
+        for idx, entry in enumerate(girl_entries(roster_size, seed + uid)):
+            rows.append(
+                (
+                    uid,
+                    entry["name"],
+                    entry["rarity"],
+                    rng.randint(1, 40),
+                    str(rng.randint(0, 5000)),
+                    entry["income"],
+                    entry["popularity"],
+                    rng.uniform(0, 10_000),
+                    round(rng.uniform(0, 100), 3),
+                    idx % 3 != 0,
+                    entry["specialty"],
+                )
+            )
+    cur.executemany(
+        """
+        INSERT INTO user_girls(
+            user_id, name, rarity, level, xp, income, popularity, fans, stamina, is_working, specialty
+        )
+        VALUES(?,?,?,?,?,?,?,?,?,?,?)
+        """,
+        rows,
+    )
+    con.commit()
+    con.close()
+    return user_ids
+
+
+def rewind_clock(user_ids: Sequence[int], offline_dt: int) -> None:
+    """Reset ``last_tick`` so the next settlement sees ``offline_dt`` seconds."""
+
+    rows = [(now_ts() - offline_dt, uid) for uid in user_ids]
+    for con in each_partition():
+        con.executemany("UPDATE users SET last_tick=? WHERE user_id=?", rows)
+        con.commit()
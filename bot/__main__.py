@@ -1,44 +1,85 @@
+import time
+
+# Taken before the heavy imports so the startup report covers them too.
+STARTED = time.perf_counter()
+
+import asyncio
 import os
 from dotenv import load_dotenv
 import discord
 from discord.ext import commands
 
+from bot.instrumentation import current_handler, instrument_commands
+from bot.startup import StartupTimer, load_extensions, sync_command_tree
+from db.database import init_db, set_connection_factory
+from db.instrumented import InstrumentedConnection
+from services.cluster import is_primary, shard_config
+from services.metrics import start_exporters
+from services.settlement import shutdown_settlement_executor
+from services.watchdog import LoopWatchdog
+
 load_dotenv()
 
 TOKEN = os.getenv("DISCORD_TOKEN", "PASTE_YOUR_TOKEN_HERE")
 
+set_connection_factory(InstrumentedConnection)
+
 intents = discord.Intents.default()
-bot = commands.Bot(command_prefix="!", intents=intents)
+shards = shard_config()
+if shards is not None:
+    bot = commands.AutoShardedBot(command_prefix="!", intents=intents, **shards)
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents)
+startup = StartupTimer(STARTED)
 
 INITIAL_COGS = [
     "cogs.core",
     "cogs.gacha",
     "cogs.girls",
     "cogs.admin",
+    "cogs.leaderboard",
+    "cogs.alerts",
 ]
 
 @bot.event
 async def on_ready():
-    try:
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} slash commands")
-    except Exception as e:
-        print("Slash sync error:", e)
+    # Commands are synced once per process at startup (and only when they
+    # changed), not on every gateway reconnect.
     print(f"Logged in as {bot.user}")
+    if not startup.reported:
+        print(startup.report())
 
 async def load_cogs():
-    for ext in INITIAL_COGS:
-        try:
-            await bot.load_extension(ext)
-            print(f"Loaded cog: {ext}")
-        except Exception as e:
-            print(f"Failed to load cog {ext}: {e}")
+    # Every cog reads tables init_db creates, so it runs first.
+    await startup.run("init_db", asyncio.to_thread(init_db))
+    await startup.run("cogs", load_extensions(bot, INITIAL_COGS, startup))
+    instrument_commands(bot.tree)
 
 if __name__ == "__main__":
     async def runner():
-        await load_cogs()
-        await bot.start(TOKEN)
-    import asyncio
+        watchdog = None
+        if os.getenv("LOOP_WATCHDOG", "1") != "0":
+            watchdog = LoopWatchdog(describe=current_handler)
+            watchdog.start()
+        sync = None
+        try:
+            # Database, cogs and the HTTP login do not depend on each other.
+            await asyncio.gather(
+                load_cogs(),
+                startup.run("login", bot.login(TOKEN)),
+                startup.run("exporters", start_exporters()),
+            )
+            # Overlaps the gateway handshake instead of delaying it.  In a
+            # cluster one process syncs for everyone.
+            if is_primary():
+                sync = asyncio.create_task(startup.run("command_sync", sync_command_tree(bot)))
+            await bot.connect()
+        finally:
+            if sync is not None:
+                sync.cancel()
+            if watchdog is not None:
+                watchdog.stop()
+            shutdown_settlement_executor()
     if TOKEN == "PASTE_YOUR_TOKEN_HERE":
         print("⚠️ Put your bot token into DISCORD_TOKEN env var or edit token in code.")
     asyncio.run(runner())
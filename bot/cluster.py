@@ -0,0 +1,140 @@
+"""Multi-process launcher: ``python -m bot.cluster``.
+
+Starts ``--processes`` copies of ``python -m bot``, hands each one a
+contiguous range of ``--shards`` gateway shards and its place in the cluster
+(see :mod:`services.cluster`), and restarts any that crash.  Ctrl+C or
+SIGTERM stops them all.
+
+Each process gets its own metrics endpoint: ``METRICS_PORT`` is offset by the
+process index and ``METRICS_FILE`` gets an ``.<index>`` suffix.
+
+Example::
+
+    python -m bot.cluster --processes 4 --shards 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+RESTART_BACKOFF_MAX = 60.0
+
+
+def shard_ranges(shards: int, processes: int) -> List[Tuple[int, int]]:
+    """Split ``shards`` into ``processes`` contiguous, near-equal ranges."""
+
+    if processes > shards:
+        raise ValueError("need at least one shard per process")
+    base, extra = divmod(shards, processes)
+    ranges = []
+    start = 0
+    for index in range(processes):
+        size = base + (1 if index < extra else 0)
+        ranges.append((start, start + size - 1))
+        start += size
+    return ranges
+
+
+def worker_env(index: int, processes: int, shards: int, first: int, last: int) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(
+        SHARD_COUNT=str(shards),
+        SHARD_IDS=f"{first}-{last}",
+        CLUSTER_INDEX=str(index),
+        CLUSTER_SIZE=str(processes),
+    )
+    if env.get("METRICS_PORT"):
+        env["METRICS_PORT"] = str(int(env["METRICS_PORT"]) + index)
+    if env.get("METRICS_FILE"):
+        env["METRICS_FILE"] = f"{env['METRICS_FILE']}.{index}"
+    return env
+
+
+class Supervisor:
+    def __init__(self, processes: int, shards: int, stagger: float) -> None:
+        self.processes = processes
+        self.shards = shards
+        self.stagger = stagger
+        self.ranges = shard_ranges(shards, processes)
+        self.children: Dict[int, subprocess.Popen] = {}
+        self.failures: Dict[int, int] = {}
+        self.restart_at: Dict[int, float] = {}
+        self.stopping = False
+
+    def spawn(self, index: int) -> None:
+        first, last = self.ranges[index]
+        env = worker_env(index, self.processes, self.shards, first, last)
+        self.children[index] = subprocess.Popen([sys.executable, "-m", "bot"], env=env)
+        print(f"[cluster] process {index} (pid {self.children[index].pid}) shards {first}-{last} of {self.shards}")
+
+    def stop(self, *_args: object) -> None:
+        self.stopping = True
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.processes):
+            if self.stopping:
+                break
+            self.spawn(index)
+            # Discord rate-limits IDENTIFY; space out the gateway logins.
+            if index + 1 < self.processes:
+                time.sleep(self.stagger)
+        while not self.stopping:
+            now = time.monotonic()
+            for index, child in list(self.children.items()):
+                code = child.poll()
+                if code is None:
+                    continue
+                del self.children[index]
+                self.failures[index] = self.failures.get(index, 0) + 1
+                delay = min(RESTART_BACKOFF_MAX, 2.0 ** self.failures[index])
+                print(f"[cluster] process {index} exited with {code}; restarting in {delay:.0f}s")
+                self.restart_at[index] = now + delay
+            for index, when in list(self.restart_at.items()):
+                if now >= when:
+                    del self.restart_at[index]
+                    self.spawn(index)
+            time.sleep(0.5)
+        return self.shutdown()
+
+    def shutdown(self, timeout: float = 30.0) -> int:
+        for child in self.children.values():
+            child.terminate()
+        deadline = time.monotonic() + timeout
+        for index, child in self.children.items():
+            try:
+                child.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                print(f"[cluster] process {index} did not stop; killing it")
+                child.kill()
+        return 0
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m bot.cluster", description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="bot processes to run")
+    parser.add_argument("--shards", type=int, help="total gateway shards (default: one per process)")
+    parser.add_argument("--stagger", type=float, default=5.0, help="seconds between process starts")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    shards = args.shards or args.processes
+    try:
+        supervisor = Supervisor(args.processes, shards, args.stagger)
+    except ValueError as e:
+        print(f"[cluster] {e}")
+        return 2
+    return supervisor.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
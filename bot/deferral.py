@@ -0,0 +1,195 @@
+"""Defer-first replies that keep commands inside Discord's 3 second ack window.
+
+Discord drops an interaction that is not acknowledged within 3 seconds of
+its creation.  The clock includes time spent before the handler even runs,
+such as gateway delivery and a backed-up event loop.  :class:`Reply` adds
+the interaction's age to a running p90 of the command's recent
+time-to-answer, or the time its oldest unanswered call has already taken
+if that is longer.  If the sum crosses ``ACK_BUDGET``, it defers at once and
+the answer follows up.  A command with no history yet defers whenever
+other replies are in flight.  Quick commands on a quiet bot still answer in
+one round trip.  A timer defers anything still unanswered ``ACK_FORCE_AFTER``
+seconds after creation, so an unexpectedly slow handler is caught too.
+A handler that raises before answering gets an ephemeral error message.
+
+Usage::
+
+    async with Reply(interaction, "agency", ephemeral=True) as reply:
+        embed = await asyncio.to_thread(build_embed, ...)
+        await reply.send(embed=embed)
+
+Configuration (environment):
+
+- ``ACK_BUDGET`` — predicted seconds to answer above which a command
+  defers first (default 0.25).
+- ``ACK_FORCE_AFTER`` — interaction age in seconds at which an unanswered
+  command is deferred regardless (default 2.5).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import discord
+
+from services.metrics import LATENCY_BUCKETS, counter, histogram
+
+ACK_DEADLINE = 3.0
+HISTORY = 50
+ERROR_MESSAGE = "Something went wrong while running this command. Please try again."
+
+ACK_SECONDS = histogram(
+    "idol_ack_seconds",
+    "Time from interaction creation to its first acknowledgement",
+    ("command", "mode"),
+    buckets=LATENCY_BUCKETS,
+)
+ACK_DEFERRED = counter("idol_ack_deferred_total", "Commands that deferred before answering", ("command", "reason"))
+ACK_MISSES = counter(
+    "idol_ack_deadline_misses_total", "Interactions acknowledged after Discord's 3s deadline", ("command",)
+)
+
+# Recent seconds from handler start to answer, per command.
+_history: Dict[str, Deque[float]] = {}
+# Start times of unanswered replies, per command.
+_running: Dict[str, Dict[int, float]] = {}
+
+
+def ack_budget() -> float:
+    return float(os.getenv("ACK_BUDGET", "0.25"))
+
+
+def force_after() -> float:
+    return float(os.getenv("ACK_FORCE_AFTER", "2.5"))
+
+
+def expected_seconds(command: str) -> Optional[float]:
+    """Predicted seconds from handler start to answer (``None`` until the
+    command has run or while nothing is known about it).
+
+    The p90 of recent answers, raised to the latest answer or to the age
+    of the oldest unanswered call so that a sudden slowdown counts at once.
+    """
+
+    candidates = []
+    recent = _history.get(command)
+    if recent:
+        ordered = sorted(recent)
+        candidates += [ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))], recent[-1]]
+    running = _running.get(command)
+    if running:
+        candidates.append(time.perf_counter() - min(running.values()))
+    return max(candidates) if candidates else None
+
+
+def interaction_age(interaction: discord.Interaction) -> float:
+    """Seconds since Discord created the interaction (never negative)."""
+
+    return max(0.0, (discord.utils.utcnow() - interaction.created_at).total_seconds())
+
+
+class Reply:
+    """Acknowledges ``interaction`` in time and sends the answer either as
+    the initial response or, after a defer, as a followup."""
+
+    def __init__(self, interaction: discord.Interaction, command: str, ephemeral: bool = False) -> None:
+        self.interaction = interaction
+        self.command = command
+        self.ephemeral = ephemeral
+        self.deferred_by: Optional[str] = None
+        self._started = time.perf_counter()
+        self._answered = False
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_task: Optional["asyncio.Task[None]"] = None
+
+    async def __aenter__(self) -> "Reply":
+        self._started = time.perf_counter()
+        age = interaction_age(self.interaction)
+        expected = expected_seconds(self.command)
+        busy = any(_running.values())
+        _running.setdefault(self.command, {})[id(self)] = self._started
+        try:
+            if expected is None and busy:
+                await self.defer("unknown")
+            elif age + (expected or 0.0) > ack_budget():
+                await self.defer("predicted")
+            else:
+                delay = max(0.0, force_after() - age)
+                self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+        except BaseException:
+            _running[self.command].pop(id(self), None)
+            raise
+        return self
+
+    def _on_timer(self) -> None:
+        self._timer_task = asyncio.ensure_future(self.defer("timer"))
+
+    async def __aexit__(self, _exc_type: Any, exc: Optional[BaseException], _tb: Any) -> None:
+        _running[self.command].pop(id(self), None)
+        if self._timer is not None:
+            self._timer.cancel()
+        if isinstance(exc, Exception):
+            await self._fail()
+
+    async def _fail(self) -> None:
+        """Tell the user the command failed; after a defer they would
+        otherwise watch "thinking…" forever.  The exception still
+        propagates to the command's error handling."""
+
+        async with self._lock:
+            if self._answered:
+                return
+            self._answered = True
+            try:
+                if self.interaction.response.is_done():
+                    await self.interaction.followup.send(ERROR_MESSAGE, ephemeral=True)
+                else:
+                    self._acked("direct")
+                    await self.interaction.response.send_message(ERROR_MESSAGE, ephemeral=True)
+            except discord.HTTPException as e:
+                print(f"Could not report the failure of /{self.command}:", e)
+
+    def _acked(self, mode: str) -> None:
+        age = interaction_age(self.interaction)
+        ACK_SECONDS.labels(self.command, mode).observe(age)
+        if age > ACK_DEADLINE:
+            ACK_MISSES.labels(self.command).inc()
+
+    async def defer(self, reason: str = "manual") -> None:
+        """Acknowledge now; the answer will be a followup."""
+
+        async with self._lock:
+            if self.interaction.response.is_done():
+                return
+            self.deferred_by = reason
+            ACK_DEFERRED.labels(self.command, reason).inc()
+            self._acked("deferred")
+            await self.interaction.response.defer(ephemeral=self.ephemeral, thinking=True)
+
+    async def send(self, content: Optional[str] = None, *, ephemeral: Optional[bool] = None, **kwargs: Any) -> None:
+        """Answer with ``content``/``kwargs`` (``embed``, ``view``, ``files`` …).
+
+        ``ephemeral`` overrides the reply's visibility for a direct answer;
+        after a defer the deferred message keeps the visibility it had.
+        """
+
+        if ephemeral is None:
+            ephemeral = self.ephemeral
+        if self._timer is not None:
+            self._timer.cancel()
+        async with self._lock:
+            if not self._answered:
+                self._answered = True
+                _running[self.command].pop(id(self), None)
+                recent = _history.setdefault(self.command, deque(maxlen=HISTORY))
+                recent.append(time.perf_counter() - self._started)
+            if self.interaction.response.is_done():
+                await self.interaction.followup.send(content, ephemeral=ephemeral, **kwargs)
+                return
+            self._acked("direct")
+            await self.interaction.response.send_message(content, ephemeral=ephemeral, **kwargs)
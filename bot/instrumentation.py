@@ -0,0 +1,116 @@
+"""Latency instrumentation for app commands and view callbacks.
+
+:func:`instrument_commands` wraps the callback of every slash command in the
+bot's tree, and views that subclass :class:`InstrumentedView` time each of
+their item callbacks.  Both feed the ``idol_handler_seconds`` histogram in
+:mod:`services.metrics`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import discord
+from discord import app_commands
+
+from services.metrics import counter, histogram
+
+HANDLER_SECONDS = histogram("idol_handler_seconds", "App command and view callback latency", ("kind", "name"))
+HANDLER_ERRORS = counter("idol_handler_errors_total", "App command and view callbacks that raised", ("kind", "name"))
+
+_WRAPPED_ATTR = "__idol_instrumented__"
+
+
+# Handler currently executing in each task, so the loop watchdog can name
+# the command behind a stall.
+_active: Dict["asyncio.Task[Any]", str] = {}
+
+
+def current_handler(task: Optional["asyncio.Task[Any]"]) -> Optional[str]:
+    if task is None:
+        return None
+    return _active.get(task)
+
+
+@asynccontextmanager
+async def track(kind: str, name: str) -> AsyncIterator[None]:
+    started = time.perf_counter()
+    task = asyncio.current_task()
+    previous = _active.get(task) if task is not None else None
+    if task is not None:
+        _active[task] = f"{kind} {name}"
+    try:
+        yield
+    except Exception:
+        HANDLER_ERRORS.labels(kind, name).inc()
+        raise
+    finally:
+        HANDLER_SECONDS.labels(kind, name).observe(time.perf_counter() - started)
+        if task is not None:
+            if previous is None:
+                _active.pop(task, None)
+            else:
+                _active[task] = previous
+
+
+def _timed_command(original: Any, name: str) -> Any:
+    @functools.wraps(original)
+    async def timed(*args: Any, **kwargs: Any) -> Any:
+        async with track("command", name):
+            return await original(*args, **kwargs)
+
+    setattr(timed, _WRAPPED_ATTR, True)
+    return timed
+
+
+def instrument_commands(tree: app_commands.CommandTree) -> int:
+    """Wrap every slash command callback in ``tree``; returns how many were new.
+
+    Safe to call repeatedly (e.g. after an extension reload) — already
+    wrapped callbacks are left alone.
+    """
+
+    wrapped = 0
+    for command in tree.walk_commands():
+        if not isinstance(command, app_commands.Command):
+            continue
+        if getattr(command._callback, _WRAPPED_ATTR, False):
+            continue
+        # discord.py invokes ``_callback`` directly; parameters were already
+        # parsed from the original signature when the command was created.
+        command._callback = _timed_command(command._callback, command.qualified_name)
+        wrapped += 1
+    return wrapped
+
+
+class InstrumentedView(discord.ui.View):
+    """``discord.ui.View`` whose item callbacks report their latency."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        for item in self.children:
+            self._instrument_item(item)
+
+    def add_item(self, item: discord.ui.Item[Any]) -> Any:
+        self._instrument_item(item)
+        return super().add_item(item)
+
+    def _instrument_item(self, item: discord.ui.Item[Any]) -> None:
+        original = item.callback
+        if getattr(original, _WRAPPED_ATTR, False):
+            return
+        func_name = getattr(getattr(original, "callback", original), "__name__", "callback")
+        if func_name == "callback":
+            func_name = type(item).__name__
+        name = f"{type(self).__name__}.{func_name}"
+
+        async def timed(interaction: discord.Interaction) -> Any:
+            async with track("view", name):
+                return await original(interaction)
+
+        setattr(timed, _WRAPPED_ATTR, True)
+        item.callback = timed  # type: ignore[method-assign]
@@ -0,0 +1,104 @@
+"""Startup orchestration: phase timing and change-only command sync.
+
+:class:`StartupTimer` records how long each startup phase took (database
+init, login, every cog, command sync) so time-to-ready can be read from the
+log and from ``idol_startup_phase_seconds``.  :func:`sync_command_tree`
+hashes the command tree and only calls the rate-limited global
+``tree.sync()`` when the hash differs from the one stored after the last
+successful sync.
+
+Configuration (environment):
+
+- ``COMMAND_SYNC`` — ``auto`` (default) syncs when the tree changed,
+  ``always`` syncs on every start, ``never`` leaves registration to you.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Awaitable, Dict, Optional, TypeVar
+
+from discord import app_commands
+from discord.ext import commands
+
+from db.database import get_meta, set_meta
+from services.metrics import gauge
+
+STARTUP_PHASE_SECONDS = gauge("idol_startup_phase_seconds", "Wall time of each startup phase", ("phase",))
+
+T = TypeVar("T")
+
+
+class StartupTimer:
+    def __init__(self, started: Optional[float] = None) -> None:
+        self.started = started if started is not None else time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.reported = False
+
+    def mark(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = seconds
+        STARTUP_PHASE_SECONDS.labels(phase).set(seconds)
+
+    async def run(self, phase: str, awaitable: Awaitable[T]) -> T:
+        """Await ``awaitable`` and record its wall time as ``phase``."""
+
+        began = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.mark(phase, time.perf_counter() - began)
+
+    def report(self) -> str:
+        """Record ``ready`` (time since start) and render the breakdown."""
+
+        self.mark("ready", time.perf_counter() - self.started)
+        self.reported = True
+        width = max(len(phase) for phase in self.phases)
+        lines = [f"Startup timings ({self.phases['ready']:.2f}s to ready):"]
+        lines += [f"  {phase:<{width}}  {seconds * 1000:8.1f}ms" for phase, seconds in self.phases.items() if phase != "ready"]
+        return "\n".join(lines)
+
+
+def command_tree_hash(tree: app_commands.CommandTree) -> str:
+    """Stable hash of the global command payload ``tree.sync()`` would upload."""
+
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda c: c["name"])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def sync_command_tree(bot: commands.Bot) -> Optional[int]:
+    """Sync global commands if they changed; returns the synced count or ``None``."""
+
+    mode = os.getenv("COMMAND_SYNC", "auto").strip().lower()
+    if mode == "never":
+        return None
+    key = f"command_tree:{bot.application_id}"
+    digest = command_tree_hash(bot.tree)
+    try:
+        if mode != "always" and await asyncio.to_thread(get_meta, key) == digest:
+            print("Slash commands unchanged, skipping sync")
+            return None
+        synced = await bot.tree.sync()
+        await asyncio.to_thread(set_meta, key, digest)
+    except Exception as e:
+        print("Slash sync error:", e)
+        return None
+    print(f"Synced {len(synced)} slash commands")
+    return len(synced)
+
+
+async def load_extensions(bot: commands.Bot, names: Any, timer: StartupTimer) -> None:
+    """Load cogs concurrently; their ``cog_load`` hooks overlap their I/O."""
+
+    async def load(name: str) -> None:
+        try:
+            await timer.run(f"cog {name}", bot.load_extension(name))
+            print(f"Loaded cog: {name}")
+        except Exception as e:
+            print(f"Failed to load cog {name}: {e}")
+
+    await asyncio.gather(*(load(name) for name in names))
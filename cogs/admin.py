@@ -1,7 +1,43 @@
+import asyncio
+from typing import List, Literal
+
 import discord
 from discord import app_commands
 from discord.ext import commands
 
+from services.backup import SNAPSHOT, backup_database, export_jsonl
+from services.metrics import REGISTRY, Metric
+from services.render import cache_stats
+from services.profiling import CPU, MAX_WINDOW_SECONDS, ProfileReport, get_profiler
+from services.gacha import propagate_fields
+from services.settlement import get_settlement_executor
+
+
+def _histogram_lines(metric: Metric, limit: int = 15) -> List[str]:
+    rows = sorted(metric.children.items(), key=lambda item: item[1].count, reverse=True)[:limit]
+    lines = []
+    for labels, child in rows:
+        lines.append(
+            f"{' '.join(labels):<28} n={child.count:<7} p50={child.quantile(0.5) * 1000:7.1f}ms "
+            f"p99={child.quantile(0.99) * 1000:7.1f}ms"
+        )
+    return lines
+
+
+def _block(lines: List[str]) -> str:
+    """Render ``lines`` as a code block that fits in an embed field."""
+    body = "\n".join(lines) or "no data"
+    if len(body) > 1000:
+        body = body[:1000].rsplit("\n", 1)[0] + "\n…"
+    return f"```\n{body}\n```"
+
+
+def _value(name: str) -> float:
+    metric = REGISTRY.get(name)
+    if metric is None:
+        return 0.0
+    return sum(child.value for _, child in metric.samples())
+
 class Admin(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -12,6 +48,12 @@ class Admin(commands.Cog):
         is_admin = any(r.permissions.administrator for r in getattr(inter.user, "roles", [])) if isinstance(inter.user, discord.Member) else False
         return is_owner or is_admin
 
+    async def owner_only(self, inter: discord.Interaction) -> bool:
+        if await inter.client.is_owner(inter.user):
+            return True
+        await inter.response.send_message("Owner only.", ephemeral=True)
+        return False
+
     @app_commands.command(name="reload_pool", description="Reload girls JSON (owner/admin only)")
     async def reload_pool(self, interaction: discord.Interaction):
         if not self.owner_or_admin(interaction):
@@ -21,11 +63,136 @@ class Admin(commands.Cog):
         if not gacha_cog:
             await interaction.response.send_message("Gacha cog is not loaded.", ephemeral=True)
             return
-        count, warn = gacha_cog.reload_pool_data()
-        msg = f"Pool reloaded: {count} entries."
-        if warn:
-            msg += f"\n⚠️ {warn}"
-        await interaction.response.send_message(msg, ephemeral=True)
+        await interaction.response.defer(ephemeral=True)
+        reload = await gacha_cog.reload_pool_async()
+        await interaction.followup.send(self._reload_message(reload), ephemeral=True)
+
+    @staticmethod
+    def _reload_message(reload) -> str:
+        diff = reload.diff
+        msg = f"Pool reloaded: {len(reload.pool.entries)} entries."
+        if not diff:
+            msg += " No changes."
+        else:
+            msg += f" +{len(diff.added)} added, -{len(diff.removed)} removed, ~{len(diff.changed)} changed."
+            for label, names in (("Added", diff.added), ("Removed", diff.removed), ("Changed", list(diff.changed))):
+                if names:
+                    shown = ", ".join(names[:10]) + (f" … (+{len(names) - 10})" if len(names) > 10 else "")
+                    msg += f"\n{label}: {shown}"
+            counts = diff.field_counts()
+            if counts:
+                msg += "\nFields: " + ", ".join(f"{name}×{count}" for name, count in sorted(counts.items()))
+            if reload.propagated:
+                msg += f"\nUpdated {reload.propagated} owned girls ({', '.join(propagate_fields())})."
+        if reload.pool.warnings:
+            msg += f"\n⚠️ {reload.pool.warnings}"
+        return msg[:2000]
+
+    @staticmethod
+    def _profile_message(report: ProfileReport) -> str:
+        header = (
+            "own time  cum time   calls  location" if report.kind == CPU else "growth      size      count  location"
+        )
+        files = ", ".join(f"`{path}`" for path in report.files)
+        return (
+            f"{report.kind.upper()} profile finished after {report.seconds:.1f}s → {files}\n"
+            + _block([header, *report.top])
+        )
+
+    @app_commands.command(name="profile_start", description="Start a bounded CPU or memory profile (owner only)")
+    @app_commands.describe(seconds="Window length before the profile stops by itself", top="Entries in the summary")
+    async def profile_start(
+        self,
+        interaction: discord.Interaction,
+        kind: Literal["cpu", "memory"],
+        seconds: app_commands.Range[int, 1, MAX_WINDOW_SECONDS] = 30,
+        top: app_commands.Range[int, 1, 30] = 10,
+    ):
+        if not await self.owner_only(interaction):
+            return
+
+        async def deliver(report: ProfileReport) -> None:
+            await interaction.followup.send(self._profile_message(report), ephemeral=True)
+
+        try:
+            window = get_profiler().start(kind, seconds, top=top, on_finish=deliver)
+        except RuntimeError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
+            return
+        await interaction.response.send_message(
+            f"{kind.upper()} profile running for {window:.0f}s. Use /profile_stop to finish early.",
+            ephemeral=True,
+        )
+
+    @app_commands.command(name="profile_stop", description="Stop a running profile and show the summary (owner only)")
+    async def profile_stop(self, interaction: discord.Interaction, kind: Literal["cpu", "memory"]):
+        if not await self.owner_only(interaction):
+            return
+        await interaction.response.defer(ephemeral=True)
+        report = await get_profiler().stop(kind)
+        if report is None:
+            await interaction.followup.send(f"No {kind} profile is running.", ephemeral=True)
+            return
+        await interaction.followup.send(self._profile_message(report), ephemeral=True)
+
+    @app_commands.command(name="backup", description="Online snapshot or JSONL export of the database (owner only)")
+    async def backup(self, interaction: discord.Interaction, kind: Literal["snapshot", "export"] = "snapshot"):
+        if not await self.owner_only(interaction):
+            return
+        await interaction.response.defer(ephemeral=True)
+        try:
+            report = await asyncio.to_thread(backup_database if kind == SNAPSHOT else export_jsonl)
+        except RuntimeError as e:
+            await interaction.followup.send(str(e), ephemeral=True)
+            return
+        await interaction.followup.send(report.summary(), ephemeral=True)
+
+    @app_commands.command(name="stats", description="Runtime metrics (owner only)")
+    async def stats(self, interaction: discord.Interaction):
+        if not await self.owner_only(interaction):
+            return
+        emb = discord.Embed(title="Runtime stats", color=0x7AC8FF)
+        handlers = REGISTRY.get("idol_handler_seconds")
+        handler_lines = _histogram_lines(handlers) if handlers else []
+        emb.add_field(
+            name="Handlers",
+            value=_block(handler_lines),
+            inline=False,
+        )
+        sql = REGISTRY.get("idol_sql_seconds")
+        sql_lines = [
+            f"{labels[0]:<8} n={child.count:<8} total={child.sum:8.3f}s avg={child.sum / child.count * 1000:6.2f}ms"
+            for labels, child in sorted(sql.children.items()) if child.count
+        ] if sql else []
+        emb.add_field(name="SQL", value=_block(sql_lines), inline=False)
+        dt = REGISTRY.get("idol_tick_dt_seconds")
+        dt_child = dt.labels() if dt else None
+        tick_lines = [
+            f"ticks={dt_child.count if dt_child else 0} dt p50={dt_child.quantile(0.5) if dt_child else 0:.0f}s "
+            f"p99={dt_child.quantile(0.99) if dt_child else 0:.0f}s",
+            f"girls={_value('idol_tick_girls_total'):.0f} level-ups={_value('idol_tick_level_ups_total'):.0f} "
+            f"rows={_value('idol_tick_rows_written_total'):.0f} conflicts={_value('idol_tick_conflicts_total'):.0f}",
+        ]
+        settle = get_settlement_executor().stats()
+        tick_lines.append(
+            f"settlement inline={settle['inline']} offloaded={settle['offloaded']} "
+            f"pending={settle['pending']} wait max={settle['queue_wait_max'] * 1000:.1f}ms"
+        )
+        emb.add_field(name="Ticks", value=_block(tick_lines), inline=False)
+        lag = REGISTRY.get("idol_loop_lag_seconds")
+        lag_child = lag.labels() if lag else None
+        loop_lines = [
+            f"lag p50={lag_child.quantile(0.5) * 1000 if lag_child else 0:.1f}ms "
+            f"p99={lag_child.quantile(0.99) * 1000 if lag_child else 0:.1f}ms "
+            f"stalls={_value('idol_loop_stalls_total'):.0f}"
+        ]
+        emb.add_field(name="Event loop", value=_block(loop_lines), inline=False)
+        render_lines = [
+            f"{name:<10} hit={hits / (hits + misses) if hits + misses else 0:4.0%} n={hits + misses:<7} entries={entries}"
+            for name, (hits, misses, entries) in cache_stats().items()
+        ]
+        emb.add_field(name="Render cache", value=_block(render_lines), inline=False)
+        await interaction.response.send_message(embed=emb, ephemeral=True)
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Admin(bot))
@@ -0,0 +1,126 @@
+import asyncio
+import os
+from typing import List, Optional
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from services.cluster import clustered
+from services.roster import ROTATE_REST_BELOW, ROTATE_WORK_ABOVE
+from services.scheduler import StaminaPrefs, get_stamina_scheduler, load_prefs
+from storage import get_storage
+
+
+class Alerts(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.scheduler = get_stamina_scheduler()
+        self.scheduler.on_notify = self.send_rested_dm
+        self.scheduler.on_rotate = self.auto_rotate
+        self.resync_task: Optional[asyncio.Task[None]] = None
+
+    async def cog_load(self) -> None:
+        count = await self.resync()
+        self.scheduler.start()
+        print(f"Stamina scheduler: {count} events for {len(self.scheduler.prefs)} players")
+        if clustered():
+            # Other processes change rosters without telling this one.
+            self.resync_task = asyncio.create_task(self._resync_loop())
+
+    async def cog_unload(self) -> None:
+        self.scheduler.stop()
+        if self.resync_task is not None:
+            self.resync_task.cancel()
+
+    async def resync(self) -> int:
+        state = await asyncio.to_thread(self.scheduler.load_state)
+        return self.scheduler.install(*state)
+
+    async def _resync_loop(self) -> None:
+        interval = float(os.getenv("CLUSTER_RESYNC_SECONDS", "300"))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.resync()
+            except Exception as e:
+                print("Stamina scheduler resync failed:", e)
+
+    async def send_rested_dm(self, user_id: int, names: List[str]) -> bool:
+        shown = ", ".join(f"**{name}**" for name in names[:15])
+        if len(names) > 15:
+            shown += f" and {len(names) - 15} more"
+        try:
+            user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+            await user.send(f"🛌 Fully rested: {shown}. Turn these alerts off with /notify.")
+        except discord.Forbidden:
+            print(f"Stamina alerts disabled for {user_id}: DMs are closed")
+            return False
+        except discord.HTTPException as e:
+            print(f"Stamina alert to {user_id} failed: {e}")
+        return True
+
+    async def auto_rotate(self, user_id: int, prefs: StaminaPrefs) -> None:
+        # Imported here: cogs.girls owns the settle-then-update helper.
+        from cogs.girls import run_bulk_action
+
+        await run_bulk_action(user_id, "rotate", None, prefs.rest_below, prefs.work_above)
+
+    def _prefs(self, user_id: int) -> StaminaPrefs:
+        current = self.scheduler.prefs.get(user_id) or load_prefs(user_id).get(user_id)
+        return StaminaPrefs(**vars(current)) if current else StaminaPrefs()
+
+    @app_commands.command(name="notify", description="DM me when my girls are fully rested")
+    @app_commands.describe(rested="Turn rested alerts on or off")
+    async def notify(self, interaction: discord.Interaction, rested: bool):
+        await asyncio.to_thread(get_storage().ensure_agency, interaction.user.id)
+        prefs = await asyncio.to_thread(self._prefs, interaction.user.id)
+        prefs.notify = rested
+        await self.scheduler.set_prefs(interaction.user.id, prefs)
+        if rested:
+            message = (
+                "🔔 I'll DM you when girls are fully rested "
+                f"(at most once every {self.scheduler.cooldown / 60:g} min)."
+            )
+        else:
+            message = "🔕 Rested alerts are off."
+        await interaction.response.send_message(message, ephemeral=True)
+
+    @app_commands.command(name="autorotate", description="Automatically rest tired girls and restart rested ones")
+    @app_commands.describe(
+        enabled="Turn auto-rotation on or off",
+        rest_below=f"Rest working girls under this stamina % (default {ROTATE_REST_BELOW:g})",
+        work_above=f"Start resting girls at or above this stamina % (default {ROTATE_WORK_ABOVE:g})",
+    )
+    async def autorotate(
+        self,
+        interaction: discord.Interaction,
+        enabled: bool,
+        rest_below: Optional[app_commands.Range[float, 0, 100]] = None,
+        work_above: Optional[app_commands.Range[float, 0, 100]] = None,
+    ):
+        await asyncio.to_thread(get_storage().ensure_agency, interaction.user.id)
+        prefs = await asyncio.to_thread(self._prefs, interaction.user.id)
+        if rest_below is not None:
+            prefs.rest_below = rest_below
+        if work_above is not None:
+            prefs.work_above = work_above
+        if prefs.rest_below >= prefs.work_above:
+            await interaction.response.send_message(
+                "`rest_below` must be lower than `work_above`.", ephemeral=True
+            )
+            return
+        prefs.auto_rotate = enabled
+        await self.scheduler.set_prefs(interaction.user.id, prefs)
+        if enabled:
+            message = (
+                f"🔄 Auto-rotation on: girls rest below {prefs.rest_below:g}% stamina "
+                f"and go back to work at {prefs.work_above:g}%."
+            )
+        else:
+            message = "Auto-rotation is off."
+        await interaction.response.send_message(message, ephemeral=True)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Alerts(bot))
@@ -1,115 +1,67 @@
+import asyncio
+import time
+from typing import Literal, Optional
+
 import discord
 from discord import app_commands
 from discord.ext import commands
-from db.database import init_db, ensure_user, db
-from services.formatting import format_currency, format_plain, format_rate
-from services.balance import format_xp, level_xp_required, xp_to_decimal
-from services.gacha import rarity_emoji
-from services.game import compute_tick
-
-
-def girl_line(row) -> str:
-    stamina = format_plain(row["stamina"])
-    status = "⚡" if row["is_working"] else "🛌"
-    level = int(row["level"])
-    requirement = level_xp_required(level)
-    if isinstance(row, dict):
-        xp_value = row.get("xp", 0)
-    else:
-        keys = row.keys()
-        xp_value = row["xp"] if "xp" in keys else 0
-    xp = xp_to_decimal(xp_value)
-    if requirement is None:
-        xp_text = "MAX"
-    else:
-        xp_text = f"{format_xp(xp)}/{format_xp(requirement)} XP"
-    return (
-        f"— **{row['name']}** {rarity_emoji(row['rarity'])} | "
-        f"⬆️Lv.{int(row['level'])} | "
-        f"💰{format_rate(row['income'])} | 🌟{format_plain(row['popularity'])} | "
-        f"❤️{format_plain(row['fans'])} | 📈{xp_text} | 🏷️ {row['specialty'] or '-'} | {status}{stamina}%"
-    )
+from bot.deferral import Reply
+from db.database import init_db_once
+from services.archive import get_archiver, idle_days
+from services.cluster import is_primary
+from services.formatting import format_currency, format_duration, format_plain, sparkline
+from services.balance import GACHA_COST, STARTER_GIRL, STARTER_MONEY
+from services.game import compute_tick_async, forecast, time_until_pulls
+from services.history import downsample
+from services.render import girl_line
+from storage import SQLiteStorage, get_storage
+
+HISTORY_WIDTH = 48  # sparkline characters
 
 class Core(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        init_db()
+
+    async def cog_load(self) -> None:
+        # A no-op when the launcher already initialised the database.
+        await asyncio.to_thread(init_db_once)
+        # One process archives for the whole deployment.
+        if is_primary() and idle_days() > 0 and get_storage().name == SQLiteStorage.name:
+            get_archiver().start()
+
+    async def cog_unload(self) -> None:
+        get_archiver().stop()
 
     @app_commands.command(name="start", description="Create your agency and get a starter girl")
     async def start(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
-        ensure_user(interaction.user.id)
-        compute_tick(interaction.user.id)
-        con = db()
-        cur = con.cursor()
-        cur.execute(
-            "SELECT starter_claimed FROM users WHERE user_id=?",
-            (interaction.user.id,),
-        )
-        claimed_row = cur.fetchone()
-        already_claimed = bool(claimed_row and claimed_row["starter_claimed"])
-
-        cur.execute("SELECT 1 FROM user_girls WHERE user_id=?", (interaction.user.id,))
-        have_any = cur.fetchone() is not None
-
-        if already_claimed or have_any:
-            if not already_claimed and have_any:
-                cur.execute(
-                    "UPDATE users SET starter_claimed=1 WHERE user_id=?",
-                    (interaction.user.id,),
-                )
-                con.commit()
-            con.close()
+        store = get_storage()
+        await asyncio.to_thread(store.ensure_agency, interaction.user.id)
+        await compute_tick_async(interaction.user.id)
+        if not await asyncio.to_thread(store.claim_starter, interaction.user.id, STARTER_MONEY, STARTER_GIRL):
             await interaction.followup.send(
                 "You have already started your agency. Use /agency to review your roster.",
                 ephemeral=True,
             )
             return
-
-        cur.execute(
-            "UPDATE users SET money = money + 1000, starter_claimed = 1 WHERE user_id=?",
-            (interaction.user.id,),
-        )
-        # default starter
-        cur.execute(
-            """
-            INSERT OR IGNORE INTO user_girls(
-                user_id,
-                name,
-                rarity,
-                level,
-                xp,
-                income,
-                popularity,
-                fans,
-                stamina,
-                is_working,
-                image_url,
-                specialty
-            )
-            VALUES(?,?,?,?,?,?,?,0,100,1,?,?)
-            """,
-            (interaction.user.id, "Aya", "N", 1, "0", 5, 100, None, "Singer"),
-        )
-
-        con.commit()
-        con.close()
         await interaction.followup.send(
-            "Agency created! You received 1000 💵 and a starter girl. Use /gacha and /agency.",
+            f"Agency created! You received {STARTER_MONEY} 💵 and a starter girl. Use /gacha and /agency.",
             ephemeral=True,
         )
 
     @app_commands.command(name="agency", description="Show your agency overview")
     async def agency(self, interaction: discord.Interaction):
-        ensure_user(interaction.user.id)
-        tick = compute_tick(interaction.user.id)
-        con = db()
-        cur = con.cursor()
-        cur.execute("SELECT money FROM users WHERE user_id=?", (interaction.user.id,))
-        money = cur.fetchone()["money"]
-        cur.execute("SELECT * FROM user_girls WHERE user_id=? ORDER BY rarity DESC, income DESC", (interaction.user.id,))
-        girls = cur.fetchall()
-        con.close()
+        async with Reply(interaction, "agency", ephemeral=True) as reply:
+            user_id = interaction.user.id
+            await asyncio.to_thread(get_storage().ensure_agency, user_id)
+            tick = await compute_tick_async(user_id)
+            await reply.send(embed=await asyncio.to_thread(self.agency_embed, user_id, tick))
+
+    @staticmethod
+    def agency_embed(user_id: int, tick: dict) -> discord.Embed:
+        store = get_storage()
+        money = store.balance(user_id)
+        girls = store.roster(user_id)
 
         total_fans = sum(float(g["fans"]) for g in girls)
         emb = discord.Embed(title="Your Agency", color=0xFFE17A)
@@ -131,7 +83,105 @@ class Core(commands.Cog):
             desc = "No girls yet. Try /gacha"
 
         emb.description = desc
-        await interaction.response.send_message(embed=emb, ephemeral=True)
+        return emb
+
+    @app_commands.command(name="forecast", description="Project your agency a few hours ahead")
+    @app_commands.describe(
+        hours="How far ahead to look",
+        pulls="Also estimate when you can afford this many scouts",
+    )
+    async def forecast(
+        self,
+        interaction: discord.Interaction,
+        hours: app_commands.Range[float, 0, 8760] = 8,
+        pulls: Optional[app_commands.Range[int, 1, 10000]] = None,
+    ):
+        async with Reply(interaction, "forecast", ephemeral=True) as reply:
+            user_id = interaction.user.id
+            await asyncio.to_thread(get_storage().ensure_agency, user_id)
+            projection = await asyncio.to_thread(forecast, user_id, hours * 3600)
+            if projection is None:
+                await reply.send("No agency yet. Use /start.")
+                return
+            names = await asyncio.to_thread(get_storage().girl_names, user_id)
+
+            working = sum(1 for update in projection.updates if update[1])
+            emb = discord.Embed(title=f"Forecast · {format_duration(hours * 3600)} from now", color=0xFFE17A)
+            emb.add_field(name="💵 Money", value=format_currency(projection.money), inline=True)
+            emb.add_field(
+                name="📈 Earned",
+                value=f"+{format_currency(projection.money_gain)} (passive {format_currency(projection.passive_gain)})",
+                inline=True,
+            )
+            emb.add_field(name="❤️ Total Fans", value=format_plain(projection.total_fans), inline=True)
+            emb.add_field(
+                name="⚡ Stamina",
+                value=f"{working} working, {len(projection.updates) - working} resting",
+                inline=True,
+            )
+            levels = {update[6]: update[4] for update in projection.updates}
+            if projection.leveled_up:
+                lines = [f"**{names.get(gid, gid)}** → Lv.{levels[gid]}" for gid in projection.leveled_up[:10]]
+                if len(projection.leveled_up) > 10:
+                    lines.append(f"… and {len(projection.leveled_up) - 10} more")
+                emb.add_field(name="⬆️ Level ups", value="\n".join(lines), inline=False)
+            if pulls:
+                wait = await asyncio.to_thread(time_until_pulls, user_id, pulls)
+                cost = format_currency(pulls * GACHA_COST)
+                if wait is None:
+                    value = f"{cost} is more than a year away at the current pace."
+                elif wait == 0:
+                    value = f"You can already afford {cost}."
+                else:
+                    value = f"{cost} in {format_duration(wait)} (<t:{int(time.time() + wait)}:f>)"
+                emb.add_field(name=f"🎰 {pulls} scout{'s' if pulls != 1 else ''}", value=value, inline=False)
+            emb.set_footer(text="Assumes nobody toggles girls in the meantime.")
+            await reply.send(embed=emb)
+
+    @app_commands.command(name="history", description="Graph your agency's income, fans and money")
+    @app_commands.describe(scale="minute: the last hour, hour: the last 2 days, day: the last 30 days")
+    async def history(self, interaction: discord.Interaction, scale: Literal["minute", "hour", "day"] = "hour"):
+        async with Reply(interaction, "history", ephemeral=True) as reply:
+            user_id = interaction.user.id
+            await asyncio.to_thread(get_storage().ensure_agency, user_id)
+            await compute_tick_async(user_id)
+            emb = await asyncio.to_thread(self.history_embed, user_id, scale)
+            if emb is None:
+                await reply.send("No history yet. Check back after your agency has earned something.")
+                return
+            await reply.send(embed=emb)
+
+    @staticmethod
+    def history_embed(user_id: int, scale: str) -> Optional[discord.Embed]:
+        history = get_storage().history(user_id)
+        points = history.points(scale, int(time.time())) if history is not None else []
+        if not points:
+            return None
+        points = downsample(points, HISTORY_WIDTH)
+        earned = [p.earned for p in points]
+        fans = [p.fans for p in points]
+        money = [p.money for p in points]
+        known_fans = [value for value in fans if value is not None]
+        known_money = [value for value in money if value is not None]
+
+        emb = discord.Embed(title=f"History · per {scale}", color=0xFFE17A)
+        emb.add_field(
+            name="📈 Earned",
+            value=f"```{sparkline(earned)}```total {format_currency(sum(earned))}, best {format_currency(max(earned))}",
+            inline=False,
+        )
+        emb.add_field(
+            name="❤️ Fans",
+            value=f"```{sparkline(fans)}```{format_plain(known_fans[0])} → {format_plain(known_fans[-1])}",
+            inline=False,
+        )
+        emb.add_field(
+            name="💵 Money",
+            value=f"```{sparkline(money)}```{format_currency(known_money[0])} → {format_currency(known_money[-1])}",
+            inline=False,
+        )
+        emb.set_footer(text=f"Last {format_duration(time.time() - points[0].ts)}")
+        return emb
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Core(bot))
@@ -1,21 +1,67 @@
-import os, random
+import asyncio, os
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import List, NamedTuple, Optional
 import discord
 from discord import app_commands
 from discord.ext import commands
-from db.database import db, ensure_user
-from services.formatting import format_currency, format_plain, format_rate
-from services.gacha import rarity_roll, pick_by_rarity, GACHA_COST, DUP_CASHBACK, rarity_emoji
-from models.girl_pool import load_pool
-from services.image_paths import allowed_roots, is_within_allowed
+from bot.deferral import Reply
+from services.formatting import format_currency
+from services.gacha import (
+    rarity_roll,
+    pick_by_rarity,
+    propagate_pool_changes,
+    propagated_pool,
+    record_propagated_pool,
+    GACHA_COST,
+    DUP_CASHBACK,
+)
+from models.girl_pool import CompiledPool, PoolDiff, compile_pool, diff_pools
+from services.image_paths import allowed_roots, invalidate_image_cache, resolve_image_reference
+from services.pool_watcher import PoolWatcher, watch_enabled
+from services.render import gacha_parts
+from services.scheduler import get_stamina_scheduler
+from storage import get_storage
+
+class PoolReload(NamedTuple):
+    pool: CompiledPool
+    diff: PoolDiff
+    propagated: int
+
 
 class Gacha(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.pool = []
+        self.compiled = CompiledPool([], None)
         self.warn = None
-        self.reload_pool_data()
+        self.reload_lock = asyncio.Lock()
+        self.watcher: Optional[PoolWatcher] = None
+
+    async def cog_load(self) -> None:
+        # Compiled off the loop so other cogs and the login can proceed.
+        await self.reload_pool_async()
+        if not watch_enabled():
+            return
+        path = os.getenv("GIRLS_JSON_PATH", "data/girls.json")
+        base = Path(path).resolve().parent
+        self.watcher = PoolWatcher(path, allowed_roots(base / "girls_images", base), self.on_pool_files_changed)
+        self.watcher.track(self.compiled.folders)
+        mode = self.watcher.start()
+        print(f"Watching {path} for changes ({mode})")
+
+    async def cog_unload(self) -> None:
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+    async def on_pool_files_changed(self) -> None:
+        reload = await self.reload_pool_async()
+        diff = reload.diff
+        if diff:
+            print(
+                f"Pool hot-reloaded: +{len(diff.added)} -{len(diff.removed)} ~{len(diff.changed)}, "
+                f"{reload.propagated} owned girls updated"
+            )
 
     @staticmethod
     def build_image(girl: dict) -> tuple[Optional[str], List[discord.File]]:
@@ -27,135 +73,116 @@ class Gacha(commands.Cog):
             return image_url, attachments
         if not image_path:
             return None, attachments
-        candidate = Path(str(image_path)).expanduser()
-        roots = allowed_roots()
-        if candidate.is_absolute():
-            path = candidate.resolve()
-        else:
-            resolved: Optional[Path] = None
-            for root in roots:
-                attempt = (root / candidate).resolve()
-                if not is_within_allowed(attempt, roots):
-                    continue
-                if attempt.exists():
-                    resolved = attempt
-                    break
-            path = resolved if resolved is not None else candidate.resolve()
-
-        if not is_within_allowed(path, roots) or not path.exists() or not path.is_file():
+        _url, resolved = resolve_image_reference(str(image_path))
+        if resolved is None:
+            return None, attachments
+        path = Path(resolved)
+        if not path.is_file():
             return None, attachments
         base_name = "".join(ch if ch.isalnum() else "_" for ch in girl["name"].lower()) or "girl"
         filename = f"gacha_{base_name}_{path.name.replace(' ', '_')}"
         attachments.append(discord.File(path, filename=filename))
         return f"attachment://{filename}", attachments
 
-    def reload_pool_data(self) -> Tuple[int, Optional[str]]:
+    def prepare_reload(self) -> PoolReload:
+        """Load the pool, diff it and update owned girls; safe off the loop.
+
+        The in-memory pool is left untouched until :meth:`apply_reload`.
+        """
         path = os.getenv("GIRLS_JSON_PATH", "data/girls.json")
-        pool, warn = load_pool(path)
-        self.pool = pool
-        self.warn = warn
-        if warn:
-            print("Pool warning:", warn)
-        return len(pool), warn
+        compiled = compile_pool(path)
+        diff = diff_pools(self.compiled, compiled)
+        # Owned girls are diffed against the catalog last propagated to
+        # them, not the in-memory pool, so edits made while the bot was
+        # down still reach them on the first load after a restart.
+        baseline = propagated_pool()
+        owned_diff = diff if baseline is None else diff_pools(baseline, compiled)
+        propagated = 0
+        if owned_diff.changed:
+            propagated = propagate_pool_changes((baseline or self.compiled).by_name, compiled.by_name, owned_diff)
+        # An empty load (missing or broken file) is not a catalog to diff against.
+        if compiled.entries and (baseline is None or owned_diff):
+            record_propagated_pool(compiled)
+        return PoolReload(compiled, diff, propagated)
+
+    def apply_reload(self, reload: PoolReload) -> PoolReload:
+        self.compiled.apply_diff(reload.pool, reload.diff)
+        self.pool = self.compiled.entries
+        self.warn = self.compiled.warnings
+        if self.watcher is not None:
+            self.watcher.track(self.compiled.folders)
+        if self.warn:
+            print("Pool warning:", self.warn)
+        return reload
+
+    def reload_pool_data(self) -> PoolReload:
+        return self.apply_reload(self.prepare_reload())
+
+    async def reload_pool_async(self) -> PoolReload:
+        async with self.reload_lock:
+            reload = await asyncio.to_thread(self.prepare_reload)
+            self.apply_reload(reload)
+        invalidate_image_cache()
+        return reload
 
     @app_commands.command(
         name="gacha",
         description=f"Scout a new girl ({GACHA_COST}). Duplicate grants {int(DUP_CASHBACK * 100)}% cashback.",
     )
     async def gacha(self, interaction: discord.Interaction):
-        ensure_user(interaction.user.id)
-        con = db()
-        cur = con.cursor()
-        cur.execute("SELECT money FROM users WHERE user_id=?", (interaction.user.id,))
-        money = float(cur.fetchone()["money"])
+        async with Reply(interaction, "gacha", ephemeral=True) as reply:
+            await self.scout(interaction, reply)
+
+    def funds(self, user_id: int) -> float:
+        store = get_storage()
+        store.ensure_agency(user_id)
+        return store.balance(user_id) or 0.0
+
+    async def scout(self, interaction: discord.Interaction, reply: Reply) -> None:
+        store = get_storage()
+        money = await asyncio.to_thread(self.funds, interaction.user.id)
         if money < GACHA_COST:
-            con.close()
-            await interaction.response.send_message(
-                f"Not enough funds. Need {format_currency(GACHA_COST)}.", ephemeral=True
-            )
+            await reply.send(f"Not enough funds. Need {format_currency(GACHA_COST)}.")
             return
 
-        money -= GACHA_COST
         r = rarity_roll()
         if not self.pool:
-            con.close()
-            await interaction.response.send_message(
-                "The scouting pool is empty. Please ask an admin to reload the roster.",
-                ephemeral=True,
-            )
+            await reply.send("The scouting pool is empty. Please ask an admin to reload the roster.")
             return
-        g = pick_by_rarity(self.pool, r)
+        g = pick_by_rarity(self.pool, r, self.compiled.by_rarity)
 
-        cur.execute("SELECT id FROM user_girls WHERE user_id=? AND name=?", (interaction.user.id, g["name"]))
-        exists = cur.fetchone()
         image_reference = g.get("image_url") or g.get("image_path")
-        if exists:
-            cashback = int(round(GACHA_COST * DUP_CASHBACK))
-            money += cashback
-            if image_reference:
-                cur.execute(
-                    "UPDATE user_girls SET image_url=? WHERE user_id=? AND name=?",
-                    (str(image_reference), interaction.user.id, g["name"]),
-                )
-            description = (
-                f"🎰 Duplicate **{g['name']}** {rarity_emoji(g['rarity'])}. "
-                f"Cashback: +{format_currency(cashback)}"
-            )
-        else:
-            cur.execute(
-                """
-                INSERT INTO user_girls(
-                    user_id,
-                    name,
-                    rarity,
-                    level,
-                    xp,
-                    income,
-                    popularity,
-                    fans,
-                    stamina,
-                    is_working,
-                    image_url,
-                    specialty
-                )
-                VALUES(?,?,?,?,?,?,?,0,100,1,?,?)
-                """,
-                (
-                interaction.user.id,
-                g["name"],
-                g["rarity"],
-                1,
-                "0",
-                g["income"],
-                g["popularity"],
-                image_reference,
-                g.get("specialty"),
-                ),
-            )
-            description = (
-                f"🎉 New girl: **{g['name']}** {rarity_emoji(g['rarity'])}!\n"
-                f"💰 {format_rate(g['income'])} | 🌟{format_plain(g['popularity'])} | 🏷️ {g.get('specialty','-')}"
-            )
-
-        cur.execute("UPDATE users SET money=? WHERE user_id=?", (money, interaction.user.id))
-        con.commit()
-        con.close()
+        cashback = int(round(GACHA_COST * DUP_CASHBACK))
+        pull = await asyncio.to_thread(
+            store.record_pull,
+            interaction.user.id,
+            g,
+            str(image_reference) if image_reference else None,
+            GACHA_COST,
+            cashback,
+        )
+        if pull is None:
+            # Spent elsewhere between the balance check and the pull.
+            await reply.send(f"Not enough funds. Need {format_currency(GACHA_COST)}.")
+            return
+        if pull.new:
+            await get_stamina_scheduler().refresh_user(interaction.user.id)
+        parts = gacha_parts(g, cashback)
         embed = discord.Embed(
-            title=f"{g['name']} {rarity_emoji(g['rarity'])}",
-            description=description,
+            title=parts.title,
+            description=parts.new if pull.new else parts.duplicate,
             color=discord.Color.from_str("#FF99CC"),
         )
-        embed.add_field(name="💰 Income", value=format_rate(g["income"]), inline=True)
-        embed.add_field(name="🌟 Popularity", value=format_plain(g["popularity"]), inline=True)
-        embed.add_field(name="🏷️ Specialty", value=g.get("specialty") or "-", inline=True)
-        embed.add_field(name="💵 Balance", value=format_currency(money), inline=True)
-        image_url, attachments = self.build_image(g)
+        for name, value, inline in parts.fields:
+            embed.add_field(name=name, value=value, inline=inline)
+        embed.add_field(name="💵 Balance", value=format_currency(pull.money), inline=True)
+        image_url, attachments = await asyncio.to_thread(self.build_image, g)
         if image_url:
             embed.set_image(url=image_url)
-        kwargs = {"embed": embed, "ephemeral": True}
+        kwargs = {"embed": embed}
         if attachments:
             kwargs["files"] = list(attachments)
-        await interaction.response.send_message(**kwargs)
+        await reply.send(**kwargs)
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Gacha(bot))
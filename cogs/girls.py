@@ -1,20 +1,33 @@
 from __future__ import annotations
 
+import asyncio
 import os
 from pathlib import Path
-from typing import List, Optional, Sequence, Tuple
+from typing import List, Literal, Optional, Sequence, Tuple
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 
-from db.database import db, ensure_user
-from services.formatting import format_currency, format_plain, format_rate
-from services.gacha import rarity_emoji
-from services.game import compute_tick
-from services.balance import format_xp, level_xp_required, xp_to_decimal
-from models.girl_pool import load_pool
-from services.image_paths import allowed_roots, is_within_allowed
+from bot.deferral import Reply
+from bot.instrumentation import InstrumentedView
+from services.formatting import format_currency
+from services.game import compute_tick_async
+from services.scheduler import get_stamina_scheduler
+from models.girl_pool import compile_pool
+from services.image_paths import resolve_image_reference
+from services.render import girl_card, option_description, roster_summary
+from services.roster import (
+    ROTATE_REST_BELOW,
+    ROTATE_WORK_ABOVE,
+    BulkResult,
+    RosterFilter,
+)
+from storage import get_storage
+
+
+# Rows a roster view keeps loaded; the select menu shows 25 of them.
+ROSTER_BLOCK = 100
 
 
 def _window_bounds(total: int, index: int, limit: int) -> tuple[int, int]:
@@ -29,6 +42,52 @@ def _window_bounds(total: int, index: int, limit: int) -> tuple[int, int]:
     return start, end
 
 
+async def run_bulk_action(
+    user_id: int,
+    action: str,
+    roster_filter: Optional[RosterFilter] = None,
+    rest_below: float = ROTATE_REST_BELOW,
+    work_above: float = ROTATE_WORK_ABOVE,
+) -> BulkResult:
+    """Settle once, then apply ``action`` to the whole (filtered) roster."""
+    await compute_tick_async(user_id)
+    result = await asyncio.to_thread(
+        get_storage().bulk_set_working, user_id, action, roster_filter, rest_below, work_above
+    )
+    await get_stamina_scheduler().refresh_user(user_id)
+    return result
+
+
+def backfill_image_refs(
+    user_id: int, rows: Sequence[dict], pool_lookup: dict[str, dict[str, object]]
+) -> None:
+    """Give rows without an image the catalog's, and store it for next time."""
+    updates: list[tuple[str, int]] = []
+    for row in rows:
+        if row.get("image_url"):
+            continue
+        fallback = pool_lookup.get(row.get("name"))
+        if not fallback:
+            continue
+        ref = fallback.get("image_url") or fallback.get("image_path")
+        if not ref:
+            continue
+        row["image_url"] = ref
+        updates.append((str(ref), row["id"]))
+    get_storage().set_image_refs(user_id, updates)
+
+
+def bulk_message(result: BulkResult) -> str:
+    if not result.rested and not result.started:
+        return "Nothing to change."
+    parts = []
+    if result.rested:
+        parts.append(f"🛌 {result.rested} sent to rest")
+    if result.started:
+        parts.append(f"💼 {result.started} started working")
+    return ", ".join(parts) + "."
+
+
 class GirlSelect(discord.ui.Select):
     def __init__(self, view: "GirlsPaginator") -> None:
         self.paginator = view
@@ -46,23 +105,29 @@ class GirlSelect(discord.ui.Select):
         self.options = self.paginator.build_options()
 
     async def callback(self, interaction: discord.Interaction) -> None:  # type: ignore[override]
-        index = int(self.values[0])
-        self.paginator.page = index
+        await self.paginator.show(int(self.values[0]))
         await self.paginator.send_page(interaction)
 
 
-class GirlsPaginator(discord.ui.View):
+class GirlsPaginator(InstrumentedView):
     def __init__(
         self,
         user_id: int,
         rows: Sequence[object],
         money: float,
         pool_lookup: Optional[dict[str, dict[str, object]]] = None,
+        roster_filter: Optional[RosterFilter] = None,
+        total: Optional[int] = None,
     ) -> None:
         super().__init__(timeout=180)
         self.user_id = user_id
+        self.roster_filter = roster_filter or RosterFilter()
         self.pool_lookup: dict[str, dict[str, object]] = pool_lookup or {}
+        # A block of the filtered roster starting at ``offset``; ``page`` and
+        # ``total`` index the whole roster.
         self.rows = [self._hydrate_row(dict(r)) for r in rows]
+        self.offset = 0
+        self.total = len(self.rows) if total is None else total
         self.money = float(money)
         self.page = 0
         self.message: Optional[discord.Message] = None
@@ -71,30 +136,7 @@ class GirlsPaginator(discord.ui.View):
         self.update_components()
 
     def _resolve_reference(self, ref: Optional[str]) -> tuple[Optional[str], Optional[str]]:
-        if not ref:
-            return None, None
-        ref_str = str(ref).strip()
-        if not ref_str:
-            return None, None
-        lower = ref_str.lower()
-        if lower.startswith("http://") or lower.startswith("https://"):
-            return ref_str, None
-        candidate = Path(ref_str).expanduser()
-        roots = allowed_roots()
-        if candidate.is_absolute():
-            resolved = candidate.resolve()
-            if is_within_allowed(resolved, roots) and resolved.exists():
-                return None, str(resolved)
-            return None, None
-
-        for root in roots:
-            attempt = (root / candidate).resolve()
-            if not is_within_allowed(attempt, roots):
-                continue
-            if attempt.exists():
-                return None, str(attempt)
-
-        return None, None
+        return resolve_image_reference(ref)
 
     def _hydrate_row(self, row: dict) -> dict:
         ref = row.get("image_url")
@@ -119,23 +161,26 @@ class GirlsPaginator(discord.ui.View):
             return False
         return True
 
+    def row(self, index: int) -> dict:
+        return self.rows[index - self.offset]
+
     def current(self) -> dict:
-        return self.rows[self.page]
+        return self.row(self.page)
 
     def select_placeholder(self) -> str:
         current = self.current()
-        return f"{self.page + 1}/{len(self.rows)} • {current['name']}"
+        return f"{self.page + 1}/{self.total} • {current['name']}"
 
     def build_options(self) -> List[discord.SelectOption]:
-        start, end = _window_bounds(len(self.rows), self.page, 25)
+        start, end = _window_bounds(self.total, self.page, 25)
         options: List[discord.SelectOption] = []
         for idx in range(start, end):
-            row = self.rows[idx]
+            row = self.row(idx)
             options.append(
                 discord.SelectOption(
                     label=row["name"],
                     value=str(idx),
-                    description=f"Lv.{int(row['level'])} • {format_rate(row['income'])}",
+                    description=option_description(row),
                     default=idx == self.page,
                 )
             )
@@ -147,9 +192,8 @@ class GirlsPaginator(discord.ui.View):
                 child.disabled = True
             return
         self.select_menu.refresh()
-        total = len(self.rows)
-        self.go_previous.disabled = total <= 1
-        self.go_next.disabled = total <= 1
+        self.go_previous.disabled = self.total <= 1
+        self.go_next.disabled = self.total <= 1
         current = self.current()
         working = bool(current["is_working"])
         self.toggle_work.label = "Send to Rest" if working else "Start Working"
@@ -159,41 +203,26 @@ class GirlsPaginator(discord.ui.View):
         self.toggle_work.emoji = "🛌" if working else "💼"
 
     def roster_preview(self) -> str:
-        start, end = _window_bounds(len(self.rows), self.page, 10)
+        start, end = _window_bounds(self.total, self.page, 10)
         lines = []
         for idx in range(start, end):
-            row = self.rows[idx]
+            row = self.row(idx)
             marker = "➤" if idx == self.page else "•"
-            lines.append(
-                f"{marker} {idx + 1}. {row['name']} Lv.{int(row['level'])} — {format_rate(row['income'])}"
-            )
+            lines.append(f"{marker} {idx + 1}. {roster_summary(row)}")
         return "\n".join(lines)
 
     def make_embed(self) -> Tuple[discord.Embed, List[discord.File]]:
         current = self.current()
-        embed = discord.Embed(
-            title=f"{current['name']} {rarity_emoji(current['rarity'])}",
-            color=0xFF99CC,
-            description=self.roster_preview(),
-        )
+        title, fields = girl_card(current)
+        embed = discord.Embed(title=title, color=0xFF99CC, description=self.roster_preview())
         embed.add_field(name="💼 Balance", value=format_currency(self.money), inline=True)
-        current_level = int(current["level"])
-        embed.add_field(name="⬆️ Level", value=str(current_level), inline=True)
-        embed.add_field(name="💰 Income", value=format_rate(current["income"]), inline=True)
-        embed.add_field(name="🌟 Popularity", value=format_plain(current["popularity"]), inline=True)
-        embed.add_field(name="❤️ Fans", value=format_plain(current["fans"]), inline=True)
-        stamina = format_plain(current["stamina"])
-        status = "Working" if current["is_working"] else "Resting"
-        embed.add_field(name="⚡ Stamina", value=f"{stamina}% • {status}", inline=True)
-        xp = xp_to_decimal(current.get("xp", 0))
-        requirement = level_xp_required(current_level)
-        if requirement is None:
-            xp_text = "MAX"
-        else:
-            xp_text = f"{format_xp(xp)}/{format_xp(requirement)}"
-        embed.add_field(name="📈 Experience", value=xp_text, inline=True)
-        embed.add_field(name="🗂️ Specialty", value=current["specialty"] or "-", inline=True)
-        embed.set_footer(text=f"Page {self.page + 1}/{len(self.rows)}")
+        for name, value, inline in fields:
+            embed.add_field(name=name, value=value, inline=inline)
+        footer = f"Page {self.page + 1}/{self.total}"
+        description = self.roster_filter.describe()
+        if description:
+            footer += f" • {description}"
+        embed.set_footer(text=footer)
         attachments: List[discord.File] = []
         image_url = current.get("image_url")
         image_path = current.get("image_path")
@@ -214,31 +243,46 @@ class GirlsPaginator(discord.ui.View):
         embed, attachments = self.make_embed()
         await interaction.response.edit_message(embed=embed, view=self, attachments=attachments)
 
-    def reload_state(self) -> None:
+    def _fetch_state(self, offset: int) -> Tuple[float, List[dict], int, int]:
+        store = get_storage()
+        rows, total = store.roster_page(self.user_id, self.roster_filter, offset, ROSTER_BLOCK)
+        if not rows and total:
+            # The roster shrank below this block; take its last one instead.
+            offset = max(0, total - ROSTER_BLOCK)
+            rows, total = store.roster_page(self.user_id, self.roster_filter, offset, ROSTER_BLOCK)
+        backfill_image_refs(self.user_id, rows, self.pool_lookup)
+        money = store.balance(self.user_id) or 0.0
+        return money, [self._hydrate_row(row) for row in rows], offset, total
+
+    async def _load(self, offset: int) -> None:
+        self.money, self.rows, self.offset, self.total = await asyncio.to_thread(self._fetch_state, offset)
+
+    async def show(self, index: int) -> None:
+        """Move to ``index``, loading the block around it if needed."""
+        # Twice at most: the roster may have shrunk since the last load.
+        for _ in range(2):
+            self.page = max(0, min(index, self.total - 1))
+            start, end = _window_bounds(self.total, self.page, 25)
+            if self.offset <= start and end <= self.offset + len(self.rows):
+                return
+            # Centre the block on the menu's window so a few steps either
+            # way need no query.
+            await self._load(max(0, min(start - (ROSTER_BLOCK - (end - start)) // 2, self.total - ROSTER_BLOCK)))
+
+    async def reload_state(self) -> None:
         if not self.rows:
             return
         current_id = self.current()["id"]
-        con = db()
-        cur = con.cursor()
-        cur.execute("SELECT money FROM users WHERE user_id=?", (self.user_id,))
-        row = cur.fetchone()
-        self.money = float(row["money"]) if row else 0.0
-        cur.execute(
-            "SELECT * FROM user_girls WHERE user_id=? ORDER BY rarity DESC, income DESC, name ASC",
-            (self.user_id,),
-        )
-        self.rows = [self._hydrate_row(dict(r)) for r in cur.fetchall()]
-        con.close()
+        await self._load(self.offset)
         if not self.rows:
             self.page = 0
             self.update_components()
             return
         for idx, row in enumerate(self.rows):
             if row["id"] == current_id:
-                self.page = idx
+                self.page = self.offset + idx
                 break
-        else:
-            self.page = min(self.page, len(self.rows) - 1)
+        await self.show(self.page)
         self.update_components()
 
     @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary, row=1)
@@ -246,7 +290,7 @@ class GirlsPaginator(discord.ui.View):
         if not self.rows:
             await interaction.response.send_message("No girls available.", ephemeral=True)
             return
-        self.page = (self.page - 1) % len(self.rows)
+        await self.show((self.page - 1) % self.total)
         await self.send_page(interaction)
 
     @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary, row=1)
@@ -254,24 +298,17 @@ class GirlsPaginator(discord.ui.View):
         if not self.rows:
             await interaction.response.send_message("No girls available.", ephemeral=True)
             return
-        self.page = (self.page + 1) % len(self.rows)
+        await self.show((self.page + 1) % self.total)
         await self.send_page(interaction)
 
     @discord.ui.button(label="Toggle", style=discord.ButtonStyle.primary, row=2)
     async def toggle_work(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
         await interaction.response.defer(thinking=False)
-        compute_tick(self.user_id)
+        await compute_tick_async(self.user_id)
         current = self.current()
-        con = db()
-        cur = con.cursor()
-        cur.execute(
-            "SELECT id, is_working FROM user_girls WHERE id=? AND user_id=?",
-            (current["id"], self.user_id),
-        )
-        row = cur.fetchone()
-        if not row:
-            con.close()
-            self.reload_state()
+        working = await asyncio.to_thread(get_storage().toggle_working, self.user_id, current["id"])
+        if working is None:
+            await self.reload_state()
             if self.rows:
                 embed, attachments = self.make_embed()
                 await interaction.edit_original_response(embed=embed, view=self, attachments=attachments)
@@ -281,16 +318,41 @@ class GirlsPaginator(discord.ui.View):
                 )
             await interaction.followup.send("Girl not found anymore.", ephemeral=True)
             return
-        new_state = 0 if row["is_working"] else 1
-        cur.execute("UPDATE user_girls SET is_working=? WHERE id=?", (new_state, row["id"]))
-        con.commit()
-        con.close()
-        self.reload_state()
+        await get_stamina_scheduler().refresh_user(self.user_id)
+        await self.reload_state()
         embed, attachments = self.make_embed()
         await interaction.edit_original_response(embed=embed, view=self, attachments=attachments)
-        state_text = "now resting" if new_state == 0 else "now working"
+        state_text = "now working" if working else "now resting"
         await interaction.followup.send(f"{current['name']} is {state_text}.", ephemeral=True)
 
+    async def _bulk(self, interaction: discord.Interaction, action: str) -> None:
+        await interaction.response.defer(thinking=False)
+        previous_id = self.current()["id"] if self.rows else None
+        result = await run_bulk_action(self.user_id, action, self.roster_filter)
+        await self.reload_state()
+        if not self.rows:
+            await interaction.edit_original_response(content="No girls match this roster view now.", embed=None, view=None)
+        elif self.current()["id"] == previous_id:
+            # Same girl on screen: keep the already uploaded image.
+            embed, _attachments = self.make_embed()
+            await interaction.edit_original_response(embed=embed, view=self)
+        else:
+            embed, attachments = self.make_embed()
+            await interaction.edit_original_response(embed=embed, view=self, attachments=attachments)
+        await interaction.followup.send(bulk_message(result), ephemeral=True)
+
+    @discord.ui.button(label="Rest all", emoji="🛌", style=discord.ButtonStyle.secondary, row=3)
+    async def rest_all(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
+        await self._bulk(interaction, "rest")
+
+    @discord.ui.button(label="Work all", emoji="💼", style=discord.ButtonStyle.secondary, row=3)
+    async def work_all(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
+        await self._bulk(interaction, "work")
+
+    @discord.ui.button(label="Rotate", emoji="🔄", style=discord.ButtonStyle.secondary, row=3)
+    async def rotate(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
+        await self._bulk(interaction, "rotate")
+
     async def on_timeout(self) -> None:
         for child in self.children:
             child.disabled = True
@@ -302,53 +364,120 @@ class GirlsPaginator(discord.ui.View):
 
 
 class Girls(commands.Cog):
+    roster = app_commands.Group(name="roster", description="Manage your whole roster at once")
+
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
+    async def _roster_action(
+        self,
+        interaction: discord.Interaction,
+        action: str,
+        rest_below: float = ROTATE_REST_BELOW,
+        work_above: float = ROTATE_WORK_ABOVE,
+    ) -> None:
+        async with Reply(interaction, "roster", ephemeral=True) as reply:
+            user_id = interaction.user.id
+            await asyncio.to_thread(get_storage().ensure_agency, user_id)
+            result = await run_bulk_action(user_id, action, None, rest_below, work_above)
+            await reply.send(bulk_message(result))
+
+    @roster.command(name="rest", description="Send every working girl to rest")
+    async def roster_rest(self, interaction: discord.Interaction) -> None:
+        await self._roster_action(interaction, "rest")
+
+    @roster.command(name="work", description="Put every resting girl to work")
+    async def roster_work(self, interaction: discord.Interaction) -> None:
+        await self._roster_action(interaction, "work")
+
+    @roster.command(name="rotate", description="Rest tired girls and put rested ones back to work")
+    @app_commands.describe(
+        rest_below=f"Rest working girls under this stamina % (default {ROTATE_REST_BELOW:g})",
+        work_above=f"Start resting girls at or above this stamina % (default {ROTATE_WORK_ABOVE:g})",
+    )
+    async def roster_rotate(
+        self,
+        interaction: discord.Interaction,
+        rest_below: app_commands.Range[float, 0, 100] = ROTATE_REST_BELOW,
+        work_above: app_commands.Range[float, 0, 100] = ROTATE_WORK_ABOVE,
+    ) -> None:
+        if rest_below > work_above:
+            await interaction.response.send_message(
+                "`rest_below` must not be higher than `work_above`.", ephemeral=True
+            )
+            return
+        await self._roster_action(interaction, "rotate", rest_below, work_above)
+
     @app_commands.command(name="girls", description="Browse and manage your girls with an interactive roster")
-    async def girls(self, interaction: discord.Interaction) -> None:
-        ensure_user(interaction.user.id)
-        compute_tick(interaction.user.id)
-        con = db()
-        cur = con.cursor()
-        cur.execute("SELECT money FROM users WHERE user_id=?", (interaction.user.id,))
-        user_row = cur.fetchone()
-        cur.execute(
-            "SELECT * FROM user_girls WHERE user_id=? ORDER BY rarity DESC, income DESC, name ASC",
-            (interaction.user.id,),
+    @app_commands.describe(
+        rarity="Only girls of this rarity",
+        specialty="Only girls with this specialty",
+        status="Only working or only resting girls",
+        min_level="Only girls at or above this level",
+        search="Search names and specialties",
+        sort="Order of the roster",
+    )
+    async def girls(
+        self,
+        interaction: discord.Interaction,
+        rarity: Optional[Literal["N", "R", "SR", "SSR", "UR"]] = None,
+        specialty: Optional[str] = None,
+        status: Optional[Literal["working", "resting"]] = None,
+        min_level: Optional[app_commands.Range[int, 1]] = None,
+        search: Optional[str] = None,
+        sort: Literal["rarity", "income", "level", "fans", "stamina", "name"] = "rarity",
+    ) -> None:
+        roster_filter = RosterFilter(
+            rarity=rarity,
+            specialty=specialty.strip() if specialty else None,
+            working=None if status is None else status == "working",
+            min_level=min_level,
+            search=search.strip() if search else None,
+            sort=sort,
         )
-        rows_data = cur.fetchall()
-        pool_path = os.getenv("GIRLS_JSON_PATH", "data/girls.json")
-        pool_entries, _pool_warn = load_pool(pool_path)
-        pool_lookup: dict[str, dict[str, object]] = {entry["name"]: entry for entry in pool_entries}
-        rows = [dict(r) for r in rows_data]
-        updates: list[tuple[str, int]] = []
-        for row in rows:
-            if row.get("image_url"):
-                continue
-            fallback = pool_lookup.get(row.get("name"))
-            if not fallback:
-                continue
-            ref = fallback.get("image_url") or fallback.get("image_path")
-            if not ref:
-                continue
-            row["image_url"] = ref
-            updates.append((str(ref), row["id"]))
-        if updates:
-            cur.executemany("UPDATE user_girls SET image_url=? WHERE id=?", updates)
-            con.commit()
-        con.close()
-        if not rows:
-            await interaction.response.send_message("You have no girls yet. Try /gacha", ephemeral=True)
-            return
-        money = float(user_row["money"]) if user_row else 0.0
-        view = GirlsPaginator(interaction.user.id, rows, money, pool_lookup)
-        embed, attachments = view.make_embed()
-        kwargs = {"embed": embed, "view": view}
-        if attachments:
-            kwargs["files"] = attachments
-        await interaction.response.send_message(**kwargs)
-        view.message = await interaction.original_response()
+        gacha_cog = interaction.client.get_cog("Gacha")
+        async with Reply(interaction, "girls") as reply:
+            user_id = interaction.user.id
+            await asyncio.to_thread(get_storage().ensure_agency, user_id)
+            await compute_tick_async(user_id)
+            rows, total, money, pool_lookup = await asyncio.to_thread(
+                self.load_roster, user_id, roster_filter, gacha_cog.compiled.by_name if gacha_cog else None
+            )
+            if not rows:
+                if roster_filter.is_default():
+                    message = "You have no girls yet. Try /gacha"
+                else:
+                    message = f"No girls match {roster_filter.describe()}."
+                await reply.send(message, ephemeral=True)
+                return
+            # Views bind to the running loop, so this part stays on it.
+            view = GirlsPaginator(user_id, rows, money, pool_lookup, roster_filter, total)
+            embed, attachments = view.make_embed()
+            kwargs = {"embed": embed, "view": view}
+            if attachments:
+                kwargs["files"] = attachments
+            await reply.send(**kwargs)
+            view.message = await interaction.original_response()
+
+    @staticmethod
+    def load_roster(
+        user_id: int, roster_filter: RosterFilter, pool_lookup: Optional[dict[str, dict[str, object]]]
+    ) -> tuple[list[dict], int, float, dict[str, dict[str, object]]]:
+        """The first block of matching rows with image fallbacks filled in,
+        the number of matches and the balance."""
+        store = get_storage()
+        rows, total = store.roster_page(user_id, roster_filter, 0, ROSTER_BLOCK)
+        if pool_lookup is None:
+            pool_lookup = compile_pool(os.getenv("GIRLS_JSON_PATH", "data/girls.json")).by_name
+        backfill_image_refs(user_id, rows, pool_lookup)
+        return rows, total, (store.balance(user_id) or 0.0) if rows else 0.0, pool_lookup
+
+    @girls.autocomplete("specialty")
+    async def specialty_autocomplete(
+        self, interaction: discord.Interaction, current: str
+    ) -> List[app_commands.Choice[str]]:
+        names = await asyncio.to_thread(get_storage().specialties, interaction.user.id, current)
+        return [app_commands.Choice(name=name, value=name) for name in names]
 
 
 async def setup(bot: commands.Bot):
@@ -0,0 +1,95 @@
+import asyncio
+import os
+from typing import Literal, Optional
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from bot.deferral import Reply
+from services.cluster import clustered
+from services.formatting import format_currency, format_plain
+from services.game import compute_tick_async
+from services.leaderboard import get_leaderboards, remember_guild_member
+
+TITLES = {"money": "💵 Richest agencies", "fans": "❤️ Most fans", "level": "⬆️ Highest level girl"}
+
+
+def format_score(metric: str, score: float) -> str:
+    if metric == "money":
+        return format_currency(score)
+    if metric == "level":
+        return f"Lv.{int(score)}"
+    return format_plain(score)
+
+
+class Leaderboard(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.refresh_task: Optional[asyncio.Task[None]] = None
+
+    async def cog_load(self) -> None:
+        count = await asyncio.to_thread(get_leaderboards().load)
+        print(f"Leaderboards loaded: {count} agencies")
+        if clustered():
+            # Ticks settled by other processes only reach agency_stats.
+            self.refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def cog_unload(self) -> None:
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+
+    async def _refresh_loop(self) -> None:
+        interval = float(os.getenv("CLUSTER_RESYNC_SECONDS", "300"))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(get_leaderboards().load)
+            except Exception as e:
+                print("Leaderboard refresh failed:", e)
+
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction: discord.Interaction) -> None:
+        if interaction.guild_id is not None:
+            remember_guild_member(interaction.guild_id, interaction.user.id)
+
+    @app_commands.command(name="leaderboard", description="Top agencies by money, fans or level")
+    @app_commands.describe(metric="What to rank by", scope="Everyone, or only players in this server")
+    async def leaderboard(
+        self,
+        interaction: discord.Interaction,
+        metric: Literal["money", "fans", "level"] = "money",
+        scope: Literal["global", "server"] = "global",
+    ):
+        if scope == "server" and interaction.guild_id is None:
+            await interaction.response.send_message("Server rankings only work inside a server.", ephemeral=True)
+            return
+        async with Reply(interaction, "leaderboard") as reply:
+            # Settle the caller first so their own line is current.
+            await compute_tick_async(interaction.user.id)
+            boards = get_leaderboards()
+            if scope == "server":
+                top, rank, total = boards.guild_board(metric, interaction.guild_id, 10, interaction.user.id)
+            else:
+                top, rank, total = boards.board(metric, 10, interaction.user.id)
+
+            lines = [
+                f"**#{position}** <@{user_id}> — {format_score(metric, score)}"
+                for position, (user_id, score) in enumerate(top, start=1)
+            ]
+            where = interaction.guild.name if scope == "server" and interaction.guild else "Global"
+            embed = discord.Embed(
+                title=f"{TITLES[metric]} · {where}",
+                description="\n".join(lines) or "Nobody is ranked yet.",
+                color=discord.Color.gold(),
+            )
+            if rank is not None:
+                score = boards.indexes[metric].score(interaction.user.id) or 0
+                embed.set_footer(text=f"Your rank: #{rank} of {total} ({format_score(metric, score)})")
+            else:
+                embed.set_footer(text="You are not ranked yet. Use /start to open your agency.")
+            await reply.send(embed=embed)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Leaderboard(bot))
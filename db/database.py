@@ -1,26 +1,159 @@
-import sqlite3, time
-from typing import Any, Dict, List
+import json, os, sqlite3, time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Type
 from pathlib import Path
 
 DB_PATH = Path("idol_agency.db")
 
-def db() -> sqlite3.Connection:
-    con = sqlite3.connect(DB_PATH)
+def set_db_path(path: Path) -> Path:
+    """Point every new connection at ``path``; returns the previous location."""
+    global DB_PATH
+    previous, DB_PATH = DB_PATH, Path(path)
+    return previous
+
+CONNECTION_FACTORY: Type[sqlite3.Connection] = sqlite3.Connection
+
+def set_connection_factory(factory: Type[sqlite3.Connection]) -> Type[sqlite3.Connection]:
+    """Use ``factory`` (a ``sqlite3.Connection`` subclass) for new connections."""
+    global CONNECTION_FACTORY
+    previous, CONNECTION_FACTORY = CONNECTION_FACTORY, factory
+    return previous
+
+def connect(path: Path) -> sqlite3.Connection:
+    con = sqlite3.connect(path, factory=CONNECTION_FACTORY)
     con.row_factory = sqlite3.Row
     return con
 
+def db(user_id: Optional[int] = None) -> sqlite3.Connection:
+    """Connection to the file holding ``user_id``'s agency, or to the home database.
+
+    Pass the user id for anything that reads or writes one agency; queries
+    across agencies go through :func:`each_partition`.
+    """
+    if user_id is None:
+        return connect(DB_PATH)
+    return connect(partition_path(user_id))
+
+# -- partitioning --------------------------------------------------------
+#
+# Agencies can be spread over several SQLite files so writers in different
+# files never wait on the same lock.  A user id hashes to one of SLOT_COUNT
+# slots, and a partition map next to the database
+# (``idol_agency.db.partitions.json``, managed by ``python -m
+# tools.partitions``) assigns slots to files.  Partition 0 is DB_PATH itself
+# and also keeps the global tables (bot_meta, guild_members).  Without a map
+# everything lives in DB_PATH.
+
+SLOT_COUNT = 1024
+_SLOT_SHIFT = 64 - (SLOT_COUNT.bit_length() - 1)
+
+# Tables whose rows belong to one agency and move with it between partitions;
+# ``True`` marks a surrogate ``id`` column the target file reassigns.
+AGENCY_TABLES: Dict[str, bool] = {
+    "users": False,
+    "user_girls": True,
+    "agency_stats": False,
+    "stamina_prefs": False,
+    "economy_ledger": True,
+    "agency_history": False,
+    "archived_users": False,
+    "archived_user_girls": True,
+    "archived_stamina_prefs": False,
+    "archived_agency_history": False,
+}
+
+def partition_slot(user_id: int) -> int:
+    # Snowflake low bits are a per-millisecond counter; mix before slotting.
+    return ((int(user_id) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> _SLOT_SHIFT
+
+@dataclass
+class PartitionMap:
+    files: List[str]  # relative to the database directory; files[0] is DB_PATH
+    slots: List[int]  # partition index for every slot
+
+    @classmethod
+    def single(cls, home: str) -> "PartitionMap":
+        return cls([home], [0] * SLOT_COUNT)
+
+    @classmethod
+    def load(cls, path: Path) -> "PartitionMap":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if len(data["slots"]) != SLOT_COUNT:
+            raise ValueError(f"{path}: expected {SLOT_COUNT} slots, found {len(data['slots'])}")
+        return cls(list(data["files"]), [int(index) for index in data["slots"]])
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files, "slots": self.slots}, f)
+        os.replace(tmp, path)
+
+    def partition_of(self, user_id: int) -> int:
+        return self.slots[partition_slot(user_id)]
+
+def partition_map_path(db_path: Optional[Path] = None) -> Path:
+    base = Path(db_path or DB_PATH)
+    return base.with_name(base.name + ".partitions.json")
+
+_PARTITIONS: Optional[tuple] = None
+
+def load_partitions() -> Optional[PartitionMap]:
+    """The partition map for the current DB_PATH, or ``None`` when unpartitioned."""
+    global _PARTITIONS
+    if _PARTITIONS is None or _PARTITIONS[0] != DB_PATH:
+        path = partition_map_path()
+        _PARTITIONS = (DB_PATH, PartitionMap.load(path) if path.exists() else None)
+    return _PARTITIONS[1]
+
+def reload_partitions() -> Optional[PartitionMap]:
+    global _PARTITIONS
+    _PARTITIONS = None
+    return load_partitions()
+
+def partition_path(user_id: int) -> Path:
+    pmap = load_partitions()
+    if pmap is None:
+        return DB_PATH
+    return DB_PATH.parent / pmap.files[pmap.partition_of(user_id)]
+
+def partition_paths() -> List[Path]:
+    pmap = load_partitions()
+    if pmap is None:
+        return [DB_PATH]
+    return [DB_PATH.parent / name for name in pmap.files]
+
+def each_partition() -> Iterator[sqlite3.Connection]:
+    """Connections to every partition in turn, home database first."""
+    for path in partition_paths():
+        con = connect(path)
+        try:
+            yield con
+        finally:
+            con.close()
+
 def now_ts() -> int:
     return int(time.time())
 
 def init_db():
-    con = db()
+    for path in partition_paths():
+        con = connect(path)
+        try:
+            _init_schema(con)
+        finally:
+            con.close()
+    global _INITIALISED_PATH
+    _INITIALISED_PATH = DB_PATH
+
+def _init_schema(con: sqlite3.Connection) -> None:
     cur = con.cursor()
     cur.executescript("""
     CREATE TABLE IF NOT EXISTS users (
         user_id INTEGER PRIMARY KEY,
         money REAL NOT NULL DEFAULT 0,
         last_tick INTEGER NOT NULL DEFAULT 0,
-        starter_claimed INTEGER NOT NULL DEFAULT 0
+        starter_claimed INTEGER NOT NULL DEFAULT 0,
+        restored_at INTEGER NOT NULL DEFAULT 0
     );
     CREATE TABLE IF NOT EXISTS user_girls (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -39,6 +172,84 @@ def init_db():
         UNIQUE(user_id, name),
         FOREIGN KEY(user_id) REFERENCES users(user_id)
     );
+    CREATE TABLE IF NOT EXISTS agency_stats (
+        user_id INTEGER PRIMARY KEY,
+        money REAL NOT NULL DEFAULT 0,
+        fans REAL NOT NULL DEFAULT 0,
+        level INTEGER NOT NULL DEFAULT 0,
+        updated_at INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY(user_id) REFERENCES users(user_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_agency_stats_money ON agency_stats(money DESC);
+    CREATE INDEX IF NOT EXISTS idx_agency_stats_fans ON agency_stats(fans DESC);
+    CREATE INDEX IF NOT EXISTS idx_agency_stats_level ON agency_stats(level DESC);
+    CREATE TABLE IF NOT EXISTS stamina_prefs (
+        user_id INTEGER PRIMARY KEY,
+        notify INTEGER NOT NULL DEFAULT 0,
+        auto_rotate INTEGER NOT NULL DEFAULT 0,
+        rest_below REAL NOT NULL DEFAULT 25,
+        work_above REAL NOT NULL DEFAULT 80,
+        FOREIGN KEY(user_id) REFERENCES users(user_id)
+    );
+    CREATE TABLE IF NOT EXISTS economy_ledger (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        amount REAL NOT NULL,
+        balance REAL NOT NULL,
+        ref TEXT,
+        FOREIGN KEY(user_id) REFERENCES users(user_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_economy_ledger_user ON economy_ledger(user_id, id);
+    CREATE TABLE IF NOT EXISTS agency_history (
+        user_id INTEGER PRIMARY KEY,
+        data BLOB NOT NULL,
+        FOREIGN KEY(user_id) REFERENCES users(user_id)
+    );
+    CREATE TABLE IF NOT EXISTS archived_users (
+        user_id INTEGER PRIMARY KEY,
+        money REAL NOT NULL DEFAULT 0,
+        last_tick INTEGER NOT NULL DEFAULT 0,
+        starter_claimed INTEGER NOT NULL DEFAULT 0,
+        archived_at INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS archived_user_girls (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        rarity TEXT NOT NULL,
+        level INTEGER NOT NULL DEFAULT 1,
+        xp REAL NOT NULL DEFAULT 0,
+        income REAL NOT NULL,
+        popularity REAL NOT NULL,
+        fans REAL NOT NULL DEFAULT 0,
+        stamina REAL NOT NULL DEFAULT 100,
+        is_working INTEGER NOT NULL DEFAULT 1,
+        image_url TEXT,
+        specialty TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_archived_user_girls_user ON archived_user_girls(user_id);
+    CREATE TABLE IF NOT EXISTS archived_stamina_prefs (
+        user_id INTEGER PRIMARY KEY,
+        notify INTEGER NOT NULL DEFAULT 0,
+        auto_rotate INTEGER NOT NULL DEFAULT 0,
+        rest_below REAL NOT NULL DEFAULT 25,
+        work_above REAL NOT NULL DEFAULT 80
+    );
+    CREATE TABLE IF NOT EXISTS archived_agency_history (
+        user_id INTEGER PRIMARY KEY,
+        data BLOB NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS guild_members (
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY(guild_id, user_id)
+    );
+    CREATE TABLE IF NOT EXISTS bot_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
     """)
     # migrations (ignore if already applied)
     try:
@@ -63,17 +274,178 @@ def init_db():
         )
     except sqlite3.OperationalError:
         pass
+    try:
+        cur.execute("ALTER TABLE users ADD COLUMN restored_at INTEGER NOT NULL DEFAULT 0")
+    except sqlite3.OperationalError:
+        pass
+    cur.executescript("""
+    CREATE INDEX IF NOT EXISTS idx_user_girls_rarity ON user_girls(user_id, rarity);
+    CREATE INDEX IF NOT EXISTS idx_user_girls_specialty ON user_girls(user_id, specialty COLLATE NOCASE);
+    CREATE INDEX IF NOT EXISTS idx_user_girls_level ON user_girls(user_id, level);
+    CREATE INDEX IF NOT EXISTS idx_user_girls_working ON user_girls(user_id, is_working);
+    """)
+    _init_roster_search(cur)
+    # Planner statistics let roster filters pick the matching index; the
+    # analysis limit keeps this cheap on big tables.
+    cur.execute("PRAGMA analysis_limit=1000")
+    cur.execute("ANALYZE")
+    # Seed leaderboard stats once for agencies that predate the table.
+    if cur.execute("SELECT 1 FROM agency_stats LIMIT 1").fetchone() is None:
+        cur.execute(
+            """
+            INSERT INTO agency_stats(user_id, money, fans, level, updated_at)
+            SELECT u.user_id, u.money, COALESCE(SUM(g.fans), 0), COALESCE(MAX(g.level), 0), u.last_tick
+            FROM users u LEFT JOIN user_girls g ON g.user_id = u.user_id
+            GROUP BY u.user_id
+            """
+        )
+    # Open the ledger (services.ledger) for balances it has no events for.
+    cur.execute(
+        """
+        INSERT INTO economy_ledger(user_id, ts, kind, amount, balance)
+        SELECT u.user_id, u.last_tick, 'opening', u.money, u.money FROM users u
+        WHERE u.money != 0 AND NOT EXISTS (SELECT 1 FROM economy_ledger l WHERE l.user_id = u.user_id)
+        """
+    )
     con.commit()
-    con.close()
 
-def ensure_user(user_id: int):
+_INITIALISED_PATH = None
+
+def init_db_once() -> bool:
+    """Run :func:`init_db` unless it already ran for this database; ``True`` if it ran."""
+    if _INITIALISED_PATH == DB_PATH:
+        return False
+    init_db()
+    return True
+
+def get_meta(key: str) -> Any:
     con = db()
-    cur = con.cursor()
-    cur.execute("SELECT 1 FROM users WHERE user_id=?", (user_id,))
-    if not cur.fetchone():
-        cur.execute(
-            "INSERT INTO users(user_id, money, last_tick, starter_claimed) VALUES(?,?,?,?)",
-            (user_id, 0, now_ts(), 0),
+    try:
+        row = con.execute("SELECT value FROM bot_meta WHERE key=?", (key,)).fetchone()
+    finally:
+        con.close()
+    return row["value"] if row else None
+
+def set_meta(key: str, value: str) -> None:
+    con = db()
+    try:
+        con.execute(
+            "INSERT INTO bot_meta(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+            (key, value),
         )
         con.commit()
-    con.close()
+    finally:
+        con.close()
+
+FTS_ENABLED = False
+
+def _init_roster_search(cur: sqlite3.Cursor) -> None:
+    """Create the name/specialty FTS5 index over ``user_girls`` when available.
+
+    ``user_id`` is indexed as a token so a search only visits the caller's
+    roster; catalog names are shared by every owner.  The triggers only fire
+    for owner/name/specialty changes, so tick updates never touch the index.  Without FTS5 roster search falls back to ``LIKE``.
+    """
+    global FTS_ENABLED
+    exists = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='user_girls_fts'"
+    ).fetchone()
+    try:
+        cur.executescript("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS user_girls_fts USING fts5(
+            user_id, name, specialty, content='user_girls', content_rowid='id'
+        );
+        CREATE TRIGGER IF NOT EXISTS user_girls_fts_ai AFTER INSERT ON user_girls BEGIN
+            INSERT INTO user_girls_fts(rowid, user_id, name, specialty)
+            VALUES (new.id, new.user_id, new.name, new.specialty);
+        END;
+        CREATE TRIGGER IF NOT EXISTS user_girls_fts_ad AFTER DELETE ON user_girls BEGIN
+            INSERT INTO user_girls_fts(user_girls_fts, rowid, user_id, name, specialty)
+            VALUES ('delete', old.id, old.user_id, old.name, old.specialty);
+        END;
+        CREATE TRIGGER IF NOT EXISTS user_girls_fts_au AFTER UPDATE OF user_id, name, specialty ON user_girls BEGIN
+            INSERT INTO user_girls_fts(user_girls_fts, rowid, user_id, name, specialty)
+            VALUES ('delete', old.id, old.user_id, old.name, old.specialty);
+            INSERT INTO user_girls_fts(rowid, user_id, name, specialty)
+            VALUES (new.id, new.user_id, new.name, new.specialty);
+        END;
+        """)
+    except sqlite3.OperationalError as e:
+        print("Roster search index unavailable, using LIKE:", e)
+        FTS_ENABLED = False
+        return
+    if not exists:
+        cur.execute("INSERT INTO user_girls_fts(user_girls_fts) VALUES('rebuild')")
+    FTS_ENABLED = True
+
+# -- archive -------------------------------------------------------------
+#
+# Agencies nobody has played for a long time (see services.archive) move
+# out of the hot tables into ``archived_*`` copies in the same file, so
+# settlement, roster and backup queries walk smaller B-trees.  Leaderboard
+# stats and the economy ledger stay where they are.  The agency's next
+# command moves it back: Storage.ensure_agency calls restore_agency.
+
+# Hot table -> its archive copy, parents first.
+ARCHIVE_TABLES: Dict[str, str] = {
+    "users": "archived_users",
+    "user_girls": "archived_user_girls",
+    "stamina_prefs": "archived_stamina_prefs",
+    "agency_history": "archived_agency_history",
+}
+
+# Agencies (``u``) that may be archived: no settlement or restore since the
+# cutoff and no stamina alerts or auto-rotation, which need the hot rows.
+# A restored agency keeps its old ``last_tick`` until its first settlement,
+# so ``restored_at`` keeps the next run from archiving it straight back.
+ARCHIVE_IDLE = """
+    MAX(u.last_tick, u.restored_at) < ? AND NOT EXISTS (
+        SELECT 1 FROM stamina_prefs p WHERE p.user_id = u.user_id AND (p.notify OR p.auto_rotate)
+    )
+"""
+
+def _shared_columns(cur: sqlite3.Cursor, source: str, target: str) -> str:
+    # Roster ids are not copied: each side numbers its own rows.
+    target_cols = {row[1] for row in cur.execute(f"PRAGMA table_info({target})").fetchall()}
+    source_cols = [row[1] for row in cur.execute(f"PRAGMA table_info({source})").fetchall()]
+    return ", ".join(c for c in source_cols if c in target_cols and c != "id")
+
+def archive_agencies(cur: sqlite3.Cursor, user_ids: List[int], cutoff: int, now: int) -> int:
+    """Move the agencies in ``user_ids`` that are still idle since
+    ``cutoff`` to the archive tables, in the caller's transaction.
+    Returns how many moved."""
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS archiving(user_id INTEGER PRIMARY KEY)")
+    cur.execute("DELETE FROM temp.archiving")
+    cur.executemany(
+        f"INSERT INTO temp.archiving(user_id) SELECT u.user_id FROM users u WHERE u.user_id=? AND {ARCHIVE_IDLE}",
+        [(user_id, cutoff) for user_id in user_ids],
+    )
+    moving = "user_id IN (SELECT user_id FROM temp.archiving)"
+    for hot, cold in ARCHIVE_TABLES.items():
+        cols = _shared_columns(cur, hot, cold)
+        cur.execute(f"INSERT OR REPLACE INTO {cold}({cols}) SELECT {cols} FROM {hot} WHERE {moving} ORDER BY rowid")
+    cur.execute(f"UPDATE archived_users SET archived_at=? WHERE {moving}", (now,))
+    # Children first: the agency tables reference users(user_id).
+    for hot in reversed(list(ARCHIVE_TABLES)):
+        cur.execute(f"DELETE FROM {hot} WHERE {moving}")
+    return cur.execute("SELECT COUNT(*) FROM temp.archiving").fetchone()[0]
+
+def restore_agency(cur: sqlite3.Cursor, user_id: int) -> bool:
+    """Move ``user_id``'s agency back out of the archive tables, in the
+    caller's transaction.  ``False`` if it was not archived.
+
+    Girls get new roster ids.  Rows the agency already has in a hot table
+    win over archived ones.  ``last_tick`` is kept, so the next settlement
+    pays the time spent archived; ``restored_at`` is set instead.
+    """
+    if cur.execute("SELECT 1 FROM users WHERE user_id=?", (user_id,)).fetchone():
+        return False
+    if not cur.execute("SELECT 1 FROM archived_users WHERE user_id=?", (user_id,)).fetchone():
+        return False
+    for hot, cold in ARCHIVE_TABLES.items():
+        cols = _shared_columns(cur, cold, hot)
+        cur.execute(f"INSERT OR IGNORE INTO {hot}({cols}) SELECT {cols} FROM {cold} WHERE user_id=? ORDER BY rowid", (user_id,))
+    cur.execute("UPDATE users SET restored_at=? WHERE user_id=?", (now_ts(), user_id))
+    for cold in reversed(list(ARCHIVE_TABLES.values())):
+        cur.execute(f"DELETE FROM {cold} WHERE user_id=?", (user_id,))
+    return True
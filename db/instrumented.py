@@ -0,0 +1,61 @@
+"""SQLite connection that records statement counts and durations.
+
+Install with ``set_connection_factory(InstrumentedConnection)``; every
+``db()`` connection then reports to :mod:`services.metrics`, labelled by the
+statement's leading verb (``SELECT``, ``UPDATE`` …) to keep cardinality low.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import time
+from typing import Any, Callable
+
+from services.metrics import SQL_BUCKETS, counter, histogram
+
+SQL_STATEMENTS = counter("idol_sql_statements_total", "SQL statements executed via db()", ("verb",))
+SQL_SECONDS = histogram("idol_sql_seconds", "SQL statement duration via db()", ("verb",), buckets=SQL_BUCKETS)
+SQL_ERRORS = counter("idol_sql_errors_total", "SQL statements that raised", ("verb",))
+
+
+def _verb(sql: Any) -> str:
+    text = str(sql).lstrip()
+    head = text.split(None, 1)[0] if text else ""
+    return head.upper() or "UNKNOWN"
+
+
+def _timed(verb: str, fn: Callable[..., Any], *args: Any) -> Any:
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    except sqlite3.Error:
+        SQL_ERRORS.labels(verb).inc()
+        raise
+    finally:
+        SQL_SECONDS.labels(verb).observe(time.perf_counter() - started)
+        SQL_STATEMENTS.labels(verb).inc()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql: str, *args: Any) -> sqlite3.Cursor:  # type: ignore[override]
+        return _timed(_verb(sql), super().execute, sql, *args)
+
+    def executemany(self, sql: str, *args: Any) -> sqlite3.Cursor:  # type: ignore[override]
+        return _timed(_verb(sql), super().executemany, sql, *args)
+
+    def executescript(self, sql: str) -> sqlite3.Cursor:  # type: ignore[override]
+        return _timed("SCRIPT", super().executescript, sql)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory: Any = InstrumentedCursor) -> sqlite3.Cursor:  # type: ignore[override]
+        return super().cursor(factory)
+
+    def execute(self, sql: str, *args: Any) -> sqlite3.Cursor:  # type: ignore[override]
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql: str, *args: Any) -> sqlite3.Cursor:  # type: ignore[override]
+        return self.cursor().executemany(sql, *args)
+
+    def commit(self) -> None:
+        _timed("COMMIT", super().commit)
@@ -1,10 +1,27 @@
+"""Girl pool loader.
+
+``data/girls.json`` is parsed as a stream: entries are decoded one at a time
+and normalised in batches, so memory stays proportional to the batch rather
+than the raw document.  Local image references of a batch are probed
+together (optionally on a thread pool, see ``POOL_IO_WORKERS``) against roots
+that are resolved once per load.
+
+:func:`compile_pool` adds a pickled snapshot next to the JSON so unchanged
+catalogs skip parsing and validation on the next start.
+"""
+
 from __future__ import annotations
 
+import hashlib
 import json
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from typing import IO, Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
-from services.image_paths import allowed_roots, is_within_allowed
+from services.image_paths import allowed_roots
 
 ALLOWED_RARITIES: Sequence[str] = ("N", "R", "SR", "SSR", "UR")
 
@@ -17,56 +34,12 @@ def _coerce_float(value: Any, default: float, warnings: List[str], context: str)
         return default
 
 
-def _resolve_image(
-    e: Dict[str, Any], base_dir: Path, warnings: List[str]
-) -> tuple[Optional[str], Optional[str]]:
-    raw = e.get("image") or e.get("image_path") or e.get("image_url")
-    if raw is None:
-        return None, None
-    raw_str = str(raw).strip()
-    if not raw_str:
-        return None, None
-    lower = raw_str.lower()
-    if lower.startswith("http://") or lower.startswith("https://"):
-        return raw_str, None
-    candidate = Path(raw_str).expanduser()
-    base_dir_resolved = base_dir.resolve()
-    search_roots: List[Path] = allowed_roots(
-        base_dir_resolved / "girls_images", base_dir_resolved
-    )
-
-    if candidate.is_absolute():
-        resolved = candidate.resolve()
-        if not is_within_allowed(resolved, search_roots):
-            warnings.append(
-                f"Image path for '{e.get('name', '?')}' outside allowed directories: {resolved}"
-            )
-            return None, None
-        if not resolved.exists():
-            warnings.append(
-                f"Image file not found for '{e.get('name', '?')}': {resolved}"
-            )
-            return None, None
-        return None, str(resolved)
+def _normalise_entry(raw: Any, warnings: List[str], index: int) -> Optional[Tuple[Dict[str, Any], str]]:
+    """Validate the scalar fields of ``raw``; returns the entry and its image ref.
 
-    for root in search_roots:
-        attempt = (root / candidate).resolve()
-        if not is_within_allowed(attempt, search_roots):
-            continue
-        if attempt.exists():
-            return None, str(attempt)
-
-    target_root = search_roots[0] if search_roots else base_dir_resolved
-    fallback = (target_root / candidate).resolve()
-    warnings.append(
-        f"Image file not found for '{e.get('name', '?')}': {fallback}"
-    )
-    return None, None
-
-
-def _normalise_entry(
-    raw: Any, base_dir: Path, warnings: List[str], index: int
-) -> Optional[Dict[str, Any]]:
+    Image references are resolved later, a whole batch at a time, by
+    :class:`_ImageResolver`.
+    """
     if not isinstance(raw, dict):
         warnings.append(f"Skipping entry #{index + 1}: expected object, got {type(raw).__name__}")
         return None
@@ -84,17 +57,19 @@ def _normalise_entry(
     income = _coerce_float(raw.get("income"), 5.0, warnings, f"{name}: income")
     popularity = _coerce_float(raw.get("popularity"), 100.0, warnings, f"{name}: popularity")
     specialty = str(raw.get("specialty") or "-").strip() or "-"
-    image_url, image_path = _resolve_image(raw, base_dir, warnings)
+    image_ref = raw.get("image") or raw.get("image_path") or raw.get("image_url")
+    image_ref = str(image_ref).strip() if image_ref is not None else ""
 
-    return {
+    entry = {
         "name": name,
         "rarity": rarity,
         "income": income,
         "popularity": popularity,
         "specialty": specialty,
-        "image_url": image_url,
-        "image_path": image_path,
+        "image_url": None,
+        "image_path": None,
     }
+    return entry, image_ref
 
 
 def _dedupe(entries: Sequence[Dict[str, Any]], warnings: List[str]) -> List[Dict[str, Any]]:
@@ -110,35 +85,497 @@ def _dedupe(entries: Sequence[Dict[str, Any]], warnings: List[str]) -> List[Dict
     return [seen[name] for name in order]
 
 
-def load_pool(path: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+class PoolFormatError(ValueError):
+    """Raised when the pool document is not a JSON array."""
+
+
+def iter_json_array(fp: IO[str], chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """Yield the elements of a top-level JSON array without loading it whole."""
+
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        if pos > len(buf) // 2:
+            buf, pos = buf[pos:], 0
+        buf += chunk
+        return True
+
+    def skip_ws() -> bool:
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf):
+                return True
+            if not fill():
+                return False
+
+    def close() -> None:
+        # Like json.load, reject anything but whitespace after the array, so
+        # a concatenated or damaged file is not half loaded.
+        nonlocal pos
+        pos += 1
+        if skip_ws():
+            raise PoolFormatError("girls.json has extra data after the closing ']'")
+
+    if not skip_ws() or buf[pos] != "[":
+        raise PoolFormatError("girls.json root must be a list of entries")
+    pos += 1
+    if not skip_ws():
+        raise json.JSONDecodeError("Unterminated array", buf, pos)
+    if buf[pos] == "]":
+        close()
+        return
+    while True:
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if fill():
+                    continue
+                raise
+            # A number cut by the chunk boundary still decodes ("2." -> 2), so
+            # numbers need to be followed by a delimiter before we trust them.
+            if (
+                isinstance(value, (int, float))
+                and (end == len(buf) or buf[end] in ".eE+-0123456789")
+                and fill()
+            ):
+                continue
+            break
+        pos = end
+        yield value
+        if not skip_ws():
+            raise json.JSONDecodeError("Unterminated array", buf, pos)
+        if buf[pos] == ",":
+            pos += 1
+            if not skip_ws():
+                raise json.JSONDecodeError("Unterminated array", buf, pos)
+            continue
+        if buf[pos] == "]":
+            close()
+            return
+        raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+
+
+def _within(path: str, roots: Sequence[str]) -> bool:
+    for root in roots:
+        if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+            return True
+    return False
+
+
+def _mtime(path: str) -> Optional[int]:
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        return [], "girls.json not found"
-    except Exception as ex:  # pragma: no cover - defensive guard
-        return [], f"Error loading JSON: {ex}"
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _list_dir(path: str) -> Tuple[Optional[int], Optional[Dict[str, bool]]]:
+    # Stamped before listing, so a change during the scan fails the stamp.
+    stamp = _mtime(path)
+    try:
+        with os.scandir(path) as it:
+            return stamp, {entry.name: entry.is_symlink() for entry in it}
+    except OSError:
+        return stamp, None
+
+
+class _ImageResolver:
+    """Resolves local image references for a whole batch of entries at once.
+
+    Candidates are matched against one ``scandir`` listing per directory
+    rather than a ``stat`` per file.  Containment is checked lexically for
+    every candidate and on the real path for symlinks and nested folders,
+    which keeps the guarantees of :func:`services.image_paths.is_within_allowed`.
+    """
+
+    def __init__(self, base_dir: Path, io_workers: int = 0) -> None:
+        base = base_dir.resolve()
+        self.roots = [str(root) for root in allowed_roots(base / "girls_images", base)]
+        self.fallback_root = self.roots[0] if self.roots else str(base)
+        self._root_set = set(self.roots)
+        self._listings: Dict[str, Optional[Dict[str, bool]]] = {}
+        # Every directory a result depends on -> its mtime when looked at.
+        self.stamps: Dict[str, Optional[int]] = {}
+        self.io_workers = io_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # raw reference -> (image_url, image_path, problem, problem_path)
+        self._cache: Dict[str, Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]] = {}
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _scan_dirs(self, dirs: Sequence[str]) -> None:
+        """List every unseen directory once: name -> ``True`` if a symlink."""
+
+        todo = [d for d in dirs if d not in self._listings]
+        if not todo:
+            return
+        if self.io_workers > 0 and len(todo) > 1:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.io_workers, thread_name_prefix="pool-io")
+            listings = self._executor.map(_list_dir, todo)
+        else:
+            listings = map(_list_dir, todo)
+        for path, (stamp, listing) in zip(todo, listings):
+            self.stamps[path] = stamp
+            self._listings[path] = listing
+
+    def _stamp_parent(self, path: str) -> None:
+        parent = os.path.dirname(path)
+        if parent not in self.stamps:
+            self.stamps[parent] = _mtime(parent)
+
+    def _attempt(self, root: str, candidate: str) -> Optional[str]:
+        if os.sep not in candidate and (not os.altsep or os.altsep not in candidate) and candidate not in (".", ".."):
+            # Plain file names cannot escape the root, skip normalisation.
+            return os.path.join(root, candidate)
+        attempt = os.path.normpath(os.path.join(root, candidate))
+        return attempt if _within(attempt, self.roots) else None
+
+    def resolve_batch(self, refs: Sequence[str]) -> None:
+        pending: Dict[str, str] = {}
+        for raw in refs:
+            if not raw or raw in self._cache or raw in pending:
+                continue
+            lower = raw.lower()
+            if lower.startswith("http://") or lower.startswith("https://"):
+                self._cache[raw] = (raw, None, None, None)
+                continue
+            candidate = os.path.expanduser(raw)
+            if os.path.isabs(candidate):
+                resolved = os.path.realpath(candidate)
+                if not _within(resolved, self.roots):
+                    self._cache[raw] = (None, None, "outside", resolved)
+                    continue
+                self._stamp_parent(resolved)
+                if not os.path.exists(resolved):
+                    self._cache[raw] = (None, None, "missing", resolved)
+                else:
+                    self._cache[raw] = (None, resolved, None, None)
+                continue
+            pending[raw] = candidate
+
+        # Probe root by root so a hit in an earlier root short-circuits the
+        # rest; each directory is listed once instead of stat-ing every file.
+        for root in self.roots:
+            if not pending:
+                break
+            attempts = {}
+            for raw, candidate in pending.items():
+                attempt = self._attempt(root, candidate)
+                if attempt is not None:
+                    attempts[raw] = attempt
+            self._scan_dirs(list({os.path.dirname(attempt) for attempt in attempts.values()}))
+            for raw, attempt in attempts.items():
+                parent, name = os.path.split(attempt)
+                listing = self._listings.get(parent)
+                if not listing or name not in listing:
+                    continue
+                if parent in self._root_set and not listing[name]:
+                    real = attempt
+                else:
+                    real = os.path.realpath(attempt)
+                    if not _within(real, self.roots):
+                        continue
+                    self._stamp_parent(real)
+                    if not os.path.exists(real):
+                        continue
+                self._cache[raw] = (None, real, None, None)
+                del pending[raw]
+
+        for raw, candidate in pending.items():
+            fallback = os.path.normpath(os.path.join(self.fallback_root, candidate))
+            self._cache[raw] = (None, None, "missing", fallback)
+
+    def apply(self, entry: Dict[str, Any], raw: str, warnings: List[str]) -> None:
+        if not raw:
+            return
+        image_url, image_path, problem, problem_path = self._cache[raw]
+        entry["image_url"] = image_url
+        entry["image_path"] = image_path
+        if problem == "outside":
+            warnings.append(
+                f"Image path for '{entry['name']}' outside allowed directories: {problem_path}"
+            )
+        elif problem == "missing":
+            warnings.append(f"Image file not found for '{entry['name']}': {problem_path}")
+
+
+def _io_workers_from_env() -> int:
+    try:
+        return max(0, int(os.getenv("POOL_IO_WORKERS", "0")))
+    except ValueError:
+        return 0
+
 
-    if not isinstance(data, list):
-        return [], "girls.json root must be a list of entries"
+def load_pool(
+    path: str,
+    batch_size: int = 2048,
+    io_workers: Optional[int] = None,
+    stamps: Optional[Dict[str, Optional[int]]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Parse and validate ``path``.
+
+    ``stamps``, if given, receives every folder image resolution looked at
+    and its mtime, for :func:`compile_pool`'s snapshot.
+    """
 
     base_dir = Path(path).resolve().parent
+    resolver = _ImageResolver(base_dir, _io_workers_from_env() if io_workers is None else io_workers)
     warnings: List[str] = []
     normalised: List[Dict[str, Any]] = []
-    for idx, raw in enumerate(data):
-        entry = _normalise_entry(raw, base_dir, warnings, idx)
-        if entry:
-            normalised.append(entry)
+    batch: List[Tuple[Optional[Tuple[Dict[str, Any], str]], List[str]]] = []
+
+    def flush() -> None:
+        resolver.resolve_batch([result[1] for result, _ in batch if result])
+        for result, entry_warnings in batch:
+            warnings.extend(entry_warnings)
+            if result:
+                entry, raw = result
+                resolver.apply(entry, raw, warnings)
+                normalised.append(entry)
+        batch.clear()
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for idx, raw in enumerate(iter_json_array(f)):
+                entry_warnings: List[str] = []
+                batch.append((_normalise_entry(raw, entry_warnings, idx), entry_warnings))
+                if len(batch) >= batch_size:
+                    flush()
+            flush()
+    except FileNotFoundError:
+        return [], "girls.json not found"
+    except PoolFormatError as ex:
+        return [], str(ex)
+    except Exception as ex:  # pragma: no cover - defensive guard
+        return [], f"Error loading JSON: {ex}"
+    finally:
+        resolver.close()
+        if stamps is not None:
+            stamps.update(resolver.stamps)
 
     cleaned = _dedupe(normalised, warnings)
 
     warn_text = None
     if warnings:
-        seen_messages: List[str] = []
-        for msg in warnings:
-            if msg not in seen_messages:
-                seen_messages.append(msg)
-        warn_text = "\n".join(seen_messages)
+        # dict preserves insertion order, so this dedupes in linear time.
+        warn_text = "\n".join(dict.fromkeys(warnings))
 
     return cleaned, warn_text
 
+
+# Bump whenever normalisation or image resolution changes so stale snapshots
+# are rebuilt instead of trusted.
+LOADER_VERSION = 3
+SNAPSHOT_SUFFIX = ".snapshot"
+SNAPSHOT_DIR = ".pool_cache"
+
+
+@dataclass
+class CompiledPool:
+    """A validated pool plus the lookup indexes the gacha needs."""
+
+    entries: List[Dict[str, Any]]
+    warnings: Optional[str]
+    source_hash: str = ""
+    by_name: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    by_rarity: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
+    from_snapshot: bool = False
+    # Folders image resolution listed or resolved into; see PoolWatcher.track.
+    folders: Tuple[str, ...] = ()
+
+    def __post_init__(self) -> None:
+        if not self.by_name and self.entries:
+            self.rebuild_indexes()
+
+    def rebuild_indexes(self) -> None:
+        self.by_name = {entry["name"]: entry for entry in self.entries}
+        self.by_rarity = {}
+        for entry in self.entries:
+            self.by_rarity.setdefault(entry["rarity"], []).append(entry)
+
+    def apply_diff(self, new: "CompiledPool", diff: "PoolDiff") -> None:
+        """Move to ``new`` in place, touching only what ``diff`` reports.
+
+        Unchanged entries keep their identity, changed ones are updated in
+        place, and only the rarity buckets that gained or lost members are
+        rebuilt.
+        """
+
+        touched = set()
+        for name in diff.removed:
+            touched.add(self.by_name.pop(name)["rarity"])
+        for name, fields in diff.changed.items():
+            entry = self.by_name[name]
+            if "rarity" in fields:
+                touched.update((entry["rarity"], new.by_name[name]["rarity"]))
+            entry.update(new.by_name[name])
+        for name in diff.added:
+            entry = new.by_name[name]
+            self.by_name[name] = entry
+            touched.add(entry["rarity"])
+
+        self.entries = [self.by_name[entry["name"]] for entry in new.entries]
+        for rarity in touched:
+            bucket = [entry for entry in self.entries if entry["rarity"] == rarity]
+            if bucket:
+                self.by_rarity[rarity] = bucket
+            else:
+                self.by_rarity.pop(rarity, None)
+        self.warnings = new.warnings
+        self.source_hash = new.source_hash
+        self.folders = new.folders
+        self.from_snapshot = new.from_snapshot
+
+
+POOL_FIELDS: Sequence[str] = ("rarity", "income", "popularity", "specialty", "image_url", "image_path")
+
+
+@dataclass
+class PoolDiff:
+    """Names added, removed and changed (with the fields that differ)."""
+
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    changed: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    def field_counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for fields in self.changed.values():
+            for name in fields:
+                counts[name] = counts.get(name, 0) + 1
+        return counts
+
+
+def diff_pools(old: CompiledPool, new: CompiledPool) -> PoolDiff:
+    diff = PoolDiff()
+    for name, entry in new.by_name.items():
+        before = old.by_name.get(name)
+        if before is None:
+            diff.added.append(name)
+            continue
+        fields = tuple(key for key in POOL_FIELDS if before.get(key) != entry.get(key))
+        if fields:
+            diff.changed[name] = fields
+    diff.removed = [name for name in old.by_name if name not in new.by_name]
+    return diff
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _snapshot_key(path: str, source_hash: str) -> Tuple[Any, ...]:
+    # Root mtimes change whenever art is added, removed or renamed at the top
+    # level; nested folders are covered by the stamps stored with the pool.
+    base = Path(path).resolve().parent
+    roots = []
+    for root in allowed_roots(base / "girls_images", base):
+        try:
+            roots.append((str(root), os.stat(root).st_mtime_ns))
+        except OSError:
+            roots.append((str(root), None))
+    return (LOADER_VERSION, source_hash, tuple(roots))
+
+
+def snapshot_path(path: str) -> Path:
+    # Kept in a subdirectory: writing next to girls.json would bump the mtime
+    # of the directory the key depends on and invalidate the fresh snapshot.
+    source = Path(path)
+    return source.parent / SNAPSHOT_DIR / (source.name + SNAPSHOT_SUFFIX)
+
+
+def _read_snapshot(target: Path, key: Tuple[Any, ...]) -> Optional[CompiledPool]:
+    try:
+        with open(target, "rb") as f:
+            header = pickle.load(f)
+            if header != key:
+                return None
+            stamps = pickle.load(f)
+            # Art added, removed or renamed in any folder images were
+            # resolved from bumps that folder's mtime.
+            if any(_mtime(folder) != stamp for folder, stamp in stamps.items()):
+                return None
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as ex:
+        print(f"Ignoring unreadable pool snapshot {target}: {ex}")
+        return None
+
+
+def _write_snapshot(
+    target: Path, key: Tuple[Any, ...], stamps: Dict[str, Optional[int]], pool: CompiledPool
+) -> None:
+    tmp = target.with_name(target.name + ".tmp")
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(key, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(stamps, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(pool, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, target)
+    except OSError as ex:
+        print(f"Could not write pool snapshot {target}: {ex}")
+
+
+def compile_pool(path: str, use_snapshot: Optional[bool] = None) -> CompiledPool:
+    """Load ``path`` through a compiled snapshot stored next to it.
+
+    The snapshot (``.pool_cache/girls.json.snapshot``) holds the validated entries,
+    resolved image paths, rarity index and warnings, keyed by the JSON's
+    content hash, :data:`LOADER_VERSION` and the image roots, and is only
+    used while every folder images were resolved from has the mtime it had
+    when the pool was compiled.  When both hold, validation and filesystem
+    probing are skipped.  Set
+    ``POOL_SNAPSHOT=0`` to always parse from scratch.
+    """
+
+    if use_snapshot is None:
+        use_snapshot = os.getenv("POOL_SNAPSHOT", "1") != "0"
+    try:
+        source_hash = _hash_file(path)
+    except FileNotFoundError:
+        return CompiledPool([], "girls.json not found")
+
+    target = snapshot_path(path)
+    if use_snapshot:
+        try:
+            target.parent.mkdir(exist_ok=True)
+        except OSError:
+            use_snapshot = False
+    key = _snapshot_key(path, source_hash)
+    if use_snapshot:
+        cached = _read_snapshot(target, key)
+        if cached is not None:
+            cached.from_snapshot = True
+            return cached
+
+    stamps: Dict[str, Optional[int]] = {}
+    entries, warn = load_pool(path, stamps=stamps)
+    pool = CompiledPool(entries, warn, source_hash, folders=tuple(stamps))
+    if use_snapshot and entries:
+        _write_snapshot(target, key, stamps, pool)
+    return pool
@@ -0,0 +1,196 @@
+"""Archiving of idle agencies, so the hot tables only hold players who play.
+
+Most agencies stop being played at some point, but their ``users`` and
+``user_girls`` rows stay in the B-trees that every settlement, roster
+query and export walks.  :func:`archive_idle` moves agencies with no
+settlement or restore for ``ARCHIVE_IDLE_DAYS`` into the ``archived_*``
+tables of the same file (see :func:`db.database.archive_agencies`).
+Agencies with stamina alerts or auto-rotation stay hot.  The agency's next
+command brings it back through ``Storage.ensure_agency``, before anything
+reads it.
+
+Each partition is scanned in keyset-paged reads, and agencies move
+``ARCHIVE_BATCH`` per transaction with a pause between transactions, so a
+run never holds the write lock for long.  A transaction re-checks the clock,
+so an agency settled since the scan stays.  :class:`Archiver` runs this
+every ``ARCHIVE_INTERVAL`` seconds in the primary process;
+``python -m tools.archive`` runs it by hand and reports table sizes and
+query latency before and after.
+
+Configuration (environment):
+
+- ``ARCHIVE_IDLE_DAYS`` — days without a settlement after which an agency
+  is archived (default 90; ``0`` disables the archiver).
+- ``ARCHIVE_INTERVAL`` — seconds between runs (default 3600).
+- ``ARCHIVE_BATCH`` / ``ARCHIVE_PAUSE`` — agencies moved per transaction
+  (default 200) and seconds slept between transactions (default 0.05).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from db import database
+from db.database import ARCHIVE_IDLE, ARCHIVE_TABLES, partition_paths
+from services import ledger
+from services.metrics import counter, gauge, histogram
+
+ARCHIVED = "archived"
+RESTORED = "restored"
+SCAN_ROWS = 5000
+
+ARCHIVE_MOVES = counter(
+    "idol_archive_agencies_total", "Agencies moved into or back out of the archive tables", ("direction",)
+)
+ARCHIVE_BATCH_SECONDS = histogram(
+    "idol_archive_batch_seconds",
+    "Time one archive batch held the write lock",
+    buckets=(0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+# Refreshed after every run; counting on scrape would read the tables.
+_table_rows: Dict[Tuple[str], int] = {}
+ARCHIVE_TABLE_ROWS = gauge(
+    "idol_archive_table_rows", "Rows in the hot and archive tables after the last run", ("table",), fn=lambda: dict(_table_rows)
+)
+
+_SCAN = f"""
+    SELECT u.user_id, {ARCHIVE_IDLE} AS idle FROM users u
+    WHERE u.user_id > ? ORDER BY u.user_id LIMIT ?
+"""
+
+_running = threading.Lock()
+
+
+def idle_days() -> float:
+    return float(os.getenv("ARCHIVE_IDLE_DAYS", "90"))
+
+
+def archive_interval() -> float:
+    return float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+
+
+@dataclass
+class ArchiveReport:
+    scanned: int = 0
+    archived: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    max_pause: float = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"archived {self.archived} of {self.scanned} agencies in {self.batches} batches, "
+            f"{self.seconds:.2f}s, worst pause {self.max_pause * 1000:.1f}ms"
+        )
+
+
+def _move(con: sqlite3.Connection, user_ids: List[int], cutoff: int, now: int, report: ArchiveReport) -> None:
+    began = time.perf_counter()
+    moved = ledger.run_unit(con, lambda cur: database.archive_agencies(cur, user_ids, cutoff, now))
+    held = time.perf_counter() - began
+    ARCHIVE_BATCH_SECONDS.observe(held)
+    ARCHIVE_MOVES.labels(ARCHIVED).inc(moved)
+    report.batches += 1
+    report.archived += moved
+    report.max_pause = max(report.max_pause, held)
+
+
+def archive_idle(
+    days: Optional[float] = None,
+    batch: Optional[int] = None,
+    pause: Optional[float] = None,
+    sources: Optional[Sequence[Path]] = None,
+) -> ArchiveReport:
+    """Archive every agency idle for ``days`` in every partition."""
+
+    days = days if days is not None else idle_days()
+    batch = batch if batch is not None else int(os.getenv("ARCHIVE_BATCH", "200"))
+    pause = pause if pause is not None else float(os.getenv("ARCHIVE_PAUSE", "0.05"))
+    sources = list(sources) if sources is not None else partition_paths()
+    if days <= 0:
+        raise ValueError("The idle threshold must be a positive number of days.")
+    if not _running.acquire(blocking=False):
+        raise RuntimeError("An archive run is already in progress.")
+    try:
+        report = ArchiveReport()
+        started = time.perf_counter()
+        now = database.now_ts()
+        cutoff = int(now - days * 86400)
+        for path in sources:
+            con = database.connect(path)
+            try:
+                after: Optional[int] = -(1 << 63)
+                pending: List[int] = []
+                while after is not None:
+                    rows = con.execute(_SCAN, (cutoff, after, SCAN_ROWS)).fetchall()
+                    report.scanned += len(rows)
+                    pending += [row["user_id"] for row in rows if row["idle"]]
+                    after = rows[-1]["user_id"] if len(rows) == SCAN_ROWS else None
+                    while len(pending) >= batch or (after is None and pending):
+                        _move(con, pending[:batch], cutoff, now, report)
+                        pending = pending[batch:]
+                        if pause > 0:
+                            time.sleep(pause)
+            finally:
+                con.close()
+        report.seconds = time.perf_counter() - started
+        _table_rows.update({(table,): count for table, count in table_rows(sources).items()})
+    finally:
+        _running.release()
+    return report
+
+
+def table_rows(sources: Optional[Sequence[Path]] = None) -> Dict[str, int]:
+    """Rows in every hot table and its archive copy, over all partitions."""
+
+    counts = {table: 0 for pair in ARCHIVE_TABLES.items() for table in pair}
+    for path in sources if sources is not None else partition_paths():
+        con = database.connect(path)
+        try:
+            for table in counts:
+                counts[table] += con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        finally:
+            con.close()
+    return counts
+
+
+class Archiver:
+    """Runs :func:`archive_idle` every ``ARCHIVE_INTERVAL`` seconds."""
+
+    def __init__(self) -> None:
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(archive_interval())
+            try:
+                report = await asyncio.to_thread(archive_idle)
+                if report.archived:
+                    print(f"Archive: {report.summary()}")
+            except Exception as e:
+                print("Archive run failed:", e)
+
+
+_archiver: Optional[Archiver] = None
+
+
+def get_archiver() -> Archiver:
+    global _archiver
+    if _archiver is None:
+        _archiver = Archiver()
+    return _archiver
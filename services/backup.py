@@ -0,0 +1,285 @@
+"""Online snapshots and streaming exports of the game database.
+
+:func:`backup_database` copies every partition with SQLite's online backup
+API, a few pages per step.  Between steps the copy sleeps, so a step is the
+longest any bot command can be kept waiting for the write lock.  The report
+records that step time as ``max_pause``.  A copy restarts if another
+connection writes to the source.  When that happens repeatedly, the step
+size doubles, up to a single-step copy, so the backup always finishes.
+
+:func:`export_jsonl` writes one JSON line per agency, with its roster, to a
+gzip file.  Archived agencies (see :mod:`services.archive`) follow the
+others, marked ``"archived": true``.  It reads agencies in keyset-paged
+batches, so memory stays constant and each read is short.  A live export
+is consistent per agency: each batch reads agencies and rosters in one
+read transaction.  Export from a snapshot directory when a single
+point in time matters.
+
+Both run in a worker thread (``asyncio.to_thread``) and never touch the
+event loop.
+
+Configuration (environment):
+
+- ``BACKUP_DIR`` — where snapshots and exports go (default ``backups/``).
+- ``BACKUP_STEP_PAGES`` / ``BACKUP_STEP_PAUSE`` — pages copied per step
+  (default 256) and seconds slept between steps (default 0.005).
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from db import database
+from db.database import partition_map_path, partition_paths
+from services.metrics import counter, gauge, histogram
+
+BACKUP_STEP_SECONDS = histogram(
+    "idol_backup_step_seconds",
+    "Time the source database was held by one backup step or export batch",
+    ("kind",),
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+BACKUP_BYTES = counter("idol_backup_bytes_total", "Bytes written by snapshots and exports", ("kind",))
+BACKUP_LAST_SUCCESS = gauge("idol_backup_last_success_timestamp", "Unix time of the last finished backup", ("kind",))
+
+SNAPSHOT = "snapshot"
+EXPORT = "export"
+MAX_RESTARTS = 3
+
+_running = threading.Lock()
+
+
+def backup_dir() -> Path:
+    return Path(os.getenv("BACKUP_DIR", "backups"))
+
+
+def _stamp() -> str:
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+@dataclass
+class BackupReport:
+    kind: str
+    path: Path
+    bytes: int = 0
+    seconds: float = 0.0
+    steps: int = 0
+    max_pause: float = 0.0
+    restarts: int = 0
+    agencies: int = 0
+    girls: int = 0
+    files: List[Path] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second."""
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        what = f"{self.agencies} agencies, {self.girls} girls, " if self.kind == EXPORT else ""
+        restarts = f", {self.restarts} restarts" if self.restarts else ""
+        return (
+            f"{self.kind} → {self.path}: {what}{self.bytes / 1e6:.1f} MB in {self.seconds:.2f}s "
+            f"({self.throughput / 1e6:.1f} MB/s), {self.steps} steps, "
+            f"worst pause {self.max_pause * 1000:.1f}ms{restarts}"
+        )
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _copy_file(src: Path, dest: Path, pages: int, pause: float, report: BackupReport) -> None:
+    """Copy one database with ``Connection.backup``, ``pages`` at a time."""
+
+    restarts = 0
+    while True:
+        source = sqlite3.connect(src)
+        target = sqlite3.connect(dest)
+        last = [time.perf_counter(), None]
+
+        def progress(_status: int, remaining: int, _total: int) -> None:
+            nonlocal restarts
+            held = time.perf_counter() - last[0]
+            report.steps += 1
+            report.max_pause = max(report.max_pause, held)
+            BACKUP_STEP_SECONDS.labels(SNAPSHOT).observe(held)
+            # A foreign write restarts the copy from page one, so a step that
+            # did not bring ``remaining`` down was a restart.
+            if last[1] is not None and remaining >= last[1]:
+                restarts += 1
+                report.restarts += 1
+                if restarts > MAX_RESTARTS and pages > 0:
+                    raise _Restarted
+            last[1] = remaining
+            if remaining and pause > 0:
+                time.sleep(pause)
+            last[0] = time.perf_counter()
+
+        try:
+            source.backup(target, pages=pages, progress=progress)
+            return
+        except _Restarted:
+            # Too busy for small steps: halve the number of steps.
+            pages = -1 if pages >= 1 << 16 else pages * 2
+            restarts = 0
+            print(f"Backup of {src.name} kept restarting; retrying with {pages if pages > 0 else 'all'} pages per step")
+        finally:
+            target.close()
+            source.close()
+
+
+def backup_database(
+    dest_dir: Optional[Path] = None,
+    pages: Optional[int] = None,
+    pause: Optional[float] = None,
+    sources: Optional[Sequence[Path]] = None,
+) -> BackupReport:
+    """Snapshot every partition (and the partition map) into ``dest_dir``."""
+
+    pages = pages if pages is not None else int(os.getenv("BACKUP_STEP_PAGES", "256"))
+    pause = pause if pause is not None else float(os.getenv("BACKUP_STEP_PAUSE", "0.005"))
+    sources = list(sources) if sources is not None else partition_paths()
+    dest_dir = Path(dest_dir or backup_dir() / f"snapshot-{_stamp()}")
+    if not _running.acquire(blocking=False):
+        raise RuntimeError("A backup is already running.")
+    try:
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        report = BackupReport(SNAPSHOT, dest_dir)
+        started = time.perf_counter()
+        for src in sources:
+            dest = dest_dir / src.name
+            tmp = dest.with_name(dest.name + ".tmp")
+            tmp.unlink(missing_ok=True)
+            _copy_file(src, tmp, pages, pause, report)
+            os.replace(tmp, dest)
+            report.files.append(dest)
+            report.bytes += dest.stat().st_size
+        pmap = partition_map_path(sources[0] if sources else None)
+        if pmap.exists():
+            shutil.copy2(pmap, dest_dir / pmap.name)
+            report.files.append(dest_dir / pmap.name)
+        report.seconds = time.perf_counter() - started
+    finally:
+        _running.release()
+    BACKUP_BYTES.labels(SNAPSHOT).inc(report.bytes)
+    BACKUP_LAST_SUCCESS.labels(SNAPSHOT).set(time.time())
+    return report
+
+
+def snapshot_sources(path: Path) -> List[Path]:
+    """The database files of a snapshot directory or of a single database."""
+
+    if path.is_dir():
+        maps = sorted(path.glob("*.partitions.json"))
+        if maps:
+            return [path / name for name in database.PartitionMap.load(maps[0]).files]
+        return sorted(path.glob("*.db"))
+    pmap = partition_map_path(path)
+    if pmap.exists():
+        return [path.parent / name for name in database.PartitionMap.load(pmap).files]
+    return [path]
+
+
+def _iter_agencies(
+    con: sqlite3.Connection, batch: int, pause: float, report: BackupReport, archived: bool = False
+) -> Iterable[Dict[str, Any]]:
+    users_table, girls_table = ("archived_users", "archived_user_girls") if archived else ("users", "user_girls")
+    after: Optional[int] = None
+    while True:
+        began = time.perf_counter()
+        # Both reads share one read transaction, so no write lands between
+        # an agency's row and its roster.
+        con.execute("BEGIN")
+        try:
+            if after is None:
+                users = con.execute(
+                    f"SELECT user_id, money, last_tick, starter_claimed FROM {users_table} ORDER BY user_id LIMIT ?",
+                    (batch,),
+                ).fetchall()
+            else:
+                users = con.execute(
+                    f"SELECT user_id, money, last_tick, starter_claimed FROM {users_table} "
+                    "WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                    (after, batch),
+                ).fetchall()
+            girls = []
+            if users:
+                first, last = users[0]["user_id"], users[-1]["user_id"]
+                girls = con.execute(
+                    f"SELECT * FROM {girls_table} WHERE user_id BETWEEN ? AND ? ORDER BY user_id, id", (first, last)
+                ).fetchall()
+        finally:
+            con.execute("COMMIT")
+        if not users:
+            return
+        held = time.perf_counter() - began
+        report.steps += 1
+        report.max_pause = max(report.max_pause, held)
+        BACKUP_STEP_SECONDS.labels(EXPORT).observe(held)
+        rosters: Dict[int, List[Dict[str, Any]]] = {}
+        for girl in girls:
+            row = dict(girl)
+            rosters.setdefault(row.pop("user_id"), []).append(row)
+        for user in users:
+            agency = {**dict(user), "girls": rosters.get(user["user_id"], [])}
+            if archived:
+                agency["archived"] = True
+            yield agency
+        after = users[-1]["user_id"]
+        if pause > 0:
+            time.sleep(pause)
+
+
+def export_jsonl(
+    dest: Optional[Path] = None,
+    batch: int = 500,
+    pause: Optional[float] = None,
+    sources: Optional[Sequence[Path]] = None,
+) -> BackupReport:
+    """Stream every agency and its roster to gzipped JSON lines."""
+
+    pause = pause if pause is not None else float(os.getenv("BACKUP_STEP_PAUSE", "0.005"))
+    sources = list(sources) if sources is not None else partition_paths()
+    dest = Path(dest or backup_dir() / f"export-{_stamp()}.jsonl.gz")
+    if not _running.acquire(blocking=False):
+        raise RuntimeError("A backup is already running.")
+    try:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        report = BackupReport(EXPORT, dest)
+        tmp = dest.with_name(dest.name + ".tmp")
+        started = time.perf_counter()
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as out:
+            for src in sources:
+                con = database.connect(src)
+                try:
+                    # Snapshots taken before archiving existed have no archive tables.
+                    archive = con.execute(
+                        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='archived_users'"
+                    ).fetchone()
+                    for archived in (False, True) if archive else (False,):
+                        for agency in _iter_agencies(con, batch, pause, report, archived):
+                            out.write(json.dumps(agency, separators=(",", ":")))
+                            out.write("\n")
+                            report.agencies += 1
+                            report.girls += len(agency["girls"])
+                finally:
+                    con.close()
+        os.replace(tmp, dest)
+        report.seconds = time.perf_counter() - started
+        report.bytes = dest.stat().st_size
+        report.files.append(dest)
+    finally:
+        _running.release()
+    BACKUP_BYTES.labels(EXPORT).inc(report.bytes)
+    BACKUP_LAST_SUCCESS.labels(EXPORT).set(time.time())
+    return report
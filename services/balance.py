@@ -2,12 +2,15 @@
 
 from __future__ import annotations
 
-from decimal import Decimal, getcontext
-from typing import Any, Optional, Sequence, Tuple
+from decimal import Decimal, DefaultContext, getcontext
+from typing import Any, Dict, Optional, Sequence, Tuple
 
 # Experience math can grow extremely large (levels up to 9999) so we bump the
 # decimal precision high enough to retain accurate arithmetic even for very high
-# level requirements.
+# level requirements.  The context is per thread: DefaultContext seeds the
+# context of every thread that first touches Decimal after this import
+# (asyncio.to_thread workers, the ledger writer), getcontext() this one.
+DefaultContext.prec = 11000
 getcontext().prec = 11000
 
 # Probability weights for each rarity. Values are percentages that add up to 100.
@@ -23,6 +26,10 @@ RARITY_WEIGHTS: Sequence[Tuple[str, int]] = (
 GACHA_COST: int = 500
 DUP_CASHBACK: float = 0.50
 
+# What /start grants a new agency.
+STARTER_MONEY: int = 1000
+STARTER_GIRL: Dict[str, Any] = {"name": "Aya", "rarity": "N", "income": 5, "popularity": 100, "specialty": "Singer"}
+
 # Progression tuning.
 LEVEL_INCOME_GROWTH: float = 0.05
 MAX_GIRL_LEVEL: int = 9999
@@ -0,0 +1,72 @@
+"""This process's place in a multi-process deployment.
+
+``python -m bot.cluster`` starts N bot processes.  Each one gets a range of
+gateway shards (``SHARD_IDS`` out of ``SHARD_COUNT``) plus ``CLUSTER_INDEX``
+and ``CLUSTER_SIZE``.  Interactions reach whichever process holds the
+guild's shard, so any process may serve any player.  Background work that
+must run exactly once per agency, such as stamina alerts, is owned by one
+process, chosen from the agency's partition slot.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, List, Optional
+
+from db.database import partition_slot
+
+
+def cluster_size() -> int:
+    return max(1, int(os.getenv("CLUSTER_SIZE", "1")))
+
+
+def cluster_index() -> int:
+    return int(os.getenv("CLUSTER_INDEX", "0"))
+
+
+def clustered() -> bool:
+    return cluster_size() > 1
+
+
+def owns_agency(user_id: int) -> bool:
+    """Whether this process runs the background jobs for ``user_id``."""
+
+    return partition_slot(user_id) % cluster_size() == cluster_index()
+
+
+def parse_shard_ids(text: str) -> List[int]:
+    """``"0-3,8"`` -> ``[0, 1, 2, 3, 8]``."""
+
+    ids: List[int] = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        ids.extend(range(int(first), int(last or first) + 1))
+    return ids
+
+
+def shard_config() -> Optional[Dict[str, Any]]:
+    """``AutoShardedBot`` keyword arguments, or ``None`` to run unsharded.
+
+    ``SHARD_COUNT`` is a number or ``auto`` (Discord's recommendation);
+    ``SHARD_IDS`` limits this process to some of them.
+    """
+
+    count = os.getenv("SHARD_COUNT", "").strip().lower()
+    if not count:
+        return None
+    kwargs: Dict[str, Any] = {}
+    if count != "auto":
+        kwargs["shard_count"] = int(count)
+    ids = os.getenv("SHARD_IDS")
+    if ids:
+        kwargs["shard_ids"] = parse_shard_ids(ids)
+    return kwargs
+
+
+def is_primary() -> bool:
+    """The process that does once-per-deployment jobs such as command sync."""
+
+    return cluster_index() == 0
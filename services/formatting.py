@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Union
+from typing import Optional, Sequence, Union
 
 Number = Union[int, float]
 
@@ -44,3 +44,34 @@ def format_rate(value: Number, symbol: str = "$") -> str:
     """Format a per-second income rate with the currency symbol."""
 
     return f"{format_currency(value, symbol)}/s"
+
+
+SPARK_BLOCKS = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(values: Sequence[Optional[float]]) -> str:
+    """One block per value, scaled between the smallest and largest; ``None`` is a gap."""
+
+    known = [value for value in values if value is not None]
+    if not known:
+        return ""
+    low, high = min(known), max(known)
+    top = len(SPARK_BLOCKS) - 1
+    return "".join(
+        " " if value is None else SPARK_BLOCKS[round((value - low) / (high - low) * top) if high > low else 0]
+        for value in values
+    )
+
+
+def format_duration(seconds: Number) -> str:
+    """Render a duration as its two largest units, e.g. ``3d 4h`` or ``12m 5s``."""
+
+    remaining = max(0, int(round(seconds)))
+    parts = []
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60), ("s", 1)):
+        amount, remaining = divmod(remaining, size)
+        if amount or (unit == "s" and not parts):
+            parts.append(f"{amount}{unit}")
+        if len(parts) == 2:
+            break
+    return " ".join(parts)
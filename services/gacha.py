@@ -1,8 +1,11 @@
+import json
+import os
 import random
-from typing import Dict, Any, List, Tuple
+import sqlite3
+from typing import Dict, Any, List, Mapping, Optional, Sequence, Tuple
 
-from db.database import db
-from models.girl_pool import load_pool
+from db.database import each_partition, get_meta, set_meta
+from models.girl_pool import POOL_FIELDS, CompiledPool, PoolDiff
 from services.balance import RARITY_WEIGHTS, GACHA_COST, DUP_CASHBACK
 
 def rarity_roll() -> str:
@@ -14,10 +17,138 @@ def rarity_roll() -> str:
             return code
     return RARITY_WEIGHTS[-1][0]
 
-def pick_by_rarity(pool: List[Dict[str, Any]], rarity: str) -> Dict[str, Any]:
-    candidates = [g for g in pool if g["rarity"] == rarity] or pool
+def pick_by_rarity(
+    pool: List[Dict[str, Any]],
+    rarity: str,
+    by_rarity: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+) -> Dict[str, Any]:
+    if by_rarity is not None:
+        candidates = by_rarity.get(rarity) or pool
+    else:
+        candidates = [g for g in pool if g["rarity"] == rarity] or pool
     return random.choice(candidates)
 
 def rarity_emoji(r: str) -> str:
     mapping = {"N":"⭐", "R":"⭐⭐", "SR":"⭐⭐⭐", "SSR":"⭐⭐⭐⭐", "UR":"⭐⭐⭐⭐⭐"}
     return mapping.get(r, r)
+
+# Catalog fields /reload_pool may copy onto girls players already own.
+PROPAGATABLE_FIELDS: Sequence[str] = ("image", "specialty", "income", "popularity", "rarity")
+DEFAULT_PROPAGATE_FIELDS: Sequence[str] = ("image", "specialty")
+
+def propagate_fields() -> Tuple[str, ...]:
+    raw = os.getenv("POOL_PROPAGATE_FIELDS")
+    if raw is None:
+        return tuple(DEFAULT_PROPAGATE_FIELDS)
+    wanted = {part.strip().lower() for part in raw.split(",") if part.strip()}
+    unknown = sorted(wanted - set(PROPAGATABLE_FIELDS))
+    if unknown:
+        print("Ignoring unknown POOL_PROPAGATE_FIELDS entries:", ", ".join(unknown))
+    return tuple(f for f in PROPAGATABLE_FIELDS if f in wanted)
+
+def _change_row(
+    name: str, changed: Tuple[str, ...], before: Mapping[str, Any], after: Mapping[str, Any], fields: Sequence[str]
+) -> Optional[Tuple[Any, ...]]:
+    image = specialty = income_ratio = popularity = rarity = None
+    # A removed image is a change to NULL, so it needs its own flag.
+    image_changed = 0
+    if "image" in fields and ("image_url" in changed or "image_path" in changed):
+        image = after.get("image_url") or after.get("image_path")
+        image_changed = 1
+    if "specialty" in fields and "specialty" in changed:
+        specialty = after["specialty"]
+    # Owned income grows with level, so scale it instead of resetting it.
+    if "income" in fields and "income" in changed and before["income"]:
+        income_ratio = after["income"] / before["income"]
+    if "popularity" in fields and "popularity" in changed:
+        popularity = after["popularity"]
+    if "rarity" in fields and "rarity" in changed:
+        rarity = after["rarity"]
+    values = (image, specialty, income_ratio, popularity, rarity)
+    if not image_changed and all(v is None for v in values):
+        return None
+    return (name, image_changed, *values)
+
+# bot_meta key holding the catalog last copied onto owned girls.
+PROPAGATED_POOL_KEY = "propagated_pool"
+
+def propagated_pool() -> Optional[CompiledPool]:
+    """The catalog owned girls were last brought in line with, if recorded."""
+    raw = get_meta(PROPAGATED_POOL_KEY)
+    if raw is None:
+        return None
+    return CompiledPool(list(json.loads(raw).values()), None)
+
+def record_propagated_pool(pool: CompiledPool) -> None:
+    snapshot = {
+        name: {"name": name, **{key: entry.get(key) for key in POOL_FIELDS}} for name, entry in pool.by_name.items()
+    }
+    set_meta(PROPAGATED_POOL_KEY, json.dumps(snapshot, sort_keys=True))
+
+def propagate_pool_changes(
+    old: Mapping[str, Mapping[str, Any]],
+    new: Mapping[str, Mapping[str, Any]],
+    diff: PoolDiff,
+    fields: Optional[Sequence[str]] = None,
+) -> int:
+    """Copy changed catalog fields onto owned girls; returns rows updated.
+
+    ``fields`` defaults to ``POOL_PROPAGATE_FIELDS``.  The changes are staged
+    in a temp table and applied with a single UPDATE.
+    """
+    fields = propagate_fields() if fields is None else fields
+    rows = []
+    for name, changed in diff.changed.items():
+        row = _change_row(name, changed, old[name], new[name], fields)
+        if row is not None:
+            rows.append(row)
+    if not rows:
+        return 0
+
+    updated = 0
+    # Owned girls may live in several partitions; each gets the same UPDATE.
+    for con in each_partition():
+        updated += _apply_pool_changes(con, rows)
+    return updated
+
+def _apply_pool_changes(con: sqlite3.Connection, rows: Sequence[Tuple[Any, ...]]) -> int:
+    cur = con.cursor()
+    cur.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS pool_changes(
+            name TEXT PRIMARY KEY,
+            image_changed INTEGER NOT NULL,
+            image TEXT,
+            specialty TEXT,
+            income_ratio REAL,
+            popularity REAL,
+            rarity TEXT
+        )
+        """
+    )
+    cur.execute("DELETE FROM pool_changes")
+    cur.executemany("INSERT INTO pool_changes VALUES(?,?,?,?,?,?,?)", rows)
+    cur.execute(
+        """
+        UPDATE user_girls SET
+            image_url = CASE
+                WHEN (SELECT image_changed FROM pool_changes c WHERE c.name = user_girls.name)
+                THEN (SELECT image FROM pool_changes c WHERE c.name = user_girls.name)
+                ELSE image_url
+            END,
+            specialty = COALESCE((SELECT specialty FROM pool_changes c WHERE c.name = user_girls.name), specialty),
+            income = COALESCE(
+                ROUND(income * (SELECT income_ratio FROM pool_changes c WHERE c.name = user_girls.name), 5),
+                income
+            ),
+            popularity = COALESCE(
+                (SELECT popularity FROM pool_changes c WHERE c.name = user_girls.name), popularity
+            ),
+            rarity = COALESCE((SELECT rarity FROM pool_changes c WHERE c.name = user_girls.name), rarity)
+        WHERE name IN (SELECT name FROM pool_changes)
+        """
+    )
+    updated = cur.rowcount
+    cur.execute("DROP TABLE pool_changes")
+    con.commit()
+    return updated
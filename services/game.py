@@ -1,8 +1,11 @@
-from typing import Dict, Any, Tuple
+import asyncio
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
 
-from db.database import db, now_ts
+from db.database import now_ts
 from services.balance import (
     FANS_GAIN_PER_POP,
+    GACHA_COST,
     LEVEL_INCOME_GROWTH,
     PASSIVE_PER_FAN_PER_SEC,
     STAM_DOWN_SEC_PER_1,
@@ -11,80 +14,105 @@ from services.balance import (
     xp_to_decimal,
     xp_to_storage,
 )
+from services.leaderboard import get_leaderboards
+from services.metrics import DT_BUCKETS, counter, gauge, histogram
+from services.settlement import get_settlement_executor
+from storage import get_storage
+from storage.base import AgencyStats, GirlState, GirlUpdate, Storage
+
+TICK_DT = histogram("idol_tick_dt_seconds", "Elapsed seconds settled per tick", buckets=DT_BUCKETS)
+TICK_SECONDS = histogram("idol_tick_seconds", "Wall time spent settling a tick", ("mode",))
+TICK_GIRLS = counter("idol_tick_girls_total", "Girls processed by ticks")
+TICK_LEVEL_UPS = counter("idol_tick_level_ups_total", "Girls that levelled up during ticks")
+TICK_ROWS = counter("idol_tick_rows_written_total", "Rows written by ticks")
+TICK_CONFLICTS = counter("idol_tick_conflicts_total", "Ticks discarded because another settlement won")
+TICK_RETRIES = counter("idol_tick_retries_total", "Ticks recomputed because the roster changed while settling")
+SETTLEMENT_JOBS = counter(
+    "idol_settlement_jobs_total",
+    "Settlements by execution mode",
+    ("mode",),
+    fn=lambda: {
+        ("inline",): get_settlement_executor().inline_count,
+        ("offloaded",): get_settlement_executor().offload_count,
+        ("fallback",): get_settlement_executor().fallback_count,
+    },
+)
+SETTLEMENT_PENDING = gauge(
+    "idol_settlement_pending", "Offloaded settlements waiting for a worker", fn=lambda: get_settlement_executor().pending
+)
+SETTLEMENT_QUEUE_WAIT = gauge(
+    "idol_settlement_queue_wait_max_seconds",
+    "Longest time an offloaded settlement waited for a worker",
+    fn=lambda: get_settlement_executor().queue_wait_max,
+)
+
+# One full cycle: a rested girl works down to 0, then rests back to 100.
+WORK_PHASE_SEC = 100 * STAM_DOWN_SEC_PER_1
+REST_PHASE_SEC = 100 * STAM_UP_SEC_PER_1
+CYCLE_SEC = WORK_PHASE_SEC + REST_PHASE_SEC
+
 
 def stamina_tick(stamina: float, is_working: bool, dt: float) -> Tuple[float, bool, float, float]:
-    work_seconds = 0.0
-    rest_seconds = 0.0
+    """Stamina, work state and seconds spent working/resting after ``dt``.
+
+    Closed form: finish the current phase, skip whole work/rest cycles with
+    one division, then place the remainder inside the last cycle.  The cost
+    does not depend on ``dt``.
+    """
+
     s = stamina
-    w = is_working
     t = dt
-    while t > 0:
-        if w and s > 0:
-            can_spend = s * STAM_DOWN_SEC_PER_1
-            if t <= can_spend:
-                ds = t / STAM_DOWN_SEC_PER_1
-                s = max(0.0, s - ds)
-                work_seconds += t
-                t = 0
-            else:
-                s = 0.0
-                work_seconds += can_spend
-                t -= can_spend
-                w = False
-        else:
-            if s >= 100:
-                w = True
-                continue
-            need = (100 - s) * STAM_UP_SEC_PER_1
-            if t <= need:
-                ds = t / STAM_UP_SEC_PER_1
-                s = min(100.0, s + ds)
-                rest_seconds += t
-                t = 0
-                if s >= 100:
-                    w = True
-            else:
-                s = 100.0
-                rest_seconds += need
-                t -= need
-                w = True
-    return round(s, 3), w, work_seconds, rest_seconds
+    if t <= 0:
+        return round(s, 3), is_working, 0.0, 0.0
+    w = is_working
+    work_seconds = 0.0
+    rest_seconds = 0.0
 
-def compute_tick(user_id: int) -> Dict[str, Any]:
-    con = db()
-    cur = con.cursor()
-    cur.execute("SELECT money, last_tick FROM users WHERE user_id=?", (user_id,))
-    row = cur.fetchone()
-    if not row:
-        con.close()
-        return {"dt": 0}
+    if w and s > 0:
+        can_spend = s * STAM_DOWN_SEC_PER_1
+        if t <= can_spend:
+            return round(s - t / STAM_DOWN_SEC_PER_1, 3), True, t, 0.0
+        work_seconds = can_spend
+        t -= can_spend
+        s = 0.0
+        w = False
+    if s < 100:
+        need = (100 - s) * STAM_UP_SEC_PER_1
+        if t <= need:
+            s = min(100.0, s + t / STAM_UP_SEC_PER_1)
+            return round(s, 3), w or s >= 100, work_seconds, t
+        rest_seconds = need
+        t -= need
+
+    # Fully rested and working from here on.
+    cycles, t = divmod(t, CYCLE_SEC)
+    work_seconds += cycles * WORK_PHASE_SEC
+    rest_seconds += cycles * REST_PHASE_SEC
+    if t <= WORK_PHASE_SEC:
+        return round(100 - t / STAM_DOWN_SEC_PER_1, 3), True, work_seconds + t, rest_seconds
+    t -= WORK_PHASE_SEC
+    s = min(100.0, t / STAM_UP_SEC_PER_1)
+    return round(s, 3), s >= 100, work_seconds + WORK_PHASE_SEC, rest_seconds + t
+
+Settlement = Tuple[List[GirlUpdate], float, float, List[int]]
 
-    last = row["last_tick"]
-    now = now_ts()
-    dt = max(0, now - last)
-    if dt == 0:
-        con.close()
-        return {"dt": 0}
 
-    cur.execute(
-        "SELECT id, income, popularity, fans, stamina, is_working, level, xp FROM user_girls WHERE user_id=?",
-        (user_id,),
-    )
-    girls = cur.fetchall()
+def settle_girls(girls: Sequence[GirlState], dt: float) -> Settlement:
+    """Run the tick math for a roster without touching the database.
+
+    Operates on plain tuples only so the work can be shipped to a worker
+    process (see :mod:`services.settlement`).  Returns the per-girl update
+    tuples, the money earned by working girls, the roster's total fans and the
+    ids of girls that levelled up.
+    """
 
     money_gain = 0.0
     total_fans = 0.0
-    updates = []
-    leveled_up: list[int] = []
-
-    for g in girls:
-        income = float(g["income"])
-        pop = float(g["popularity"])
-        fans = float(g["fans"])
-        stamina = float(g["stamina"])
-        is_working = bool(g["is_working"])
-        level = int(g["level"])
-        xp = xp_to_decimal(g["xp"])
+    updates: List[GirlUpdate] = []
+    leveled_up: List[int] = []
+
+    for gid, income, pop, fans, stamina, is_working, level, raw_xp in girls:
+        xp = xp_to_decimal(raw_xp)
 
         new_stam, new_working, work_secs, rest_secs = stamina_tick(stamina, is_working, dt)
 
@@ -106,27 +134,226 @@ def compute_tick(user_id: int) -> Dict[str, Any]:
             xp = xp_to_decimal(0)
 
         if leveled:
-            leveled_up.append(g["id"])
+            leveled_up.append(gid)
 
-        updates.append((new_stam, int(new_working), fans, xp_to_storage(xp), level, income, g["id"]))
+        updates.append((new_stam, int(new_working), fans, xp_to_storage(xp), level, income, gid))
         total_fans += fans
 
+    return updates, money_gain, total_fans, leveled_up
+
+
+def _load_tick_state(store: Storage, user_id: int) -> Optional[Tuple[float, int, int, List[GirlState]]]:
+    state = store.tick_state(user_id)
+    if state is None:
+        return None
+    now = now_ts()
+    if now - state.last_tick <= 0:
+        return None
+    return state.money, state.last_tick, now, state.girls
+
+
+# Attempts at settling one tick when roster writes keep landing meanwhile.
+TICK_ATTEMPTS = 3
+
+
+def _apply_settlement(
+    store: Storage,
+    user_id: int,
+    money: float,
+    last: int,
+    now: int,
+    girls: Sequence[GirlState],
+    settlement: Settlement,
+) -> Optional[Dict[str, Any]]:
+    updates, money_gain, total_fans, leveled_up = settlement
+    dt = now - last
     passive_gain = total_fans * PASSIVE_PER_FAN_PER_SEC * dt
     money_gain += passive_gain
-    new_money = float(row["money"]) + money_gain
-
-    cur.execute("UPDATE users SET money=?, last_tick=? WHERE user_id=?", (new_money, now, user_id))
-    for s, w, f, xp_value, lvl, inc, gid in updates:
-        cur.execute(
-            "UPDATE user_girls SET stamina=?, is_working=?, fans=?, xp=?, level=?, income=? WHERE id=?",
-            (s, w, f, xp_value, lvl, inc, gid),
-        )
-    con.commit()
-    con.close()
+    new_money = money + money_gain
+    top_level = max((update[4] for update in updates), default=0)
+
+    # Only settle if nobody advanced the clock or changed the roster since the
+    # state was read; an offloaded settlement may have been overtaken by a
+    # concurrent command.  ``None`` tells the caller to read again.
+    if not store.apply_settlement(
+        user_id, last, now, money_gain, updates, AgencyStats(user_id, new_money, total_fans, top_level), girls
+    ):
+        return None
+    get_leaderboards().record(user_id, new_money, total_fans, top_level)
+    TICK_DT.observe(dt)
+    TICK_GIRLS.inc(len(updates))
+    TICK_LEVEL_UPS.inc(len(leveled_up))
+    TICK_ROWS.inc(2 + len(updates))
     return {
         "dt": dt,
         "money_gain": money_gain,
         "passive_gain": passive_gain,
         "total_fans": total_fans,
         "leveled_up": leveled_up,
+        "money": new_money,
     }
+
+
+def _should_settle(state: Optional[Tuple[float, int, int, List[GirlState]]], previous: Optional[int]) -> bool:
+    """Whether to settle ``state``, after a conflict on the settlement read
+    at ``previous`` if that is set."""
+
+    if previous is None:
+        return state is not None
+    if state is None or state[1] != previous:
+        # The clock moved: a concurrent settlement won and covered this tick.
+        TICK_CONFLICTS.inc()
+        return False
+    # Same clock, so a roster write (a toggle or rotation) got in between.
+    TICK_RETRIES.inc()
+    return True
+
+
+def compute_tick(user_id: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    store = get_storage()
+    try:
+        previous: Optional[int] = None
+        for _ in range(TICK_ATTEMPTS):
+            state = _load_tick_state(store, user_id)
+            if not _should_settle(state, previous) or state is None:
+                break
+            money, last, now, girls = state
+            result = _apply_settlement(store, user_id, money, last, now, girls, settle_girls(girls, now - last))
+            if result is not None:
+                return result
+            previous = last
+        return {"dt": 0}
+    finally:
+        TICK_SECONDS.labels("sync").observe(time.perf_counter() - started)
+
+
+async def compute_tick_async(user_id: int) -> Dict[str, Any]:
+    """Like :func:`compute_tick`, but large settlements run off the event loop.
+
+    The roster is read, and the write waits, on worker threads, so while a
+    write queues for a group commit (:mod:`services.ledger`) the loop can
+    serve the commands that join it.  A toggle or rotation that commits
+    meanwhile makes the write fail, and the tick is computed again from the
+    new roster.
+    """
+
+    started = time.perf_counter()
+    store = get_storage()
+    try:
+        previous: Optional[int] = None
+        for _ in range(TICK_ATTEMPTS):
+            state = await asyncio.to_thread(_load_tick_state, store, user_id)
+            if not _should_settle(state, previous) or state is None:
+                break
+            money, last, now, girls = state
+            settlement = await get_settlement_executor().run(settle_girls, girls, now - last)
+            result = await asyncio.to_thread(_apply_settlement, store, user_id, money, last, now, girls, settlement)
+            if result is not None:
+                return result
+            previous = last
+        return {"dt": 0}
+    finally:
+        TICK_SECONDS.labels("async").observe(time.perf_counter() - started)
+
+
+# -- projections ------------------------------------------------------------
+#
+# Everything below is read-only: it answers "what would a settlement at time
+# T produce" from the stored state, using the same closed-form tick math.
+
+FORECAST_MAX_SECONDS = 365 * 86400
+
+
+class Forecast(NamedTuple):
+    dt: float
+    money: float
+    money_gain: float
+    passive_gain: float
+    total_fans: float
+    updates: List[GirlUpdate]
+    leveled_up: List[int]
+
+
+def project_settlement(money: float, girls: Sequence[GirlState], dt: float) -> Forecast:
+    """The result of settling ``girls`` ``dt`` seconds after their last tick."""
+
+    updates, money_gain, total_fans, leveled_up = settle_girls(girls, dt)
+    passive_gain = total_fans * PASSIVE_PER_FAN_PER_SEC * dt
+    money_gain += passive_gain
+    return Forecast(dt, money + money_gain, money_gain, passive_gain, total_fans, updates, leveled_up)
+
+
+def projected_money(money: float, girls: Sequence[GirlState], dt: float) -> float:
+    """Money after a settlement ``dt`` seconds after the last tick.
+
+    The money-only part of :func:`project_settlement`: it skips the XP and
+    level bookkeeping, so it is cheap enough to evaluate repeatedly.
+    """
+
+    earned = 0.0
+    fans_total = 0.0
+    for _gid, income, pop, fans, stamina, is_working, _level, _xp in girls:
+        work_secs = stamina_tick(stamina, is_working, dt)[2]
+        earned += income * work_secs
+        fans_total += fans + pop * FANS_GAIN_PER_POP * work_secs
+    return money + earned + fans_total * PASSIVE_PER_FAN_PER_SEC * dt
+
+
+def time_until_money(
+    money: float,
+    girls: Sequence[GirlState],
+    target: float,
+    elapsed: float = 0.0,
+    horizon: float = FORECAST_MAX_SECONDS,
+) -> Optional[float]:
+    """Seconds from now until a settlement would reach ``target`` money.
+
+    ``elapsed`` is the time already passed since the last tick.  Projected
+    money only grows with time, so the answer is bracketed by doubling and
+    then bisected to one second.  ``None`` when it is out of reach within
+    ``horizon``.
+    """
+
+    if projected_money(money, girls, elapsed) >= target:
+        return 0.0
+    lo, hi = 0.0, 3600.0
+    while projected_money(money, girls, elapsed + hi) < target:
+        if hi >= horizon:
+            return None
+        lo, hi = hi, min(hi * 2, horizon)
+    while hi - lo > 1.0:
+        mid = (lo + hi) / 2
+        if projected_money(money, girls, elapsed + mid) >= target:
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+def _load_projection_state(user_id: int) -> Optional[Tuple[float, float, List[GirlState]]]:
+    state = get_storage().tick_state(user_id)
+    if state is None:
+        return None
+    elapsed = max(0.0, float(now_ts() - state.last_tick))
+    return state.money, elapsed, state.girls
+
+
+def forecast(user_id: int, seconds: float) -> Optional[Forecast]:
+    """Project the agency ``seconds`` from now without settling anything."""
+
+    state = _load_projection_state(user_id)
+    if state is None:
+        return None
+    money, elapsed, girls = state
+    return project_settlement(money, girls, elapsed + max(0.0, seconds))
+
+
+def time_until_pulls(user_id: int, pulls: int, horizon: float = FORECAST_MAX_SECONDS) -> Optional[float]:
+    """Seconds until the agency can afford ``pulls`` gacha scouts."""
+
+    state = _load_projection_state(user_id)
+    if state is None:
+        return None
+    money, elapsed, girls = state
+    return time_until_money(money, girls, pulls * GACHA_COST, elapsed, horizon)
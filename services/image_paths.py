@@ -10,8 +10,9 @@ consumers (pool loader, roster UI, gacha flow).
 from __future__ import annotations
 
 import os
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, List, Sequence
+from typing import Iterable, List, Optional, Sequence, Tuple
 
 
 def _normalise_roots(roots: Iterable[Path]) -> List[Path]:
@@ -52,3 +53,42 @@ def is_within_allowed(path: Path, roots: Sequence[Path]) -> bool:
         except ValueError:
             continue
     return False
+
+
+@lru_cache(maxsize=8192)
+def resolve_image_reference(ref: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Map a stored image reference to ``(remote_url, local_path)``.
+
+    Remote URLs pass through; local references resolve to the first existing
+    file inside the allowed roots.  Results are cached, so call
+    :func:`invalidate_image_cache` when image folders change.
+    """
+
+    if not ref:
+        return None, None
+    ref_str = str(ref).strip()
+    if not ref_str:
+        return None, None
+    lower = ref_str.lower()
+    if lower.startswith("http://") or lower.startswith("https://"):
+        return ref_str, None
+    candidate = Path(ref_str).expanduser()
+    roots = allowed_roots()
+    if candidate.is_absolute():
+        resolved = candidate.resolve()
+        if is_within_allowed(resolved, roots) and resolved.exists():
+            return None, str(resolved)
+        return None, None
+
+    for root in roots:
+        attempt = (root / candidate).resolve()
+        if not is_within_allowed(attempt, roots):
+            continue
+        if attempt.exists():
+            return None, str(attempt)
+
+    return None, None
+
+
+def invalidate_image_cache() -> None:
+    resolve_image_reference.cache_clear()
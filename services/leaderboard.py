@@ -0,0 +1,241 @@
+"""Materialised agency rankings for ``/leaderboard``.
+
+Every settled tick upserts the agency's money, total fans and best girl level
+into ``agency_stats`` (see :mod:`services.game`) and updates an in-memory
+:class:`RankIndex` per metric.  The indexes are loaded from that table on
+startup, so top-N and "my rank" lookups never scan ``users`` or
+``user_girls``.  Server boards filter the global index by the members seen in
+``guild_members``.
+"""
+
+from __future__ import annotations
+
+import heapq
+import threading
+from bisect import bisect_left, insort
+from typing import Collection, Dict, Iterable, List, Optional, Set, Tuple
+
+from db.database import db
+from services.metrics import gauge
+from storage import get_storage
+
+METRICS: Tuple[str, ...] = ("money", "fans", "level")
+
+Key = Tuple[float, int]
+Entry = Tuple[int, float]
+
+
+class RankIndex:
+    """Scores kept sorted (highest first) in fixed-size blocks.
+
+    Updates cost a bisect plus a list insert inside one block, and a rank is
+    the sum of the preceding block sizes, so both stay well under a
+    millisecond at a million entries.  Ties are broken by user id.
+    """
+
+    LOAD = 1000
+
+    def __init__(self, items: Iterable[Entry] = ()) -> None:
+        self._keys: Dict[int, Key] = {}
+        self._blocks: List[List[Key]] = []
+        self._maxes: List[Key] = []
+        self.build(items)
+
+    def build(self, items: Iterable[Entry]) -> None:
+        self._keys = {int(uid): (-float(score), int(uid)) for uid, score in items}
+        keys = sorted(self._keys.values())
+        self._blocks = [keys[i : i + self.LOAD] for i in range(0, len(keys), self.LOAD)]
+        self._maxes = [block[-1] for block in self._blocks]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._keys
+
+    def score(self, user_id: int) -> Optional[float]:
+        key = self._keys.get(user_id)
+        return -key[0] if key is not None else None
+
+    def update(self, user_id: int, score: float) -> None:
+        key = (-float(score), user_id)
+        old = self._keys.get(user_id)
+        if old == key:
+            return
+        if old is not None:
+            self._remove(old)
+        self._insert(key)
+        self._keys[user_id] = key
+
+    def discard(self, user_id: int) -> None:
+        key = self._keys.pop(user_id, None)
+        if key is not None:
+            self._remove(key)
+
+    def _insert(self, key: Key) -> None:
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+            return
+        i = bisect_left(self._maxes, key)
+        if i == len(self._blocks):
+            i -= 1
+            self._blocks[i].append(key)
+            self._maxes[i] = key
+        else:
+            insort(self._blocks[i], key)
+        block = self._blocks[i]
+        if len(block) > 2 * self.LOAD:
+            tail = block[self.LOAD :]
+            del block[self.LOAD :]
+            self._blocks.insert(i + 1, tail)
+            self._maxes[i] = block[-1]
+            self._maxes.insert(i + 1, tail[-1])
+
+    def _remove(self, key: Key) -> None:
+        i = bisect_left(self._maxes, key)
+        block = self._blocks[i]
+        del block[bisect_left(block, key)]
+        if block:
+            self._maxes[i] = block[-1]
+        else:
+            del self._blocks[i]
+            del self._maxes[i]
+
+    def top(self, n: int, offset: int = 0) -> List[Entry]:
+        out: List[Entry] = []
+        skip = offset
+        for block in self._blocks:
+            if skip >= len(block):
+                skip -= len(block)
+                continue
+            for neg, uid in block[skip : skip + n - len(out)]:
+                out.append((uid, -neg))
+            skip = 0
+            if len(out) >= n:
+                break
+        return out
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1-based position of ``user_id``, or ``None`` when unranked."""
+
+        key = self._keys.get(user_id)
+        if key is None:
+            return None
+        i = bisect_left(self._maxes, key)
+        before = sum(len(block) for block in self._blocks[:i])
+        return before + bisect_left(self._blocks[i], key) + 1
+
+    def subset(
+        self, user_ids: Collection[int], n: int, user_id: Optional[int] = None
+    ) -> Tuple[List[Entry], Optional[int], int]:
+        """Top ``n`` and the rank of ``user_id`` among ``user_ids`` only."""
+
+        keys = [self._keys[uid] for uid in user_ids if uid in self._keys]
+        top = [(uid, -neg) for neg, uid in heapq.nsmallest(n, keys)]
+        rank = None
+        own = self._keys.get(user_id) if user_id is not None else None
+        if own is not None and user_id in user_ids:
+            rank = sum(1 for key in keys if key < own) + 1
+        return top, rank, len(keys)
+
+
+class Leaderboards:
+    def __init__(self) -> None:
+        self.indexes: Dict[str, RankIndex] = {metric: RankIndex() for metric in METRICS}
+        self.members: Dict[int, Set[int]] = {}
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._loading = False
+        self._recent: Dict[int, Tuple[float, float, int]] = {}
+
+    def load(self) -> int:
+        """Rebuild the indexes from ``agency_stats``; returns the agency count.
+
+        Ticks recorded while the load runs are replayed on top of it.
+        """
+
+        with self._lock:
+            self._loading = True
+            self._recent = {}
+        try:
+            rows = list(get_storage().iter_agency_stats())
+            con = db()
+            try:
+                member_rows = con.execute("SELECT guild_id, user_id FROM guild_members").fetchall()
+            finally:
+                con.close()
+            indexes = {
+                metric: RankIndex((row.user_id, getattr(row, metric)) for row in rows) for metric in METRICS
+            }
+            members: Dict[int, Set[int]] = {}
+            for row in member_rows:
+                members.setdefault(row["guild_id"], set()).add(row["user_id"])
+        except Exception:
+            with self._lock:
+                self._loading = False
+            raise
+        with self._lock:
+            for user_id, values in self._recent.items():
+                for metric, value in zip(METRICS, values):
+                    indexes[metric].update(user_id, value)
+            self.indexes = indexes
+            for guild_id, users in self.members.items():
+                members.setdefault(guild_id, set()).update(users)
+            self.members = members
+            self._loading = False
+            self._recent = {}
+            self.loaded = True
+        return len(rows)
+
+    def record(self, user_id: int, money: float, fans: float, level: int) -> None:
+        with self._lock:
+            if self._loading:
+                self._recent[user_id] = (money, fans, level)
+            for metric, value in zip(METRICS, (money, fans, level)):
+                self.indexes[metric].update(user_id, value)
+
+    def add_member(self, guild_id: int, user_id: int) -> bool:
+        """Remember that ``user_id`` plays in ``guild_id``; ``True`` if new."""
+
+        users = self.members.setdefault(guild_id, set())
+        if user_id in users:
+            return False
+        users.add(user_id)
+        return True
+
+    def board(self, metric: str, n: int = 10, user_id: Optional[int] = None) -> Tuple[List[Entry], Optional[int], int]:
+        index = self.indexes[metric]
+        rank = index.rank(user_id) if user_id is not None else None
+        return index.top(n), rank, len(index)
+
+    def guild_board(
+        self, metric: str, guild_id: int, n: int = 10, user_id: Optional[int] = None
+    ) -> Tuple[List[Entry], Optional[int], int]:
+        return self.indexes[metric].subset(self.members.get(guild_id, ()), n, user_id)
+
+
+def remember_guild_member(guild_id: int, user_id: int) -> None:
+    if not get_leaderboards().add_member(guild_id, user_id):
+        return
+    con = db()
+    try:
+        con.execute("INSERT OR IGNORE INTO guild_members(guild_id, user_id) VALUES(?, ?)", (guild_id, user_id))
+        con.commit()
+    finally:
+        con.close()
+
+
+_leaderboards: Optional[Leaderboards] = None
+
+
+def get_leaderboards() -> Leaderboards:
+    global _leaderboards
+    if _leaderboards is None:
+        _leaderboards = Leaderboards()
+    return _leaderboards
+
+
+LEADERBOARD_AGENCIES = gauge(
+    "idol_leaderboard_agencies", "Agencies in the in-memory leaderboard", fn=lambda: len(get_leaderboards().indexes["money"])
+)
@@ -0,0 +1,214 @@
+"""Append-only economy ledger and the group-commit writer behind it.
+
+Every change to an agency's money is an event in ``economy_ledger``: tick
+payouts, scouting costs, duplicate cashbacks and starter grants, plus one
+``opening`` event for balances that predate the ledger.  ``users.money`` is
+a projection of those events, their running sum.  It is updated in the same
+transaction as each event, so reading a balance is still a one-row lookup.
+``python -m tools.ledger verify`` replays the ledger against it.
+
+Writes that move money go through a :class:`GroupCommitWriter`, one per
+database file.  A caller hands it a unit of work and blocks until the unit
+is durable.  A writer thread runs every unit that queued up in the meantime
+inside one transaction, each in its own savepoint so a failing unit does not
+take the others with it, and commits them all with one fsync.
+
+Configuration (environment):
+
+- ``LEDGER_GROUP_COMMIT`` — ``0`` commits every unit on the calling thread.
+- ``LEDGER_BATCH_MAX`` — most units per commit (default 256).
+- ``LEDGER_BATCH_WAIT`` — seconds the writer waits for more units after the
+  first one (default 0: a batch is whatever queued during the last commit).
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, TypeVar
+
+from db import database
+from services.metrics import counter, histogram
+
+T = TypeVar("T")
+
+TICK = "tick"
+PULL = "pull"
+CASHBACK = "cashback"
+STARTER = "starter"
+OPENING = "opening"
+KINDS = (TICK, PULL, CASHBACK, STARTER, OPENING)
+
+LEDGER_EVENTS = counter("idol_ledger_events_total", "Economy events appended to the ledger", ("kind",))
+LEDGER_COMMITS = counter("idol_ledger_commits_total", "Commits carrying money writes", ("mode",))
+LEDGER_BATCH = histogram(
+    "idol_ledger_batch_units",
+    "Units of work committed together by the group-commit writer",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+LEDGER_COMMIT_SECONDS = histogram(
+    "idol_ledger_commit_seconds",
+    "Time from BEGIN to COMMIT of one group-commit batch",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25),
+)
+
+
+class LedgerEvent(NamedTuple):
+    user_id: int
+    ts: int
+    kind: str
+    amount: float
+    balance: float  # the projected balance right after this event
+    ref: Optional[str] = None
+
+
+def record(cur: sqlite3.Cursor, user_id: int, kind: str, amount: float, ts: int, ref: Optional[str] = None) -> None:
+    """Append an event; call after ``users.money`` has been updated so the
+    row carries the new balance."""
+
+    cur.execute(
+        "INSERT INTO economy_ledger(user_id, ts, kind, amount, balance, ref) "
+        "SELECT ?, ?, ?, ?, money, ? FROM users WHERE user_id=?",
+        (user_id, ts, kind, amount, ref, user_id),
+    )
+    LEDGER_EVENTS.labels(kind).inc()
+
+
+def group_commit_enabled() -> bool:
+    return os.getenv("LEDGER_GROUP_COMMIT", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def run_unit(con: sqlite3.Connection, unit: Callable[[sqlite3.Cursor], T]) -> T:
+    """Run one unit in its own transaction on ``con`` (no group commit)."""
+
+    cur = con.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        result = unit(cur)
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+    LEDGER_COMMITS.labels("single").inc()
+    return result
+
+
+_Job = Tuple[Callable[[sqlite3.Cursor], Any], "Future[Any]"]
+
+
+class GroupCommitWriter:
+    """Runs units of work for one database file, many per commit."""
+
+    def __init__(self, path: Path, batch_max: Optional[int] = None, batch_wait: Optional[float] = None) -> None:
+        self.path = Path(path)
+        self.batch_max = batch_max if batch_max is not None else int(os.getenv("LEDGER_BATCH_MAX", "256"))
+        self.batch_wait = batch_wait if batch_wait is not None else float(os.getenv("LEDGER_BATCH_WAIT", "0"))
+        self.commits = 0
+        self.units = 0
+        self._queue: "queue.SimpleQueue[Optional[_Job]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=f"ledger-{self.path.name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, unit: Callable[[sqlite3.Cursor], T]) -> T:
+        """Run ``unit(cursor)`` in the next batch and return its result once
+        the batch is committed.  Exceptions from ``unit`` are re-raised here
+        and only undo that unit's writes."""
+
+        future: "Future[T]" = Future()
+        self._queue.put((unit, future))
+        return future.result()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self) -> Tuple[List[_Job], bool]:
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_max:
+            try:
+                remaining = deadline - time.perf_counter()
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                return batch, True
+            batch.append(job)
+        return batch, False
+
+    def _run(self) -> None:
+        con = database.connect(self.path)
+        try:
+            stopping = False
+            while not stopping:
+                batch, stopping = self._next_batch()
+                if batch:
+                    self._commit(con, batch)
+        finally:
+            con.close()
+
+    def _commit(self, con: sqlite3.Connection, batch: List[_Job]) -> None:
+        began = time.perf_counter()
+        cur = con.cursor()
+        outcomes: List[Tuple["Future[Any]", bool, Any]] = []
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            for unit, future in batch:
+                cur.execute("SAVEPOINT unit")
+                try:
+                    outcomes.append((future, True, unit(cur)))
+                except Exception as e:
+                    cur.execute("ROLLBACK TO unit")
+                    outcomes.append((future, False, e))
+                cur.execute("RELEASE unit")
+            con.commit()
+        except Exception as e:
+            if con.in_transaction:
+                con.rollback()
+            for _unit, future in batch:
+                future.set_exception(e)
+            return
+        self.commits += 1
+        self.units += len(batch)
+        LEDGER_COMMITS.labels("group").inc()
+        LEDGER_BATCH.observe(len(batch))
+        LEDGER_COMMIT_SECONDS.observe(time.perf_counter() - began)
+        for future, ok, value in outcomes:
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+_writers: Dict[Tuple[Path, Any], GroupCommitWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path: Path) -> GroupCommitWriter:
+    """The writer for ``path``, started on first use."""
+
+    # Keyed by factory too so set_connection_factory() takes effect.
+    key = (Path(path), database.CONNECTION_FACTORY)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = GroupCommitWriter(key[0])
+        return writer
+
+
+def close_writers() -> None:
+    """Stop every writer (e.g. before moving or replacing database files)."""
+
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
@@ -0,0 +1,274 @@
+"""In-process metrics registry with Prometheus text exposition.
+
+Deliberately tiny: counters, gauges and fixed-bucket histograms, optionally
+labelled, all living in the module level :data:`REGISTRY`.  Nothing here
+depends on discord.py so services can record metrics freely.
+
+Exporters are configured from the environment:
+
+- ``METRICS_PORT`` (and ``METRICS_HOST``, default ``127.0.0.1``) — serve
+  ``GET /metrics`` over plain HTTP.
+- ``METRICS_FILE`` — periodically dump the exposition text to this file
+  (every ``METRICS_DUMP_INTERVAL`` seconds, default 60).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+SQL_BUCKETS: Tuple[float, ...] = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0,
+)
+DT_BUCKETS: Tuple[float, ...] = (
+    1, 10, 60, 300, 900, 3600, 6 * 3600, 86400, 7 * 86400, 30 * 86400,
+)
+
+Sampler = Callable[[], Union[float, Dict[Tuple[str, ...], float]]]
+
+_lock = threading.Lock()
+
+
+class _Child:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with _lock:
+            self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        idx = bisect.bisect_left(self.bounds, value)
+        with _lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate the ``q`` quantile by interpolating inside its bucket."""
+
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for idx, bucket in enumerate(self.counts):
+            if bucket and seen + bucket >= rank:
+                if idx >= len(self.bounds):
+                    return self.bounds[-1] if self.bounds else 0.0
+                upper = self.bounds[idx]
+                return lower + (upper - lower) * ((rank - seen) / bucket)
+            seen += bucket
+            if idx < len(self.bounds):
+                lower = self.bounds[idx]
+        return lower
+
+
+class Metric:
+    """A metric family; unlabelled families proxy to their single child."""
+
+    def __init__(
+        self,
+        kind: str,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        fn: Optional[Sampler] = None,
+    ) -> None:
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.fn = fn
+        self.children: Dict[Tuple[str, ...], Any] = {}
+
+    def labels(self, *values: Any) -> Any:
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            child = _HistogramChild(self.buckets) if self.kind == "histogram" else _Child()
+            with _lock:
+                child = self.children.setdefault(key, child)
+        return child
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        if self.fn is None:
+            return list(self.children.items())
+        produced = self.fn()
+        if isinstance(produced, dict):
+            values = produced.items()
+        else:
+            values = [((), produced)]
+        samples = []
+        for key, value in values:
+            child = _Child()
+            child.value = float(value)
+            samples.append((tuple(key), child))
+        return samples
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        with _lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self.metrics.get(name)
+
+    def collect(self) -> Iterable[Metric]:
+        return list(self.metrics.values())
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help_text: str, labelnames: Sequence[str] = (), fn: Optional[Sampler] = None) -> Metric:
+    return REGISTRY.register(Metric("counter", name, help_text, labelnames, fn=fn))
+
+
+def gauge(name: str, help_text: str, labelnames: Sequence[str] = (), fn: Optional[Sampler] = None) -> Metric:
+    return REGISTRY.register(Metric("gauge", name, help_text, labelnames, fn=fn))
+
+
+def histogram(
+    name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+) -> Metric:
+    return REGISTRY.register(Metric("histogram", name, help_text, labelnames, buckets=buckets))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_prometheus(registry: Registry = REGISTRY) -> str:
+    """Render every metric in the Prometheus text exposition format."""
+
+    lines: List[str] = []
+    for metric in registry.collect():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for key, child in sorted(metric.samples(), key=lambda item: item[0]):
+            if metric.kind != "histogram":
+                lines.append(f"{metric.name}{_label_text(metric.labelnames, key)} {_number(child.value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(child.bounds + (math.inf,), child.counts):
+                cumulative += count
+                le = ("le", _number(bound))
+                lines.append(f"{metric.name}_bucket{_label_text(metric.labelnames, key, le)} {cumulative}")
+            lines.append(f"{metric.name}_sum{_label_text(metric.labelnames, key)} {_number(child.sum)}")
+            lines.append(f"{metric.name}_count{_label_text(metric.labelnames, key)} {child.count}")
+    return "\n".join(lines) + "\n"
+
+
+def dump_metrics(path: Union[str, Path]) -> None:
+    """Atomically write the exposition text to ``path``."""
+
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(target.suffix + ".tmp")
+    tmp.write_text(render_prometheus(), encoding="utf-8")
+    os.replace(tmp, target)
+
+
+async def _handle_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/", "/metrics"):
+            status, body = "200 OK", render_prometheus().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+            + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _dump_forever(path: str, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(dump_metrics, path)
+        except OSError as exc:
+            print("Metrics dump failed:", exc)
+
+
+async def start_exporters() -> List[Any]:
+    """Start the HTTP endpoint and/or file dumper configured via env vars."""
+
+    handles: List[Any] = []
+    port = os.getenv("METRICS_PORT")
+    if port:
+        host = os.getenv("METRICS_HOST", "127.0.0.1")
+        server = await asyncio.start_server(_handle_scrape, host, int(port))
+        handles.append(server)
+        print(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    path = os.getenv("METRICS_FILE")
+    if path:
+        interval = float(os.getenv("METRICS_DUMP_INTERVAL", "60"))
+        handles.append(asyncio.create_task(_dump_forever(path, interval)))
+        print(f"Dumping metrics to {path} every {interval:g}s")
+    return handles
@@ -0,0 +1,257 @@
+"""Background watcher that hot-reloads the girl pool.
+
+Watches ``girls.json`` and the image folders and calls ``on_change`` once
+edits have settled for ``debounce`` seconds.  On Linux the watcher uses
+inotify (through ``ctypes``, no extra dependency) on every folder below
+them, adding folders as they appear, and wakes the event loop only when
+something changes; elsewhere, or when inotify is unavailable, it falls back
+to polling a cheap ``stat`` signature of those folders and of the nested
+ones the last load resolved images from (see :meth:`PoolWatcher.track`).
+
+Configuration (environment):
+
+- ``POOL_WATCH`` — set to ``1`` to enable the watcher.
+- ``POOL_WATCH_DEBOUNCE`` — quiet period before reloading, seconds (1.0).
+- ``POOL_WATCH_INTERVAL`` — polling interval for the stat fallback (2.0).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF
+)
+_EVENT_HEADER = struct.Struct("iIII")
+_IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+
+Signature = Tuple[Tuple[str, Optional[int], Optional[int]], ...]
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def watch_enabled() -> bool:
+    return os.getenv("POOL_WATCH", "0") == "1"
+
+
+class _Inotify:
+    """Minimal non-blocking inotify handle."""
+
+    def __init__(self) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.fd = fd
+        self.dirs: Dict[int, Path] = {}
+
+    def add(self, directory: Path) -> None:
+        wd = self._add_watch(self.fd, os.fsencode(str(directory)), _WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self.dirs[wd] = directory
+
+    def read(self) -> List[Tuple[Path, str, int]]:
+        """Drain pending events as ``(directory, name, mask)``."""
+
+        events: List[Tuple[Path, str, int]] = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            if not data:
+                return events
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                directory = self.dirs.get(wd)
+                if directory is not None:
+                    events.append((directory, name, mask))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PoolWatcher:
+    def __init__(
+        self,
+        json_path: str,
+        image_dirs: Sequence[Path],
+        on_change: Callable[[], Awaitable[None]],
+        debounce: Optional[float] = None,
+        poll_interval: Optional[float] = None,
+    ) -> None:
+        self.json_path = Path(json_path).resolve()
+        # The JSON's own folder is always watched, filtered by file name.
+        self.image_dirs = [Path(d).resolve() for d in image_dirs if Path(d).resolve() != self.json_path.parent]
+        self.on_change = on_change
+        self.debounce = debounce if debounce is not None else _env_float("POOL_WATCH_DEBOUNCE", 1.0)
+        self.poll_interval = poll_interval if poll_interval is not None else _env_float("POOL_WATCH_INTERVAL", 2.0)
+        self.mode: Optional[str] = None
+        self.reloads = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inotify: Optional[_Inotify] = None
+        self._poll_task: Optional[asyncio.Task[None]] = None
+        self._pending: Optional[asyncio.TimerHandle] = None
+        self._running: Optional[asyncio.Task[None]] = None
+        self._dirty = False
+        self._folders: Tuple[Path, ...] = ()
+
+    def track(self, folders: Iterable[str]) -> None:
+        """Also poll ``folders`` (a compiled pool's ``folders``), so art
+        added to a nested folder is noticed without inotify."""
+
+        self._folders = tuple(Path(folder) for folder in folders)
+
+    def _directories(self) -> List[Path]:
+        dirs = [self.json_path.parent]
+        for directory in self.image_dirs:
+            if directory not in dirs and directory.is_dir():
+                dirs.append(directory)
+        return dirs
+
+    def _watch_tree(self, top: Path, required: bool = False) -> None:
+        """Watch ``top`` and every folder below it, skipping hidden ones
+        such as the snapshot cache."""
+
+        assert self._inotify is not None
+        if required:
+            self._inotify.add(top)
+        for current, subdirs, _files in os.walk(top):
+            subdirs[:] = [name for name in subdirs if not name.startswith(".")]
+            try:
+                self._inotify.add(Path(current))
+            except OSError:
+                # A folder removed mid-walk has nothing left to watch.
+                continue
+
+    def start(self) -> str:
+        """Start watching from inside the running loop; returns the mode."""
+
+        self._loop = asyncio.get_running_loop()
+        try:
+            inotify = _Inotify()
+            self._inotify = inotify
+            try:
+                for directory in self._directories():
+                    self._watch_tree(directory, required=True)
+            except OSError:
+                self._inotify = None
+                inotify.close()
+                raise
+            self._loop.add_reader(inotify.fd, self._on_readable)
+            self.mode = "inotify"
+        except (OSError, AttributeError, NotImplementedError) as ex:
+            print(f"Pool watcher: inotify unavailable ({ex}); polling every {self.poll_interval:g}s")
+            self._poll_task = self._loop.create_task(self._poll())
+            self.mode = "poll"
+        return self.mode
+
+    def stop(self) -> None:
+        if self._inotify is not None and self._loop is not None:
+            self._loop.remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+
+    def _relevant(self, directory: Path, name: str, mask: int) -> bool:
+        if directory == self.json_path.parent and name == self.json_path.name:
+            return True
+        if name.startswith("."):
+            return False
+        if any(directory == root or root in directory.parents for root in self.image_dirs):
+            return True
+        # Art may also sit next to girls.json or below it; ignore editor and
+        # cache noise, but not folders, whose files raise no events of their own.
+        return bool(mask & IN_ISDIR) or name.lower().endswith(_IMAGE_SUFFIXES)
+
+    def _on_readable(self) -> None:
+        assert self._inotify is not None
+        events = self._inotify.read()
+        for directory, name, mask in events:
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and not name.startswith("."):
+                self._watch_tree(directory / name)
+        if any(self._relevant(directory, name, mask) for directory, name, mask in events):
+            self._schedule()
+
+    def signature(self) -> Signature:
+        entries = []
+        for path in [self.json_path, self.json_path.parent, *self.image_dirs, *self._folders]:
+            try:
+                st = os.stat(path)
+                entries.append((str(path), st.st_mtime_ns, st.st_size))
+            except OSError:
+                entries.append((str(path), None, None))
+        return tuple(entries)
+
+    async def _poll(self) -> None:
+        previous = await asyncio.to_thread(self.signature)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            current = await asyncio.to_thread(self.signature)
+            if current != previous:
+                previous = current
+                self._schedule()
+
+    def _schedule(self) -> None:
+        assert self._loop is not None
+        if self._pending is not None:
+            self._pending.cancel()
+        self._pending = self._loop.call_later(self.debounce, self._fire)
+
+    def _fire(self) -> None:
+        self._pending = None
+        if self._running is not None and not self._running.done():
+            # A reload is in flight; run once more when it finishes.
+            self._dirty = True
+            return
+        assert self._loop is not None
+        self._running = self._loop.create_task(self._reload())
+
+    async def _reload(self) -> None:
+        while True:
+            self._dirty = False
+            try:
+                await self.on_change()
+                self.reloads += 1
+            except Exception as ex:
+                print("Pool watcher reload failed:", ex)
+            if not self._dirty:
+                return
@@ -0,0 +1,202 @@
+"""On-demand CPU and allocation profiling for the running bot.
+
+A :class:`Profiler` owns at most one CPU session (``cProfile`` on the event
+loop thread) and one memory session (``tracemalloc``) at a time.  Nothing is
+installed until a session starts, so the overhead while idle is zero.  Every
+session is bounded: it stops by itself after its window, writes its raw data
+plus a text summary under ``PROFILE_DIR`` (default ``profiles/``) and
+reports the top-N hot functions or allocation sites.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional
+
+MAX_WINDOW_SECONDS = 600
+DEFAULT_TOP = 15
+TRACEMALLOC_FRAMES = 10
+
+CPU = "cpu"
+MEMORY = "memory"
+
+
+@dataclass
+class ProfileReport:
+    kind: str
+    seconds: float
+    files: List[Path]
+    top: List[str]
+
+
+@dataclass
+class _Session:
+    kind: str
+    started: float
+    top: int
+    on_finish: Optional[Callable[[ProfileReport], Awaitable[None]]]
+    handle: Optional[asyncio.TimerHandle] = None
+    profile: Optional[cProfile.Profile] = None
+    baseline: Optional[tracemalloc.Snapshot] = None
+    extra: dict = field(default_factory=dict)
+
+
+def profile_dir() -> Path:
+    return Path(os.getenv("PROFILE_DIR", "profiles"))
+
+
+def _stamp() -> str:
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+def _short_path(filename: str) -> str:
+    try:
+        return os.path.relpath(filename)
+    except ValueError:
+        return filename
+
+
+def summarise_cpu(stats: pstats.Stats, top: int) -> List[str]:
+    """Top functions by own time: ``tottime cumtime ncalls location``."""
+
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:top]  # type: ignore[attr-defined]
+    lines = []
+    for (filename, line, func), (_cc, ncalls, tottime, cumtime, _callers) in rows:
+        location = f"{_short_path(filename)}:{line}({func})" if line else func
+        lines.append(f"{tottime * 1000:9.1f}ms {cumtime * 1000:9.1f}ms {ncalls:>8} {location}")
+    return lines
+
+
+def summarise_memory(current: tracemalloc.Snapshot, baseline: Optional[tracemalloc.Snapshot], top: int) -> List[str]:
+    """Allocation sites that grew the most during the window."""
+
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ]
+    current = current.filter_traces(filters)
+    if baseline is not None:
+        stats = current.compare_to(baseline.filter_traces(filters), "lineno")
+    else:
+        stats = current.statistics("lineno")
+    lines = []
+    for stat in stats[:top]:
+        frame = stat.traceback[0]
+        growth = getattr(stat, "size_diff", stat.size)
+        lines.append(
+            f"{growth / 1024:+10.1f}KiB {stat.size / 1024:10.1f}KiB {stat.count:>8} "
+            f"{_short_path(frame.filename)}:{frame.lineno}"
+        )
+    return lines
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self.sessions: dict[str, _Session] = {}
+
+    def active(self, kind: str) -> bool:
+        return kind in self.sessions
+
+    def start(
+        self,
+        kind: str,
+        seconds: float,
+        top: int = DEFAULT_TOP,
+        on_finish: Optional[Callable[[ProfileReport], Awaitable[None]]] = None,
+    ) -> float:
+        """Start a bounded session; returns the effective window in seconds."""
+
+        if kind not in (CPU, MEMORY):
+            raise ValueError(f"Unknown profile kind: {kind}")
+        if kind in self.sessions:
+            raise RuntimeError(f"A {kind} profile is already running")
+        window = max(1.0, min(float(seconds), MAX_WINDOW_SECONDS))
+        session = _Session(kind=kind, started=time.perf_counter(), top=top, on_finish=on_finish)
+        if kind == CPU:
+            session.profile = cProfile.Profile()
+            session.profile.enable()
+        else:
+            session.extra["was_tracing"] = tracemalloc.is_tracing()
+            if not session.extra["was_tracing"]:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            session.baseline = tracemalloc.take_snapshot()
+        self.sessions[kind] = session
+        loop = asyncio.get_running_loop()
+        session.handle = loop.call_later(window, lambda: asyncio.ensure_future(self._auto_stop(kind)))
+        return window
+
+    async def _auto_stop(self, kind: str) -> None:
+        session = self.sessions.get(kind)
+        if session is None:
+            return
+        report = await self.stop(kind)
+        if report and session.on_finish:
+            try:
+                await session.on_finish(report)
+            except Exception as exc:  # pragma: no cover - reporting is best effort
+                print("Profile report delivery failed:", exc)
+
+    async def stop(self, kind: str) -> Optional[ProfileReport]:
+        session = self.sessions.pop(kind, None)
+        if session is None:
+            return None
+        if session.handle is not None:
+            session.handle.cancel()
+        elapsed = time.perf_counter() - session.started
+        out_dir = profile_dir()
+        stem = f"{kind}-{_stamp()}"
+
+        if kind == CPU:
+            assert session.profile is not None
+            session.profile.disable()
+            stats = pstats.Stats(session.profile, stream=io.StringIO())
+            top = summarise_cpu(stats, session.top)
+            files = await asyncio.to_thread(self._write_cpu, out_dir, stem, stats, top)
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            if not session.extra.get("was_tracing"):
+                tracemalloc.stop()
+            top = await asyncio.to_thread(summarise_memory, snapshot, session.baseline, session.top)
+            files = await asyncio.to_thread(self._write_memory, out_dir, stem, snapshot, top)
+        return ProfileReport(kind=kind, seconds=elapsed, files=files, top=top)
+
+    @staticmethod
+    def _write_cpu(out_dir: Path, stem: str, stats: pstats.Stats, top: List[str]) -> List[Path]:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        raw = out_dir / f"{stem}.prof"
+        stats.dump_stats(raw)
+        text = out_dir / f"{stem}.txt"
+        buffer = io.StringIO()
+        pstats.Stats(str(raw), stream=buffer).sort_stats("cumulative").print_stats(50)
+        text.write_text(
+            "own time  cum time   calls  location\n" + "\n".join(top) + "\n\n" + buffer.getvalue(),
+            encoding="utf-8",
+        )
+        return [raw, text]
+
+    @staticmethod
+    def _write_memory(out_dir: Path, stem: str, snapshot: tracemalloc.Snapshot, top: List[str]) -> List[Path]:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        raw = out_dir / f"{stem}.snapshot"
+        snapshot.dump(str(raw))
+        text = out_dir / f"{stem}.txt"
+        text.write_text("growth      size      count  location\n" + "\n".join(top) + "\n", encoding="utf-8")
+        return [raw, text]
+
+
+_profiler: Optional[Profiler] = None
+
+
+def get_profiler() -> Profiler:
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
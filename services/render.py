@@ -0,0 +1,260 @@
+"""Cached text fragments for roster lines, the /girls view and /gacha embeds.
+
+Rendering a girl takes several ``format_*`` calls and XP formatting, which
+at high levels normalises ``Decimal`` values with thousands of digits.  The
+same rows are rendered again on every page flip.  Fragments are cached by
+the values they display: a changed value simply misses, so nothing needs
+invalidating.  Each cache is a bounded LRU.  Hits, misses and evictions are
+exported as ``idol_render_cache_*`` and shown by ``/stats``.
+
+Configuration (environment):
+
+- ``RENDER_CACHE_SIZE`` — entries kept per cache (default 4096).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Mapping, NamedTuple, Optional, Tuple, TypeVar
+
+from services.balance import format_xp, level_xp_required, xp_to_decimal
+from services.formatting import format_currency, format_plain, format_rate
+from services.gacha import rarity_emoji
+from services.metrics import counter, gauge
+
+T = TypeVar("T")
+
+Field = Tuple[str, str, bool]  # embed field: name, value, inline
+
+
+class RenderCache:
+    """A bounded LRU of rendered fragments keyed by the values they show."""
+
+    def __init__(self, name: str, max_entries: Optional[int] = None) -> None:
+        self.name = name
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("RENDER_CACHE_SIZE", "4096"))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, render: Callable[[], T]) -> T:
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+        value = render()
+        with self._lock:
+            self._entries[key] = value
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+XP_TEXT = RenderCache("xp")
+LINES = RenderCache("girl_line")
+ROSTER = RenderCache("roster")
+CARDS = RenderCache("card")
+GACHA = RenderCache("gacha")
+CACHES: Tuple[RenderCache, ...] = (XP_TEXT, LINES, ROSTER, CARDS, GACHA)
+
+RENDER_CACHE_REQUESTS = counter(
+    "idol_render_cache_requests_total",
+    "Render cache lookups",
+    ("cache", "result"),
+    fn=lambda: {
+        **{(cache.name, "hit"): cache.hits for cache in CACHES},
+        **{(cache.name, "miss"): cache.misses for cache in CACHES},
+    },
+)
+RENDER_CACHE_EVICTIONS = counter(
+    "idol_render_cache_evictions_total",
+    "Fragments dropped to stay within RENDER_CACHE_SIZE",
+    ("cache",),
+    fn=lambda: {(cache.name,): cache.evictions for cache in CACHES},
+)
+RENDER_CACHE_ENTRIES = gauge(
+    "idol_render_cache_entries", "Fragments held per render cache", ("cache",), fn=lambda: {(c.name,): len(c) for c in CACHES}
+)
+
+
+def clear_render_caches() -> None:
+    for cache in CACHES:
+        cache.clear()
+
+
+def _xp_progress(level: int, raw_xp: Any) -> str:
+    requirement = level_xp_required(level)
+    if requirement is None:
+        return "MAX"
+    return f"{format_xp(xp_to_decimal(raw_xp))}/{format_xp(requirement)}"
+
+
+def xp_progress(level: int, raw_xp: Any) -> str:
+    """``"<xp>/<required>"`` for the next level, or ``"MAX"``."""
+
+    return XP_TEXT.get((level, raw_xp), lambda: _xp_progress(level, raw_xp))
+
+
+def _raw_xp(row: Any) -> Any:
+    if isinstance(row, dict):
+        return row.get("xp", 0)
+    return row["xp"] if "xp" in row.keys() else 0
+
+
+def girl_line(row: Any) -> str:
+    """One roster line for ``/agency``."""
+
+    key = (
+        row["name"],
+        row["rarity"],
+        int(row["level"]),
+        row["income"],
+        row["popularity"],
+        row["fans"],
+        _raw_xp(row),
+        row["specialty"],
+        bool(row["is_working"]),
+        row["stamina"],
+    )
+    return LINES.get(key, lambda: _girl_line(*key))
+
+
+def _girl_line(
+    name: str,
+    rarity: str,
+    level: int,
+    income: float,
+    popularity: float,
+    fans: float,
+    raw_xp: Any,
+    specialty: Optional[str],
+    is_working: bool,
+    stamina: float,
+) -> str:
+    xp_text = xp_progress(level, raw_xp)
+    if xp_text != "MAX":
+        xp_text += " XP"
+    return (
+        f"— **{name}** {rarity_emoji(rarity)} | "
+        f"⬆️Lv.{level} | "
+        f"💰{format_rate(income)} | 🌟{format_plain(popularity)} | "
+        f"❤️{format_plain(fans)} | 📈{xp_text} | 🏷️ {specialty or '-'} | "
+        f"{'⚡' if is_working else '🛌'}{format_plain(stamina)}%"
+    )
+
+
+def roster_summary(row: Mapping[str, Any]) -> str:
+    """``"<name> Lv.<level> — <income>/s"`` for the /girls preview list."""
+
+    key = ("summary", row["name"], int(row["level"]), row["income"])
+    return ROSTER.get(key, lambda: f"{key[1]} Lv.{key[2]} — {format_rate(key[3])}")
+
+
+def option_description(row: Mapping[str, Any]) -> str:
+    """``"Lv.<level> • <income>/s"`` for the /girls select menu."""
+
+    key = ("option", int(row["level"]), row["income"])
+    return ROSTER.get(key, lambda: f"Lv.{key[1]} • {format_rate(key[2])}")
+
+
+def girl_card(row: Mapping[str, Any]) -> Tuple[str, Tuple[Field, ...]]:
+    """Title and stat fields of the /girls embed for one girl."""
+
+    key = (
+        row["name"],
+        row["rarity"],
+        int(row["level"]),
+        row["income"],
+        row["popularity"],
+        row["fans"],
+        row["stamina"],
+        bool(row["is_working"]),
+        row.get("xp", 0),
+        row["specialty"],
+    )
+    return CARDS.get(key, lambda: _girl_card(*key))
+
+
+def _girl_card(
+    name: str,
+    rarity: str,
+    level: int,
+    income: float,
+    popularity: float,
+    fans: float,
+    stamina: float,
+    is_working: bool,
+    raw_xp: Any,
+    specialty: Optional[str],
+) -> Tuple[str, Tuple[Field, ...]]:
+    fields: List[Field] = [
+        ("⬆️ Level", str(level), True),
+        ("💰 Income", format_rate(income), True),
+        ("🌟 Popularity", format_plain(popularity), True),
+        ("❤️ Fans", format_plain(fans), True),
+        ("⚡ Stamina", f"{format_plain(stamina)}% • {'Working' if is_working else 'Resting'}", True),
+        ("📈 Experience", xp_progress(level, raw_xp), True),
+        ("🗂️ Specialty", specialty or "-", True),
+    ]
+    return f"{name} {rarity_emoji(rarity)}", tuple(fields)
+
+
+class GachaParts(NamedTuple):
+    title: str
+    new: str  # description for a new girl
+    duplicate: str  # description for a duplicate
+    fields: Tuple[Field, ...]  # everything but the balance
+
+
+def gacha_parts(girl: Mapping[str, Any], cashback: int) -> GachaParts:
+    """The parts of a /gacha result embed that only depend on the catalog entry."""
+
+    key = (girl["name"], girl["rarity"], girl["income"], girl["popularity"], girl.get("specialty", "-"), cashback)
+    return GACHA.get(key, lambda: _gacha_parts(*key))
+
+
+def _gacha_parts(
+    name: str, rarity: str, income: float, popularity: float, specialty: Optional[str], cashback: int
+) -> GachaParts:
+    emoji = rarity_emoji(rarity)
+    return GachaParts(
+        title=f"{name} {emoji}",
+        new=(
+            f"🎉 New girl: **{name}** {emoji}!\n"
+            f"💰 {format_rate(income)} | 🌟{format_plain(popularity)} | 🏷️ {specialty}"
+        ),
+        duplicate=f"🎰 Duplicate **{name}** {emoji}. Cashback: +{format_currency(cashback)}",
+        fields=(
+            ("💰 Income", format_rate(income), True),
+            ("🌟 Popularity", format_plain(popularity), True),
+            ("🏷️ Specialty", specialty or "-", True),
+        ),
+    )
+
+
+def cache_stats() -> Dict[str, Tuple[int, int, int]]:
+    """Hits, misses and entries per cache."""
+
+    return {cache.name: (cache.hits, cache.misses, len(cache)) for cache in CACHES}
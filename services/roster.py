@@ -0,0 +1,221 @@
+"""Filtered and sorted roster queries for ``/girls``.
+
+Filters are pushed into SQL so they use the ``user_girls`` indexes created by
+:func:`db.database.init_db`; name/specialty search goes through the
+``user_girls_fts`` FTS5 index when SQLite provides it.
+"""
+
+from __future__ import annotations
+
+import re
+import sqlite3
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from db import database
+
+SORTS = {
+    "rarity": "rarity DESC, income DESC, name ASC",
+    "income": "income DESC, name ASC",
+    "level": "level DESC, income DESC, name ASC",
+    "fans": "fans DESC, name ASC",
+    "stamina": "stamina DESC, name ASC",
+    "name": "name COLLATE NOCASE ASC",
+}
+DEFAULT_SORT = "rarity"
+# The same orders for rows held in memory: (column, descending, case-insensitive).
+SORT_KEYS = {
+    "rarity": (("rarity", True, False), ("income", True, False), ("name", False, False)),
+    "income": (("income", True, False), ("name", False, False)),
+    "level": (("level", True, False), ("income", True, False), ("name", False, False)),
+    "fans": (("fans", True, False), ("name", False, False)),
+    "stamina": (("stamina", True, False), ("name", False, False)),
+    "name": (("name", False, True),),
+}
+
+BULK_ACTIONS: Tuple[str, ...] = ("rest", "work", "rotate")
+ROTATE_REST_BELOW = 25.0
+ROTATE_WORK_ABOVE = 80.0
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+@dataclass(frozen=True)
+class RosterFilter:
+    rarity: Optional[str] = None
+    specialty: Optional[str] = None
+    working: Optional[bool] = None
+    min_level: Optional[int] = None
+    search: Optional[str] = None
+    sort: str = DEFAULT_SORT
+
+    def is_default(self) -> bool:
+        return self == RosterFilter(sort=self.sort)
+
+    def describe(self) -> str:
+        parts = []
+        if self.rarity:
+            parts.append(self.rarity)
+        if self.specialty:
+            parts.append(f"specialty {self.specialty}")
+        if self.working is not None:
+            parts.append("working" if self.working else "resting")
+        if self.min_level:
+            parts.append(f"Lv.{self.min_level}+")
+        if self.search:
+            parts.append(f'"{self.search}"')
+        if self.sort != DEFAULT_SORT:
+            parts.append(f"by {self.sort}")
+        return ", ".join(parts)
+
+
+def fts_query(user_id: int, text: str) -> Optional[str]:
+    """Turn free text into a safe FTS5 prefix query over one owner's girls."""
+
+    tokens = _TOKEN.findall(text)
+    if not tokens:
+        return None
+    terms = " ".join(f'"{token}"*' for token in tokens)
+    return f'user_id:"{int(user_id)}" AND {{name specialty}}:({terms})'
+
+
+def roster_where(user_id: int, flt: RosterFilter) -> Tuple[str, List[Any]]:
+    """``WHERE`` body and parameters selecting the girls ``flt`` matches."""
+
+    clauses = ["user_id=?"]
+    params: List[Any] = [user_id]
+    if flt.rarity:
+        clauses.append("rarity=?")
+        params.append(flt.rarity)
+    if flt.specialty:
+        clauses.append("specialty=? COLLATE NOCASE")
+        params.append(flt.specialty)
+    if flt.working is not None:
+        clauses.append("is_working=?")
+        params.append(int(flt.working))
+    if flt.min_level:
+        clauses.append("level>=?")
+        params.append(int(flt.min_level))
+    if flt.search:
+        match = fts_query(user_id, flt.search) if database.FTS_ENABLED else None
+        if match:
+            clauses.append("id IN (SELECT rowid FROM user_girls_fts WHERE user_girls_fts MATCH ?)")
+            params.append(match)
+        else:
+            clauses.append("(name LIKE ? ESCAPE '\\' OR specialty LIKE ? ESCAPE '\\')")
+            like = "%" + re.sub(r"([%_\\])", r"\\\1", flt.search.strip()) + "%"
+            params.extend((like, like))
+    return " AND ".join(clauses), params
+
+
+def build_roster_query(user_id: int, flt: RosterFilter, columns: str = "*") -> Tuple[str, List[Any]]:
+    where, params = roster_where(user_id, flt)
+    order = SORTS.get(flt.sort, SORTS[DEFAULT_SORT])
+    return f"SELECT {columns} FROM user_girls WHERE {where} ORDER BY {order}", params
+
+
+def matches(row: Mapping[str, Any], flt: RosterFilter) -> bool:
+    """Whether ``row`` passes ``flt``; the in-memory twin of :func:`roster_where`."""
+
+    if flt.rarity and row["rarity"] != flt.rarity:
+        return False
+    if flt.specialty and (row["specialty"] or "").casefold() != flt.specialty.casefold():
+        return False
+    if flt.working is not None and bool(row["is_working"]) != flt.working:
+        return False
+    if flt.min_level and int(row["level"]) < int(flt.min_level):
+        return False
+    if flt.search:
+        tokens = _TOKEN.findall(flt.search.casefold())
+        text = f"{row['name']} {row['specialty'] or ''}".casefold()
+        if tokens:
+            words = _TOKEN.findall(text)
+            return all(any(word.startswith(token) for word in words) for token in tokens)
+        return flt.search.strip().casefold() in text
+    return True
+
+
+def sort_rows(rows: List[Dict[str, Any]], sort: str = DEFAULT_SORT) -> List[Dict[str, Any]]:
+    """Order rows like ``ORDER BY SORTS[sort]``; stable passes from the last key."""
+
+    for column, descending, nocase in reversed(SORT_KEYS.get(sort, SORT_KEYS[DEFAULT_SORT])):
+        if nocase:
+            rows.sort(key=lambda row: row[column].casefold(), reverse=descending)
+        else:
+            rows.sort(key=lambda row: row[column], reverse=descending)
+    return rows
+
+
+def fetch_roster(cur: sqlite3.Cursor, user_id: int, flt: Optional[RosterFilter] = None) -> List[sqlite3.Row]:
+    sql, params = build_roster_query(user_id, flt or RosterFilter())
+    cur.execute(sql, params)
+    return cur.fetchall()
+
+
+def specialties(cur: sqlite3.Cursor, user_id: int, prefix: str = "", limit: int = 25) -> List[str]:
+    """Distinct specialties in a roster, for autocomplete."""
+
+    cur.execute(
+        """
+        SELECT DISTINCT specialty FROM user_girls
+        WHERE user_id=? AND specialty IS NOT NULL AND specialty LIKE ? ESCAPE '\\'
+        ORDER BY specialty COLLATE NOCASE LIMIT ?
+        """,
+        (user_id, re.sub(r"([%_\\])", r"\\\1", prefix) + "%", limit),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+class BulkResult(NamedTuple):
+    rested: int
+    started: int
+
+
+def bulk_set_working(
+    con: sqlite3.Connection,
+    user_id: int,
+    action: str,
+    flt: Optional[RosterFilter] = None,
+    rest_below: float = ROTATE_REST_BELOW,
+    work_above: float = ROTATE_WORK_ABOVE,
+) -> BulkResult:
+    """Rest, start or rotate every girl ``flt`` matches with one UPDATE.
+
+    ``rotate`` rests working girls under ``rest_below`` % stamina and starts
+    resting girls at or above ``work_above`` %.  Settle the agency first
+    (``compute_tick``) so stamina is current.
+    """
+
+    if action not in BULK_ACTIONS:
+        raise ValueError(f"Unknown bulk action: {action}")
+    where, params = roster_where(user_id, flt or RosterFilter())
+    if action == "rest":
+        new_state = "0"
+        targets = "is_working=1"
+        target_params: List[Any] = []
+    elif action == "work":
+        new_state = "1"
+        targets = "is_working=0"
+        target_params = []
+    else:
+        new_state = "CASE WHEN is_working=1 THEN 0 ELSE 1 END"
+        targets = "((is_working=1 AND stamina<?) OR (is_working=0 AND stamina>=?))"
+        target_params = [rest_below, work_above]
+
+    cur = con.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute(
+            f"SELECT COALESCE(SUM(is_working), 0), COUNT(*) FROM user_girls WHERE {where} AND {targets}",
+            [*params, *target_params],
+        )
+        working, total = cur.fetchone()
+        cur.execute(
+            f"UPDATE user_girls SET is_working={new_state} WHERE {where} AND {targets}",
+            [*params, *target_params],
+        )
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return BulkResult(rested=int(working), started=int(total) - int(working))
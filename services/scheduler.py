@@ -0,0 +1,348 @@
+"""Stamina event scheduler for opt-in notifications and auto-rotation.
+
+``stamina_tick`` is deterministic, so from a girl's stored stamina, work
+state and the agency's ``last_tick`` the next interesting moment can be
+computed exactly: when she is fully rested, or when she crosses one of the
+player's auto-rotate thresholds.  Those moments for every opted-in player
+live in one heap; a single task sleeps until the earliest one, so nothing
+polls and each event costs ``O(log n)``.
+
+Entries are invalidated lazily: :meth:`StaminaScheduler.refresh_user` bumps
+the player's version and re-pushes their events, and stale entries are
+skipped when popped.  Call it whenever a roster changes outside the
+settlement math (toggles, bulk actions, new girls).
+
+Configuration (environment):
+
+- ``STAMINA_NOTIFY_COOLDOWN`` — minimum seconds between two DMs to the same
+  player (default 3600); girls that rest in between are batched.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from db.database import db, each_partition
+from services.balance import STAM_DOWN_SEC_PER_1, STAM_UP_SEC_PER_1
+from services.cluster import owns_agency
+from services.game import stamina_tick
+from services.metrics import counter, gauge
+from storage import StaminaState, get_storage
+
+RESTED = "rested"
+ROTATE = "rotate"
+FLUSH = "flush"
+
+# One full work/rest cycle: a rested girl works down to 0, then rests to 100.
+CYCLE_SECONDS = 100 * STAM_DOWN_SEC_PER_1 + 100 * STAM_UP_SEC_PER_1
+
+EVENTS_FIRED = counter("idol_stamina_events_total", "Stamina scheduler events handled", ("kind",))
+
+# (when, seq, user_id, version, kind, girl name)
+Entry = Tuple[float, int, int, int, str, str]
+
+NotifyCallback = Callable[[int, List[str]], Awaitable[bool]]
+RotateCallback = Callable[[int, "StaminaPrefs"], Awaitable[None]]
+
+
+@dataclass
+class StaminaPrefs:
+    notify: bool = False
+    auto_rotate: bool = False
+    rest_below: float = 25.0
+    work_above: float = 80.0
+
+    @property
+    def active(self) -> bool:
+        return self.notify or self.auto_rotate
+
+
+def next_events(
+    stamina: float, working: bool, last_tick: float, now: float, prefs: StaminaPrefs
+) -> List[Tuple[float, str]]:
+    """Upcoming ``(timestamp, kind)`` events for one girl."""
+
+    s, w, _work, _rest = stamina_tick(stamina, working, max(0.0, now - last_tick))
+    events: List[Tuple[float, str]] = []
+    if prefs.notify:
+        if w and s > 0:
+            when = now + s * STAM_DOWN_SEC_PER_1 + 100 * STAM_UP_SEC_PER_1
+        else:
+            when = now + (100 - s) * STAM_UP_SEC_PER_1
+        events.append((when, RESTED))
+    if prefs.auto_rotate:
+        if w:
+            when = now + max(0.0, s - prefs.rest_below) * STAM_DOWN_SEC_PER_1
+        else:
+            when = now + max(0.0, prefs.work_above - s) * STAM_UP_SEC_PER_1
+        # Ticks settle whole seconds; land just past the crossing.
+        events.append((math.ceil(when) + 1, ROTATE))
+    return events
+
+
+def load_prefs(user_id: Optional[int] = None) -> Dict[int, StaminaPrefs]:
+    sql = "SELECT user_id, notify, auto_rotate, rest_below, work_above FROM stamina_prefs"
+    rows = []
+    if user_id is not None:
+        con = db(user_id)
+        try:
+            rows = con.execute(sql + " WHERE user_id=?", (user_id,)).fetchall()
+        finally:
+            con.close()
+    else:
+        for con in each_partition():
+            rows.extend(con.execute(sql).fetchall())
+    return {
+        row["user_id"]: StaminaPrefs(
+            bool(row["notify"]), bool(row["auto_rotate"]), float(row["rest_below"]), float(row["work_above"])
+        )
+        for row in rows
+    }
+
+
+def save_prefs(user_id: int, prefs: StaminaPrefs) -> None:
+    con = db(user_id)
+    try:
+        con.execute(
+            """
+            INSERT INTO stamina_prefs(user_id, notify, auto_rotate, rest_below, work_above) VALUES(?,?,?,?,?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                notify=excluded.notify, auto_rotate=excluded.auto_rotate,
+                rest_below=excluded.rest_below, work_above=excluded.work_above
+            """,
+            (user_id, int(prefs.notify), int(prefs.auto_rotate), prefs.rest_below, prefs.work_above),
+        )
+        con.commit()
+    finally:
+        con.close()
+
+
+class StaminaScheduler:
+    def __init__(self, cooldown: Optional[float] = None) -> None:
+        self.cooldown = cooldown if cooldown is not None else float(os.getenv("STAMINA_NOTIFY_COOLDOWN", "3600"))
+        self.prefs: Dict[int, StaminaPrefs] = {}
+        self.on_notify: Optional[NotifyCallback] = None
+        self.on_rotate: Optional[RotateCallback] = None
+        self._heap: List[Entry] = []
+        self._seq = 0
+        self._versions: Dict[int, int] = {}
+        self._live: Dict[int, int] = {}
+        self._pending: Dict[int, List[str]] = {}
+        self._last_sent: Dict[int, float] = {}
+        self._flush_at: Dict[int, float] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task[None]] = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    # -- building ---------------------------------------------------------
+
+    def _entries_for(self, user_id: int, prefs: StaminaPrefs, state: StaminaState, now: float) -> List[Entry]:
+        version = self._versions.get(user_id, 0)
+        entries: List[Entry] = []
+        rotate_at: Optional[float] = None
+        for name, stamina, working in state.girls:
+            for when, kind in next_events(stamina, working, state.last_tick, now, prefs):
+                if kind == ROTATE:
+                    # One rotate per player covers every girl that is due.
+                    rotate_at = when if rotate_at is None else min(rotate_at, when)
+                    continue
+                self._seq += 1
+                entries.append((when, self._seq, user_id, version, kind, name))
+        if rotate_at is not None:
+            self._seq += 1
+            entries.append((rotate_at, self._seq, user_id, version, ROTATE, ""))
+        return entries
+
+    def load_state(self) -> Tuple[Dict[int, StaminaPrefs], Dict[int, StaminaState]]:
+        """Read opted-in preferences and their rosters; safe off the loop."""
+
+        # In a cluster each process only schedules the agencies it owns.
+        prefs = {uid: p for uid, p in load_prefs().items() if p.active and owns_agency(uid)}
+        return prefs, get_storage().stamina_states(prefs) if prefs else {}
+
+    def install(self, prefs: Dict[int, StaminaPrefs], states: Dict[int, StaminaState]) -> int:
+        """Replace the heap with events computed from :meth:`load_state`."""
+
+        self.prefs = prefs
+        self._live = {}
+        now = time.time()
+        entries: List[Entry] = []
+        for user_id, state in states.items():
+            user_entries = self._entries_for(user_id, prefs[user_id], state, now)
+            self._live[user_id] = len(user_entries)
+            entries.extend(user_entries)
+        heapq.heapify(entries)
+        self._heap = entries
+        # Batched alerts still waiting for their cooldown keep their flush.
+        self._flush_at = {}
+        for user_id in list(self._pending):
+            if user_id not in prefs:
+                del self._pending[user_id]
+                continue
+            ready_at = self._last_sent.get(user_id, 0.0) + self.cooldown
+            self._flush_at[user_id] = ready_at
+            self._push(ready_at, user_id, FLUSH)
+        self._kick()
+        return len(self._heap)
+
+    def rebuild(self) -> int:
+        """Reload preferences and every opted-in roster; returns the heap size."""
+
+        return self.install(*self.load_state())
+
+    async def refresh_user(self, user_id: int) -> None:
+        """Recompute one player's events after a manual roster change."""
+
+        if user_id not in self.prefs:
+            return
+        state = await asyncio.to_thread(get_storage().stamina_state, user_id)
+        # Preferences may have changed while the roster was read.
+        prefs = self.prefs.get(user_id)
+        if prefs is None:
+            return
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        entries = self._entries_for(user_id, prefs, state, time.time()) if state is not None and prefs.active else []
+        self._live[user_id] = len(entries)
+        for entry in entries:
+            heapq.heappush(self._heap, entry)
+        self._compact()
+        if entries and self._heap and self._heap[0][0] >= min(entry[0] for entry in entries):
+            self._kick()
+
+    async def set_prefs(self, user_id: int, prefs: StaminaPrefs) -> None:
+        await asyncio.to_thread(save_prefs, user_id, prefs)
+        if prefs.active and owns_agency(user_id):
+            self.prefs[user_id] = prefs
+            await self.refresh_user(user_id)
+        else:
+            self.prefs.pop(user_id, None)
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._live.pop(user_id, None)
+            self._pending.pop(user_id, None)
+
+    def _compact(self) -> None:
+        live = sum(self._live.values())
+        if len(self._heap) <= 2 * live + 1024:
+            return
+        self._heap = [entry for entry in self._heap if not self._stale(entry)]
+        heapq.heapify(self._heap)
+
+    def _stale(self, entry: Entry) -> bool:
+        user_id, version = entry[2], entry[3]
+        return user_id not in self.prefs or version != self._versions.get(user_id, 0)
+
+    def _push(self, when: float, user_id: int, kind: str, name: str = "") -> None:
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, user_id, self._versions.get(user_id, 0), kind, name))
+
+    # -- running ----------------------------------------------------------
+
+    def _kick(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    def start(self) -> None:
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        assert self._wake is not None
+        while True:
+            self._wake.clear()
+            if not self._heap:
+                await self._wake.wait()
+                continue
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._dispatch(self._pop_due(time.time()))
+            except Exception as ex:
+                print("Stamina scheduler dispatch failed:", ex)
+
+    def _pop_due(self, now: float) -> List[Entry]:
+        due: List[Entry] = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if entry[4] != FLUSH and self._stale(entry):
+                continue
+            due.append(entry)
+        return due
+
+    async def _dispatch(self, due: List[Entry]) -> None:
+        rotate: Set[int] = set()
+        notify: Set[int] = set()
+        for when, _seq, user_id, _version, kind, name in due:
+            EVENTS_FIRED.labels(kind).inc()
+            if kind == RESTED:
+                self._pending.setdefault(user_id, []).append(name)
+                notify.add(user_id)
+                # The cycle repeats unless the roster is changed by hand.
+                self._push(when + CYCLE_SECONDS, user_id, RESTED, name)
+            elif kind == ROTATE:
+                rotate.add(user_id)
+            elif kind == FLUSH:
+                self._flush_at.pop(user_id, None)
+                notify.add(user_id)
+
+        for user_id in rotate:
+            prefs = self.prefs.get(user_id)
+            if prefs is None or self.on_rotate is None:
+                continue
+            await self.on_rotate(user_id, prefs)
+            await self.refresh_user(user_id)
+
+        for user_id in notify:
+            await self._notify(user_id)
+
+    async def _notify(self, user_id: int) -> None:
+        names = self._pending.get(user_id)
+        if not names or self.on_notify is None:
+            return
+        now = time.time()
+        ready_at = self._last_sent.get(user_id, 0.0) + self.cooldown
+        if now < ready_at:
+            if user_id not in self._flush_at:
+                self._flush_at[user_id] = ready_at
+                self._push(ready_at, user_id, FLUSH)
+            return
+        del self._pending[user_id]
+        self._last_sent[user_id] = now
+        delivered = await self.on_notify(user_id, list(dict.fromkeys(names)))
+        if not delivered:
+            prefs = self.prefs.get(user_id)
+            if prefs is not None:
+                prefs.notify = False
+                await self.set_prefs(user_id, prefs)
+
+
+_scheduler: Optional[StaminaScheduler] = None
+
+
+def get_stamina_scheduler() -> StaminaScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = StaminaScheduler()
+    return _scheduler
+
+
+SCHEDULED_EVENTS = gauge(
+    "idol_stamina_scheduled_events", "Entries in the stamina event heap", fn=lambda: len(get_stamina_scheduler())
+)
@@ -0,0 +1,178 @@
+"""Process pool for CPU-heavy settlement math.
+
+Settling a large roster (or a roster that has been offline for a long time)
+means thousands of stamina phases and big-number XP arithmetic.  Running that
+on the discord.py event loop stalls heartbeats and every other interaction, so
+rosters that cross a size or ``dt`` threshold are shipped to a worker process
+as plain tuples and the result is awaited instead.
+
+Thresholds are read from the environment:
+
+- ``SETTLE_OFFLOAD_MIN_GIRLS`` — roster size that triggers an offload.
+- ``SETTLE_OFFLOAD_MIN_DT`` — elapsed seconds that trigger an offload.
+- ``SETTLE_WORKERS`` — worker processes (defaults to ``os.cpu_count()``).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_MIN_GIRLS = 400
+DEFAULT_MIN_DT = 14 * 24 * 3600
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class _JobFailed(Exception):
+    """Carries an exception raised by the offloaded function back from the worker."""
+
+    def __init__(self, error: BaseException) -> None:
+        super().__init__(error)
+        self.error = error
+
+
+# Raised by the pool itself: a dead worker, or arguments or results that
+# do not pickle (which surfaces as TypeError or AttributeError too).
+_POOL_ERRORS = (BrokenProcessPool, pickle.PicklingError, TypeError, AttributeError)
+
+
+def _timed_call(fn: Callable[..., T], args: Tuple[Any, ...]) -> Tuple[float, float, T]:
+    """Worker-side wrapper that reports when the job actually started running."""
+
+    started = time.time()
+    try:
+        result = fn(*args)
+    except Exception as exc:
+        # Wrapped so the caller can tell it apart from a pool failure.
+        raise _JobFailed(exc) from None
+    return started, time.time(), result
+
+
+class SettlementExecutor:
+    """Decides whether settlement math runs inline or in a worker process."""
+
+    def __init__(
+        self,
+        min_girls: Optional[int] = None,
+        min_dt: Optional[int] = None,
+        max_workers: Optional[int] = None,
+    ) -> None:
+        self.min_girls = min_girls if min_girls is not None else _env_int(
+            "SETTLE_OFFLOAD_MIN_GIRLS", DEFAULT_MIN_GIRLS
+        )
+        self.min_dt = min_dt if min_dt is not None else _env_int("SETTLE_OFFLOAD_MIN_DT", DEFAULT_MIN_DT)
+        workers = max_workers if max_workers is not None else _env_int("SETTLE_WORKERS", 0)
+        self.max_workers = workers if workers > 0 else None
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+        self.inline_count = 0
+        self.offload_count = 0
+        self.fallback_count = 0
+        self.pending = 0
+        self.max_pending = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.worker_time_total = 0.0
+
+    def should_offload(self, girl_count: int, dt: float) -> bool:
+        if self.min_girls > 0 and girl_count >= self.min_girls:
+            return True
+        return self.min_dt > 0 and dt >= self.min_dt
+
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    async def run(self, fn: Callable[..., T], girls: Sequence[Any], dt: float, *extra: Any) -> T:
+        """Run ``fn(girls, dt, *extra)``, offloading when the roster is heavy.
+
+        ``fn`` must be a module-level function and its arguments plain
+        picklable values.  If the pool is broken or the job does not pickle
+        the work falls back to running inline so a settlement is never lost;
+        an exception raised by ``fn`` itself propagates.
+        """
+
+        args = (girls, dt, *extra)
+        if not self.should_offload(len(girls), dt):
+            self.inline_count += 1
+            return fn(*args)
+
+        loop = asyncio.get_running_loop()
+        submitted = time.time()
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        try:
+            started, finished, result = await loop.run_in_executor(
+                self._ensure_pool(), _timed_call, fn, args
+            )
+        except _JobFailed as failed:
+            raise failed.error from failed
+        except _POOL_ERRORS as exc:
+            print("Settlement offload failed, running inline:", exc)
+            self.fallback_count += 1
+            self._reset_pool()
+            return fn(*args)
+        finally:
+            self.pending -= 1
+
+        wait = max(0.0, started - submitted)
+        self.offload_count += 1
+        self.queue_wait_total += wait
+        self.queue_wait_max = max(self.queue_wait_max, wait)
+        self.worker_time_total += max(0.0, finished - started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inline": self.inline_count,
+            "offloaded": self.offload_count,
+            "fallbacks": self.fallback_count,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "queue_wait_avg": (self.queue_wait_total / self.offload_count) if self.offload_count else 0.0,
+            "queue_wait_max": self.queue_wait_max,
+            "worker_time_total": self.worker_time_total,
+            "min_girls": self.min_girls,
+            "min_dt": self.min_dt,
+        }
+
+    def _reset_pool(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+_executor: Optional[SettlementExecutor] = None
+
+
+def get_settlement_executor() -> SettlementExecutor:
+    global _executor
+    if _executor is None:
+        _executor = SettlementExecutor()
+    return _executor
+
+
+def shutdown_settlement_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
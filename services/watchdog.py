@@ -0,0 +1,162 @@
+"""Event-loop stall detector.
+
+A heartbeat coroutine on the event loop stamps the time every ``interval``
+and records the scheduling lag it observes.  A daemon thread watches that
+stamp; once it is older than the threshold the loop is blocked by
+synchronous work, so the thread grabs the loop thread's current stack and the
+task that is running, names the handler behind it and logs the report.
+Reports are rate limited and every stall is counted in :mod:`services.metrics`.
+
+Configuration (environment):
+
+- ``LOOP_WATCHDOG`` — set to ``0`` to disable.
+- ``LOOP_STALL_THRESHOLD`` — seconds of blocking that count as a stall (0.5).
+- ``LOOP_STALL_LOG_INTERVAL`` — minimum seconds between logged reports (30).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from types import FrameType
+from typing import Callable, List, Optional
+
+from services.metrics import counter, histogram
+
+LOOP_LAG = histogram(
+    "idol_loop_lag_seconds",
+    "Event-loop scheduling lag seen by the watchdog heartbeat",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+LOOP_STALLS = counter("idol_loop_stalls_total", "Event-loop stalls above the threshold", ("handler",))
+LOOP_STALL_SECONDS = histogram(
+    "idol_loop_stall_seconds",
+    "Duration of detected event-loop stalls",
+    buckets=(0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0),
+)
+
+_PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+
+TaskDescriber = Callable[[Optional["asyncio.Task[object]"]], Optional[str]]
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def blocking_call_site(frame: Optional[FrameType]) -> str:
+    """Return the innermost project frame (``file:line in func``) of a stack."""
+
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_PROJECT_ROOT) and "site-packages" not in filename:
+            rel = os.path.relpath(filename, _PROJECT_ROOT)
+            return f"{rel}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+class LoopWatchdog:
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        interval: float = 0.1,
+        log_interval: Optional[float] = None,
+        describe: Optional[TaskDescriber] = None,
+    ) -> None:
+        self.threshold = threshold if threshold is not None else _env_float("LOOP_STALL_THRESHOLD", 0.5)
+        self.interval = interval
+        self.log_interval = (
+            log_interval if log_interval is not None else _env_float("LOOP_STALL_LOG_INTERVAL", 30.0)
+        )
+        self.describe = describe
+        self.stalls = 0
+        self.suppressed = 0
+        self._last_beat = time.monotonic()
+        self._last_log = 0.0
+        self._in_stall = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._beat_task: Optional[asyncio.Task[None]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Start monitoring the running loop (call from inside the loop)."""
+
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._beat_task = self._loop.create_task(self._beat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._beat_task is not None:
+            self._beat_task.cancel()
+            self._beat_task = None
+
+    async def _beat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            LOOP_LAG.observe(lag)
+            if self._in_stall:
+                LOOP_STALL_SECONDS.observe(lag)
+                self._in_stall = False
+            self._last_beat = time.monotonic()
+
+    def _watch(self) -> None:
+        poll = max(0.01, min(self.interval, self.threshold) / 2)
+        while not self._stopped.wait(poll):
+            blocked_for = time.monotonic() - self._last_beat - self.interval
+            if blocked_for < self.threshold or self._in_stall:
+                continue
+            self._in_stall = True
+            self._report(blocked_for)
+
+    def _current_handler(self) -> Optional[str]:
+        if self.describe is None or self._loop is None:
+            return None
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        try:
+            return self.describe(task)
+        except Exception:
+            return None
+
+    def _report(self, blocked_for: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id or -1)
+        handler = self._current_handler() or "unknown"
+        self.stalls += 1
+        LOOP_STALLS.labels(handler).inc()
+
+        now = time.monotonic()
+        if now - self._last_log < self.log_interval:
+            self.suppressed += 1
+            return
+        self._last_log = now
+        suppressed, self.suppressed = self.suppressed, 0
+
+        lines: List[str] = [
+            f"⚠️ Event loop blocked for {blocked_for:.2f}s+ in {handler} at {blocking_call_site(frame)}"
+        ]
+        if suppressed:
+            lines.append(f"({suppressed} earlier stalls not logged)")
+        if frame is not None:
+            lines.extend(line.rstrip() for line in traceback.format_stack(frame, limit=25))
+        print("\n".join(lines), file=sys.stderr)
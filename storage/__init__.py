@@ -0,0 +1,64 @@
+"""Pluggable storage for agencies and rosters.
+
+The cogs and :mod:`services.game` go through :func:`get_storage` instead of
+writing SQL.  Two engines ship:
+
+- ``sqlite`` (default): :class:`~storage.sqlite.SQLiteStorage`, the
+  partitioned database files from :mod:`db.database`.
+- ``memory``: :class:`~storage.memory.MemoryStorage`, dicts and arrays in
+  this process, nothing persisted.  For tests and benchmarks.
+
+Pick one with ``STORAGE_BACKEND`` or install one with :func:`set_storage`.
+A new backend implements :class:`~storage.base.Storage`.
+
+Stamina preferences, guild membership and ``bot_meta`` are bot bookkeeping
+rather than game state and stay in SQLite.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Dict, Optional, Type
+
+from storage.base import AgencyStats, PullResult, StaminaState, Storage, TickState
+from storage.memory import MemoryStorage
+from storage.sqlite import SQLiteStorage
+
+BACKENDS: Dict[str, Type[Storage]] = {
+    SQLiteStorage.name: SQLiteStorage,
+    MemoryStorage.name: MemoryStorage,
+}
+
+_storage: Optional[Storage] = None
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        name = os.getenv("STORAGE_BACKEND", "sqlite").strip().lower()
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown STORAGE_BACKEND {name!r}; choose from {', '.join(BACKENDS)}")
+        _storage = BACKENDS[name]()
+    return _storage
+
+
+def set_storage(storage: Optional[Storage]) -> Optional[Storage]:
+    """Install ``storage`` (``None`` re-reads ``STORAGE_BACKEND``); returns the previous one."""
+
+    global _storage
+    previous, _storage = _storage, storage
+    return previous
+
+
+__all__ = [
+    "AgencyStats",
+    "BACKENDS",
+    "MemoryStorage",
+    "PullResult",
+    "SQLiteStorage",
+    "StaminaState",
+    "Storage",
+    "TickState",
+    "get_storage",
+    "set_storage",
+]
@@ -0,0 +1,230 @@
+"""The storage interface the game logic talks to.
+
+A :class:`Storage` owns agencies (money, clock, starter flag), their rosters,
+the economy ledger and the leaderboard aggregates.  Game rules stay in
+:mod:`services`: the store only reads state, applies the results it is
+handed, and enforces the few invariants that must hold atomically (a
+settlement only lands if nobody else advanced the clock, a pull only happens
+if the agency can pay).
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from services.history import History
+from services.ledger import LedgerEvent
+from services.roster import ROTATE_REST_BELOW, ROTATE_WORK_ABOVE, BulkResult, RosterFilter
+
+# Same shapes as services.game; repeated here so storage does not import game.
+GirlState = Tuple[int, float, float, float, float, bool, int, Any]
+GirlUpdate = Tuple[float, int, float, str, int, float, int]
+StaminaGirl = Tuple[str, float, bool]  # name, stamina, working
+
+# Columns of a roster row, in ``user_girls`` order.
+GIRL_COLUMNS: Tuple[str, ...] = (
+    "id",
+    "user_id",
+    "name",
+    "rarity",
+    "level",
+    "xp",
+    "income",
+    "popularity",
+    "fans",
+    "stamina",
+    "is_working",
+    "image_url",
+    "specialty",
+)
+
+
+class TickState(NamedTuple):
+    money: float
+    last_tick: int
+    girls: List[GirlState]
+
+
+class StaminaState(NamedTuple):
+    last_tick: int
+    girls: List[StaminaGirl]
+
+
+class AgencyStats(NamedTuple):
+    user_id: int
+    money: float
+    fans: float
+    level: int
+
+
+class PullResult(NamedTuple):
+    new: bool
+    money: float
+    cashback: int
+
+
+def girl_state(row: Mapping[str, Any]) -> GirlState:
+    """Flatten a roster row into the plain tuple used by settlement."""
+
+    return (
+        int(row["id"]),
+        float(row["income"]),
+        float(row["popularity"]),
+        float(row["fans"]),
+        float(row["stamina"]),
+        bool(row["is_working"]),
+        int(row["level"]),
+        row["xp"],
+    )
+
+
+class Storage(ABC):
+    """Everything the cogs and :mod:`services.game` read or write per agency."""
+
+    name = "abstract"
+
+    # -- agencies ----------------------------------------------------------
+
+    @abstractmethod
+    def ensure_agency(self, user_id: int) -> None:
+        """Create an empty agency for ``user_id`` unless one exists.
+
+        A store that archives idle agencies restores an archived one here;
+        every command calls this before reading the agency.
+        """
+
+    @abstractmethod
+    def balance(self, user_id: int) -> Optional[float]:
+        """Current (last settled) money, or ``None`` without an agency."""
+
+    @abstractmethod
+    def claim_starter(self, user_id: int, money: float, girl: Mapping[str, Any]) -> bool:
+        """Grant ``money`` and ``girl`` once; ``False`` if already started.
+
+        Agencies that already own girls count as started.
+        """
+
+    # -- settlement --------------------------------------------------------
+
+    @abstractmethod
+    def tick_state(self, user_id: int) -> Optional[TickState]:
+        """Money, clock and every girl's settlement tuple."""
+
+    @abstractmethod
+    def apply_settlement(
+        self,
+        user_id: int,
+        last: int,
+        now: int,
+        money_gain: float,
+        updates: Sequence[GirlUpdate],
+        stats: AgencyStats,
+        read: Sequence[GirlState],
+    ) -> bool:
+        """Apply a settlement computed from the state read at ``last``.
+
+        ``read`` is the roster the settlement was computed from, in the
+        order of ``updates``.  Nothing is written and ``False`` is returned
+        when the clock moved since (a concurrent settlement won) or when a
+        girl's stamina or working flag no longer matches ``read`` (a roster
+        write landed while the settlement was computed).
+        """
+
+    # -- stamina -----------------------------------------------------------
+
+    @abstractmethod
+    def stamina_state(self, user_id: int) -> Optional[StaminaState]:
+        """Clock and every girl's name, stamina and work state, for the
+        stamina scheduler; ``None`` without an agency."""
+
+    def stamina_states(self, user_ids: Iterable[int]) -> Dict[int, StaminaState]:
+        """:meth:`stamina_state` of many agencies; those without one are left out."""
+
+        states = {}
+        for user_id in user_ids:
+            state = self.stamina_state(user_id)
+            if state is not None:
+                states[user_id] = state
+        return states
+
+    # -- roster ------------------------------------------------------------
+
+    @abstractmethod
+    def roster(self, user_id: int, flt: Optional[RosterFilter] = None) -> List[Dict[str, Any]]:
+        """Rows matching ``flt`` in its sort order, as plain dicts."""
+
+    def roster_page(
+        self, user_id: int, flt: Optional[RosterFilter] = None, offset: int = 0, limit: int = 10
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """One page of :meth:`roster` and the total number of matches."""
+
+        rows = self.roster(user_id, flt)
+        return rows[offset : offset + limit], len(rows)
+
+    @abstractmethod
+    def girl_names(self, user_id: int) -> Dict[int, str]:
+        """Girl id -> name for one roster."""
+
+    @abstractmethod
+    def specialties(self, user_id: int, prefix: str = "", limit: int = 25) -> List[str]:
+        """Distinct specialties in a roster starting with ``prefix``."""
+
+    @abstractmethod
+    def toggle_working(self, user_id: int, girl_id: int) -> Optional[bool]:
+        """Flip one girl between working and resting; the new state, or
+        ``None`` if she is not in the roster."""
+
+    @abstractmethod
+    def bulk_set_working(
+        self,
+        user_id: int,
+        action: str,
+        flt: Optional[RosterFilter] = None,
+        rest_below: float = ROTATE_REST_BELOW,
+        work_above: float = ROTATE_WORK_ABOVE,
+    ) -> BulkResult:
+        """Rest, start or rotate every girl ``flt`` matches (see
+        :func:`services.roster.bulk_set_working`)."""
+
+    @abstractmethod
+    def set_image_refs(self, user_id: int, updates: Sequence[Tuple[str, int]]) -> None:
+        """Store ``(image reference, girl id)`` pairs."""
+
+    # -- gacha -------------------------------------------------------------
+
+    @abstractmethod
+    def record_pull(
+        self, user_id: int, girl: Mapping[str, Any], image_url: Optional[str], cost: float, cashback: int
+    ) -> Optional[PullResult]:
+        """Charge ``cost`` and add ``girl``, or refund ``cashback`` if she is
+        already owned.  ``None`` (and no change) when the agency cannot pay."""
+
+    # -- ledger ------------------------------------------------------------
+
+    @abstractmethod
+    def ledger(self, user_id: int, limit: int = 20) -> List[LedgerEvent]:
+        """The agency's latest economy events, newest first.
+
+        Money only changes through :meth:`claim_starter`,
+        :meth:`apply_settlement` and :meth:`record_pull`, and each of them
+        appends its events (see :mod:`services.ledger`) atomically with
+        the balance change.
+        """
+
+    # -- history -----------------------------------------------------------
+
+    @abstractmethod
+    def history(self, user_id: int) -> Optional[History]:
+        """The agency's rollups (see :mod:`services.history`), or ``None``
+        before its first settlement.
+
+        :meth:`apply_settlement` adds every settlement to them, atomically
+        with the settlement itself.
+        """
+
+    # -- aggregates --------------------------------------------------------
+
+    @abstractmethod
+    def iter_agency_stats(self) -> Iterator[AgencyStats]:
+        """Leaderboard aggregates of every agency."""
@@ -0,0 +1,385 @@
+"""A process-local store kept entirely in dicts and arrays.
+
+Nothing is persisted.  It exists so tests, the benchmarks and the economy
+tooling can run the real cogs and settlement code at memory speed, and as
+the reference for what a new backend has to do.  One lock serialises
+writers, which gives the same atomicity the SQLite store gets from its
+transactions.
+
+Per agency, girls are kept column-wise: parallel ``array``s for the numeric
+columns and lists for the text ones, plus an id -> row index map.  Settlement
+reads and writes whole columns, so a tick touches a handful of arrays
+instead of hundreds of dicts.
+
+Each agency keeps its latest :data:`KEEP_EVENTS` economy events; older ones
+are dropped, as nothing here is persisted anyway.  History rollups are kept
+decoded, as the same :class:`~services.history.History` the SQLite store
+packs into blobs.
+"""
+
+from __future__ import annotations
+
+import threading
+from array import array
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from db.database import connect, now_ts
+from services import ledger
+from services.history import History
+from services.ledger import LedgerEvent
+from services.roster import (
+    BULK_ACTIONS,
+    ROTATE_REST_BELOW,
+    ROTATE_WORK_ABOVE,
+    BulkResult,
+    RosterFilter,
+    matches,
+    sort_rows,
+)
+
+from storage.base import (
+    GIRL_COLUMNS,
+    AgencyStats,
+    GirlState,
+    GirlUpdate,
+    PullResult,
+    StaminaState,
+    Storage,
+    TickState,
+)
+
+_FLOAT_COLUMNS = ("income", "popularity", "fans", "stamina")
+_INT_COLUMNS = ("id", "level", "is_working")
+_TEXT_COLUMNS = ("name", "rarity", "xp", "image_url", "specialty")
+
+KEEP_EVENTS = 256
+
+
+class _Roster:
+    __slots__ = ("columns", "index", "by_name")
+
+    def __init__(self) -> None:
+        self.columns: Dict[str, Any] = {name: array("d") for name in _FLOAT_COLUMNS}
+        self.columns.update({name: array("q") for name in _INT_COLUMNS})
+        self.columns.update({name: [] for name in _TEXT_COLUMNS})
+        self.index: Dict[int, int] = {}  # girl id -> position
+        self.by_name: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def append(self, values: Mapping[str, Any]) -> None:
+        position = len(self.index)
+        for name, column in self.columns.items():
+            column.append(values[name])
+        self.index[int(values["id"])] = position
+        self.by_name[values["name"]] = position
+
+    def row(self, user_id: int, position: int) -> Dict[str, Any]:
+        row = {name: self.columns[name][position] for name in GIRL_COLUMNS if name != "user_id"}
+        row["user_id"] = user_id
+        return row
+
+
+class _Agency:
+    __slots__ = ("money", "last_tick", "starter_claimed", "girls", "stats", "events", "history")
+
+    def __init__(self, money: float = 0.0, last_tick: int = 0, starter_claimed: bool = False) -> None:
+        self.money = money
+        self.last_tick = last_tick
+        self.starter_claimed = starter_claimed
+        self.girls = _Roster()
+        self.stats: Optional[Tuple[float, float, int]] = None
+        self.events: "deque[LedgerEvent]" = deque(maxlen=KEEP_EVENTS)
+        self.history: Optional[History] = None
+
+    def record(self, user_id: int, kind: str, amount: float, ts: int, ref: Optional[str] = None) -> None:
+        self.events.append(LedgerEvent(user_id, ts, kind, amount, self.money, ref))
+        ledger.LEDGER_EVENTS.labels(kind).inc()
+
+
+class MemoryStorage(Storage):
+    name = "memory"
+
+    def __init__(self) -> None:
+        self._agencies: Dict[int, _Agency] = {}
+        self._next_id = 1
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._agencies)
+
+    @classmethod
+    def from_sqlite(cls, *paths: Path) -> "MemoryStorage":
+        """Copy agencies, rosters and stats out of SQLite files (e.g. every
+        partition) into a fresh store.  Girl ids are kept."""
+
+        store = cls()
+        for path in paths:
+            con = connect(path)
+            try:
+                for row in con.execute("SELECT user_id, money, last_tick, starter_claimed FROM users"):
+                    store._agencies[row["user_id"]] = _Agency(
+                        float(row["money"]), int(row["last_tick"]), bool(row["starter_claimed"])
+                    )
+                for row in con.execute("SELECT * FROM user_girls ORDER BY id"):
+                    agency = store._agencies.get(row["user_id"])
+                    if agency is not None:
+                        agency.girls.append(_coerce(dict(row)))
+                        store._next_id = max(store._next_id, row["id"] + 1)
+                for row in con.execute("SELECT user_id, money, fans, level FROM agency_stats"):
+                    agency = store._agencies.get(row["user_id"])
+                    if agency is not None:
+                        agency.stats = (float(row["money"]), float(row["fans"]), int(row["level"]))
+                for row in con.execute("SELECT user_id, data FROM agency_history"):
+                    agency = store._agencies.get(row["user_id"])
+                    if agency is not None:
+                        agency.history = History.decode(row["data"])
+            finally:
+                con.close()
+        return store
+
+    # -- agencies ----------------------------------------------------------
+
+    def ensure_agency(self, user_id: int) -> None:
+        with self._lock:
+            if user_id not in self._agencies:
+                self._agencies[user_id] = _Agency(last_tick=now_ts())
+
+    def balance(self, user_id: int) -> Optional[float]:
+        agency = self._agencies.get(user_id)
+        return agency.money if agency else None
+
+    def claim_starter(self, user_id: int, money: float, girl: Mapping[str, Any]) -> bool:
+        with self._lock:
+            agency = self._agencies[user_id]
+            if agency.starter_claimed or len(agency.girls):
+                agency.starter_claimed = True
+                return False
+            agency.money += money
+            agency.starter_claimed = True
+            agency.record(user_id, ledger.STARTER, money, now_ts(), girl["name"])
+            self._add_girl(agency, girl, None)
+            return True
+
+    def _add_girl(self, agency: _Agency, girl: Mapping[str, Any], image_url: Optional[str]) -> None:
+        agency.girls.append(
+            {
+                "id": self._next_id,
+                "name": girl["name"],
+                "rarity": girl["rarity"],
+                "level": 1,
+                "xp": "0",
+                "income": float(girl["income"]),
+                "popularity": float(girl["popularity"]),
+                "fans": 0.0,
+                "stamina": 100.0,
+                "is_working": 1,
+                "image_url": image_url,
+                "specialty": girl.get("specialty"),
+            }
+        )
+        self._next_id += 1
+
+    # -- settlement --------------------------------------------------------
+
+    def tick_state(self, user_id: int) -> Optional[TickState]:
+        agency = self._agencies.get(user_id)
+        if agency is None:
+            return None
+        c = agency.girls.columns
+        girls: List[GirlState] = [
+            (gid, income, pop, fans, stamina, bool(working), level, xp)
+            for gid, income, pop, fans, stamina, working, level, xp in zip(
+                c["id"], c["income"], c["popularity"], c["fans"], c["stamina"], c["is_working"], c["level"], c["xp"]
+            )
+        ]
+        return TickState(agency.money, agency.last_tick, girls)
+
+    def stamina_state(self, user_id: int) -> Optional[StaminaState]:
+        agency = self._agencies.get(user_id)
+        if agency is None:
+            return None
+        c = agency.girls.columns
+        girls = [(name, stamina, bool(working)) for name, stamina, working in zip(c["name"], c["stamina"], c["is_working"])]
+        return StaminaState(agency.last_tick, girls)
+
+    def apply_settlement(
+        self,
+        user_id: int,
+        last: int,
+        now: int,
+        money_gain: float,
+        updates: Sequence[GirlUpdate],
+        stats: AgencyStats,
+        read: Sequence[GirlState],
+    ) -> bool:
+        with self._lock:
+            agency = self._agencies.get(user_id)
+            if agency is None or agency.last_tick != last:
+                return False
+            c = agency.girls.columns
+            index = agency.girls.index
+            for girl in read:
+                position = index.get(girl[0])
+                if position is None or c["stamina"][position] != girl[4] or bool(c["is_working"][position]) != girl[5]:
+                    return False
+            agency.money += money_gain
+            agency.last_tick = now
+            if money_gain:
+                agency.record(user_id, ledger.TICK, money_gain, now)
+            for stamina, working, fans, xp, level, income, gid in updates:
+                position = index.get(gid)
+                if position is None:
+                    continue
+                c["stamina"][position] = stamina
+                c["is_working"][position] = working
+                c["fans"][position] = fans
+                c["xp"][position] = xp
+                c["level"][position] = level
+                c["income"][position] = income
+            agency.stats = (stats.money, stats.fans, stats.level)
+            if agency.history is None:
+                agency.history = History()
+            agency.history.add(last, now, stats.money, stats.fans, money_gain)
+            return True
+
+    # -- roster ------------------------------------------------------------
+
+    def _rows(self, user_id: int) -> List[Dict[str, Any]]:
+        agency = self._agencies.get(user_id)
+        if agency is None:
+            return []
+        return [agency.girls.row(user_id, position) for position in range(len(agency.girls))]
+
+    def roster(self, user_id: int, flt: Optional[RosterFilter] = None) -> List[Dict[str, Any]]:
+        flt = flt or RosterFilter()
+        with self._lock:
+            rows = self._rows(user_id)
+        return sort_rows([row for row in rows if matches(row, flt)], flt.sort)
+
+    def girl_names(self, user_id: int) -> Dict[int, str]:
+        agency = self._agencies.get(user_id)
+        if agency is None:
+            return {}
+        with self._lock:
+            return dict(zip(agency.girls.columns["id"], agency.girls.columns["name"]))
+
+    def specialties(self, user_id: int, prefix: str = "", limit: int = 25) -> List[str]:
+        agency = self._agencies.get(user_id)
+        if agency is None:
+            return []
+        folded = prefix.casefold()
+        with self._lock:
+            names = {s for s in agency.girls.columns["specialty"] if s and s.casefold().startswith(folded)}
+        return sorted(names, key=str.casefold)[:limit]
+
+    def toggle_working(self, user_id: int, girl_id: int) -> Optional[bool]:
+        with self._lock:
+            agency = self._agencies.get(user_id)
+            position = agency.girls.index.get(girl_id) if agency else None
+            if position is None:
+                return None
+            working = agency.girls.columns["is_working"]
+            working[position] = 1 - working[position]
+            return bool(working[position])
+
+    def bulk_set_working(
+        self,
+        user_id: int,
+        action: str,
+        flt: Optional[RosterFilter] = None,
+        rest_below: float = ROTATE_REST_BELOW,
+        work_above: float = ROTATE_WORK_ABOVE,
+    ) -> BulkResult:
+        if action not in BULK_ACTIONS:
+            raise ValueError(f"Unknown bulk action: {action}")
+        flt = flt or RosterFilter()
+        rested = started = 0
+        with self._lock:
+            agency = self._agencies.get(user_id)
+            if agency is None:
+                return BulkResult(0, 0)
+            working = agency.girls.columns["is_working"]
+            stamina = agency.girls.columns["stamina"]
+            for position in range(len(agency.girls)):
+                if not matches(agency.girls.row(user_id, position), flt):
+                    continue
+                if working[position]:
+                    if action == "rest" or (action == "rotate" and stamina[position] < rest_below):
+                        working[position] = 0
+                        rested += 1
+                elif action == "work" or (action == "rotate" and stamina[position] >= work_above):
+                    working[position] = 1
+                    started += 1
+        return BulkResult(rested=rested, started=started)
+
+    def set_image_refs(self, user_id: int, updates: Sequence[Tuple[str, int]]) -> None:
+        with self._lock:
+            agency = self._agencies.get(user_id)
+            if agency is None:
+                return
+            for ref, gid in updates:
+                position = agency.girls.index.get(gid)
+                if position is not None:
+                    agency.girls.columns["image_url"][position] = ref
+
+    # -- gacha -------------------------------------------------------------
+
+    def record_pull(
+        self, user_id: int, girl: Mapping[str, Any], image_url: Optional[str], cost: float, cashback: int
+    ) -> Optional[PullResult]:
+        with self._lock:
+            agency = self._agencies.get(user_id)
+            if agency is None or agency.money < cost:
+                return None
+            agency.money -= cost
+            now = now_ts()
+            agency.record(user_id, ledger.PULL, -cost, now, girl["name"])
+            position = agency.girls.by_name.get(girl["name"])
+            if position is None:
+                self._add_girl(agency, girl, image_url)
+                return PullResult(True, agency.money, 0)
+            agency.money += cashback
+            agency.record(user_id, ledger.CASHBACK, cashback, now, girl["name"])
+            if image_url:
+                agency.girls.columns["image_url"][position] = image_url
+            return PullResult(False, agency.money, cashback)
+
+    # -- ledger ------------------------------------------------------------
+
+    def ledger(self, user_id: int, limit: int = 20) -> List[LedgerEvent]:
+        agency = self._agencies.get(user_id)
+        if agency is None:
+            return []
+        with self._lock:
+            events = list(agency.events)
+        return events[::-1][:limit]
+
+    # -- history -----------------------------------------------------------
+
+    def history(self, user_id: int) -> Optional[History]:
+        agency = self._agencies.get(user_id)
+        if agency is None:
+            return None
+        with self._lock:
+            # A copy, so callers never see a half-applied settlement.
+            return History.decode(agency.history.encode()) if agency.history is not None else None
+
+    # -- aggregates --------------------------------------------------------
+
+    def iter_agency_stats(self) -> Iterator[AgencyStats]:
+        with self._lock:
+            stats = [(uid, agency.stats) for uid, agency in self._agencies.items() if agency.stats is not None]
+        for user_id, (money, fans, level) in stats:
+            yield AgencyStats(user_id, money, fans, level)
+
+
+def _coerce(row: Dict[str, Any]) -> Dict[str, Any]:
+    for name in _FLOAT_COLUMNS:
+        row[name] = float(row[name])
+    for name in _INT_COLUMNS:
+        row[name] = int(row[name])
+    return row
@@ -0,0 +1,321 @@
+"""The production store: partitioned SQLite files (see :mod:`db.database`).
+
+Opening a connection costs about as much as a small settlement, so each
+thread keeps one connection per partition file and reuses it.  Every method
+commits or rolls back before returning; nothing is held open between calls
+except the connection itself.
+
+Writes that move money (and append to the ledger) are units of work handed
+to the partition's group-commit writer (:mod:`services.ledger`), so
+concurrent settlements and pulls share one commit.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, TypeVar
+
+from db import database
+from db.database import each_partition
+from services import history as history_store
+from services import ledger
+from services import roster as roster_queries
+from services.archive import ARCHIVE_MOVES, RESTORED
+from services.history import History
+from services.ledger import LedgerEvent
+from services.roster import ROTATE_REST_BELOW, ROTATE_WORK_ABOVE, BulkResult, RosterFilter, build_roster_query
+
+from storage.base import AgencyStats, GirlState, GirlUpdate, PullResult, StaminaState, Storage, TickState, girl_state
+
+T = TypeVar("T")
+
+# Ids per ``IN (...)`` list, well under SQLite's parameter limit.
+_IN_CHUNK = 500
+
+
+class _RosterChanged(Exception):
+    """Rolls back a settlement whose roster changed after it was read."""
+
+
+_INSERT_GIRL = """
+    INSERT OR IGNORE INTO user_girls(
+        user_id, name, rarity, level, xp, income, popularity, fans, stamina, is_working, image_url, specialty
+    )
+    VALUES(?,?,?,1,'0',?,?,0,100,1,?,?)
+"""
+
+
+def _girl_params(user_id: int, girl: Mapping[str, Any], image_url: Optional[str]) -> Tuple[Any, ...]:
+    return (
+        user_id,
+        girl["name"],
+        girl["rarity"],
+        girl["income"],
+        girl["popularity"],
+        image_url,
+        girl.get("specialty"),
+    )
+
+
+class SQLiteStorage(Storage):
+    name = "sqlite"
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+
+    @contextmanager
+    def _db(self, user_id: int) -> Iterator[sqlite3.Connection]:
+        """This thread's connection to ``user_id``'s partition."""
+
+        cache: Optional[Dict[Any, sqlite3.Connection]] = getattr(self._local, "connections", None)
+        if cache is None:
+            cache = self._local.connections = {}
+        # Keyed by factory too so set_connection_factory() takes effect.
+        key = (database.partition_path(user_id), database.CONNECTION_FACTORY)
+        con = cache.get(key)
+        if con is None:
+            con = cache[key] = database.connect(key[0])
+        try:
+            yield con
+        except BaseException:
+            con.rollback()
+            raise
+        if con.in_transaction:
+            con.rollback()
+
+    def _write(self, user_id: int, unit: Callable[[sqlite3.Cursor], T]) -> T:
+        """Run ``unit`` in a transaction on ``user_id``'s partition, through
+        its group-commit writer unless ``LEDGER_GROUP_COMMIT=0``."""
+
+        if ledger.group_commit_enabled():
+            return ledger.get_writer(database.partition_path(user_id)).submit(unit)
+        with self._db(user_id) as con:
+            return ledger.run_unit(con, unit)
+
+    def close(self) -> None:
+        """Close this thread's cached connections (e.g. before replacing a
+        database file at the same path)."""
+
+        for con in getattr(self._local, "connections", {}).values():
+            con.close()
+        self._local.connections = {}
+
+    def ensure_agency(self, user_id: int) -> None:
+        with self._db(user_id) as con:
+            if con.execute("SELECT 1 FROM users WHERE user_id=?", (user_id,)).fetchone() is not None:
+                return
+            # An archived agency comes back instead of a new one.
+            created = con.execute(
+                "INSERT OR IGNORE INTO users(user_id, money, last_tick, starter_claimed) "
+                "SELECT ?, 0, ?, 0 WHERE NOT EXISTS (SELECT 1 FROM archived_users WHERE user_id=?)",
+                (user_id, database.now_ts(), user_id),
+            ).rowcount
+            con.commit()
+        if not created and self._write(user_id, lambda cur: database.restore_agency(cur, user_id)):
+            ARCHIVE_MOVES.labels(RESTORED).inc()
+
+    def balance(self, user_id: int) -> Optional[float]:
+        with self._db(user_id) as con:
+            row = con.execute("SELECT money FROM users WHERE user_id=?", (user_id,)).fetchone()
+        return float(row["money"]) if row else None
+
+    def claim_starter(self, user_id: int, money: float, girl: Mapping[str, Any]) -> bool:
+        def unit(cur: sqlite3.Cursor) -> bool:
+            row = cur.execute("SELECT starter_claimed FROM users WHERE user_id=?", (user_id,)).fetchone()
+            already_claimed = bool(row and row["starter_claimed"])
+            have_any = cur.execute("SELECT 1 FROM user_girls WHERE user_id=? LIMIT 1", (user_id,)).fetchone() is not None
+            if already_claimed or have_any:
+                if not already_claimed:
+                    cur.execute("UPDATE users SET starter_claimed=1 WHERE user_id=?", (user_id,))
+                return False
+            cur.execute("UPDATE users SET money = money + ?, starter_claimed = 1 WHERE user_id=?", (money, user_id))
+            ledger.record(cur, user_id, ledger.STARTER, money, database.now_ts(), girl["name"])
+            cur.execute(_INSERT_GIRL, _girl_params(user_id, girl, None))
+            return True
+
+        return self._write(user_id, unit)
+
+    def tick_state(self, user_id: int) -> Optional[TickState]:
+        with self._db(user_id) as con:
+            row = con.execute("SELECT money, last_tick FROM users WHERE user_id=?", (user_id,)).fetchone()
+            if not row:
+                return None
+            girls = con.execute(
+                "SELECT id, income, popularity, fans, stamina, is_working, level, xp FROM user_girls WHERE user_id=?",
+                (user_id,),
+            ).fetchall()
+        return TickState(float(row["money"]), row["last_tick"], [girl_state(g) for g in girls])
+
+    def stamina_state(self, user_id: int) -> Optional[StaminaState]:
+        return self.stamina_states([user_id]).get(user_id)
+
+    def stamina_states(self, user_ids: Iterable[int]) -> Dict[int, StaminaState]:
+        by_partition: Dict[Any, List[int]] = {}
+        for user_id in user_ids:
+            by_partition.setdefault(database.partition_path(user_id), []).append(user_id)
+        states: Dict[int, StaminaState] = {}
+        for ids in by_partition.values():
+            with self._db(ids[0]) as con:
+                for start in range(0, len(ids), _IN_CHUNK):
+                    chunk = ids[start : start + _IN_CHUNK]
+                    # One statement, so the clock and the roster agree.
+                    rows = con.execute(
+                        f"""
+                        SELECT u.user_id, u.last_tick, g.name, g.stamina, g.is_working
+                        FROM users u LEFT JOIN user_girls g ON g.user_id = u.user_id
+                        WHERE u.user_id IN ({",".join("?" * len(chunk))})
+                        """,
+                        chunk,
+                    ).fetchall()
+                    for row in rows:
+                        state = states.get(row["user_id"])
+                        if state is None:
+                            state = states[row["user_id"]] = StaminaState(row["last_tick"], [])
+                        if row["name"] is not None:
+                            state.girls.append((row["name"], float(row["stamina"]), bool(row["is_working"])))
+        return states
+
+    def apply_settlement(
+        self,
+        user_id: int,
+        last: int,
+        now: int,
+        money_gain: float,
+        updates: Sequence[GirlUpdate],
+        stats: AgencyStats,
+        read: Sequence[GirlState],
+    ) -> bool:
+        def unit(cur: sqlite3.Cursor) -> bool:
+            cur.execute(
+                "UPDATE users SET money=money+?, last_tick=? WHERE user_id=? AND last_tick=?",
+                (money_gain, now, user_id, last),
+            )
+            if cur.rowcount == 0:
+                return False
+            if money_gain:
+                ledger.record(cur, user_id, ledger.TICK, money_gain, now)
+            cur.executemany(
+                "UPDATE user_girls SET stamina=?, is_working=?, fans=?, xp=?, level=?, income=? "
+                "WHERE id=? AND stamina=? AND is_working=?",
+                [(*update, girl[4], girl[5]) for update, girl in zip(updates, read)],
+            )
+            if cur.rowcount != len(updates):
+                # Undoes this unit only, including the users row above.
+                raise _RosterChanged()
+            cur.execute(
+                """
+                INSERT INTO agency_stats(user_id, money, fans, level, updated_at) VALUES(?,?,?,?,?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    money=excluded.money, fans=excluded.fans, level=excluded.level, updated_at=excluded.updated_at
+                """,
+                (user_id, stats.money, stats.fans, stats.level, now),
+            )
+            history_store.record(cur, user_id, last, now, stats.money, stats.fans, money_gain)
+            return True
+
+        try:
+            return self._write(user_id, unit)
+        except _RosterChanged:
+            return False
+
+    def roster(self, user_id: int, flt: Optional[RosterFilter] = None) -> List[Dict[str, Any]]:
+        with self._db(user_id) as con:
+            return [dict(row) for row in roster_queries.fetch_roster(con.cursor(), user_id, flt)]
+
+    def roster_page(
+        self, user_id: int, flt: Optional[RosterFilter] = None, offset: int = 0, limit: int = 10
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        flt = flt or RosterFilter()
+        sql, params = build_roster_query(user_id, flt)
+        where, where_params = roster_queries.roster_where(user_id, flt)
+        with self._db(user_id) as con:
+            rows = con.execute(f"{sql} LIMIT ? OFFSET ?", [*params, limit, offset]).fetchall()
+            total = con.execute(f"SELECT COUNT(*) FROM user_girls WHERE {where}", where_params).fetchone()[0]
+        return [dict(row) for row in rows], int(total)
+
+    def girl_names(self, user_id: int) -> Dict[int, str]:
+        with self._db(user_id) as con:
+            rows = con.execute("SELECT id, name FROM user_girls WHERE user_id=?", (user_id,)).fetchall()
+        return {row["id"]: row["name"] for row in rows}
+
+    def specialties(self, user_id: int, prefix: str = "", limit: int = 25) -> List[str]:
+        with self._db(user_id) as con:
+            return roster_queries.specialties(con.cursor(), user_id, prefix, limit)
+
+    def toggle_working(self, user_id: int, girl_id: int) -> Optional[bool]:
+        with self._db(user_id) as con:
+            cur = con.cursor()
+            cur.execute(
+                "UPDATE user_girls SET is_working = 1 - is_working WHERE id=? AND user_id=?",
+                (girl_id, user_id),
+            )
+            if cur.rowcount == 0:
+                return None
+            row = cur.execute("SELECT is_working FROM user_girls WHERE id=?", (girl_id,)).fetchone()
+            con.commit()
+            return bool(row["is_working"])
+
+    def bulk_set_working(
+        self,
+        user_id: int,
+        action: str,
+        flt: Optional[RosterFilter] = None,
+        rest_below: float = ROTATE_REST_BELOW,
+        work_above: float = ROTATE_WORK_ABOVE,
+    ) -> BulkResult:
+        with self._db(user_id) as con:
+            return roster_queries.bulk_set_working(con, user_id, action, flt, rest_below, work_above)
+
+    def set_image_refs(self, user_id: int, updates: Sequence[Tuple[str, int]]) -> None:
+        if not updates:
+            return
+        with self._db(user_id) as con:
+            con.executemany("UPDATE user_girls SET image_url=? WHERE id=?", updates)
+            con.commit()
+
+    def record_pull(
+        self, user_id: int, girl: Mapping[str, Any], image_url: Optional[str], cost: float, cashback: int
+    ) -> Optional[PullResult]:
+        def unit(cur: sqlite3.Cursor) -> Optional[PullResult]:
+            cur.execute("UPDATE users SET money=money-? WHERE user_id=? AND money>=?", (cost, user_id, cost))
+            if cur.rowcount == 0:
+                return None
+            now = database.now_ts()
+            ledger.record(cur, user_id, ledger.PULL, -cost, now, girl["name"])
+            cur.execute(_INSERT_GIRL, _girl_params(user_id, girl, image_url))
+            new = cur.rowcount > 0
+            if not new:
+                cur.execute("UPDATE users SET money=money+? WHERE user_id=?", (cashback, user_id))
+                ledger.record(cur, user_id, ledger.CASHBACK, cashback, now, girl["name"])
+                if image_url:
+                    cur.execute(
+                        "UPDATE user_girls SET image_url=? WHERE user_id=? AND name=?",
+                        (image_url, user_id, girl["name"]),
+                    )
+            money = cur.execute("SELECT money FROM users WHERE user_id=?", (user_id,)).fetchone()["money"]
+            return PullResult(new, float(money), 0 if new else cashback)
+
+        return self._write(user_id, unit)
+
+    # -- ledger ------------------------------------------------------------
+
+    def ledger(self, user_id: int, limit: int = 20) -> List[LedgerEvent]:
+        with self._db(user_id) as con:
+            rows = con.execute(
+                "SELECT user_id, ts, kind, amount, balance, ref FROM economy_ledger "
+                "WHERE user_id=? ORDER BY id DESC LIMIT ?",
+                (user_id, limit),
+            ).fetchall()
+        return [LedgerEvent(*row) for row in rows]
+
+    def history(self, user_id: int) -> Optional[History]:
+        with self._db(user_id) as con:
+            row = con.execute("SELECT data FROM agency_history WHERE user_id=?", (user_id,)).fetchone()
+        return History.decode(row[0]) if row else None
+
+    def iter_agency_stats(self) -> Iterator[AgencyStats]:
+        for con in each_partition():
+            for row in con.execute("SELECT user_id, money, fans, level FROM agency_stats"):
+                yield AgencyStats(row["user_id"], row["money"], row["fans"], row["level"])
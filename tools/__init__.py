@@ -0,0 +1 @@
+"""Operator command line tools (``python -m tools.<name>``)."""
@@ -0,0 +1,189 @@
+"""Idle-agency archive: ``python -m tools.archive``.
+
+``run`` moves agencies idle for ``--idle-days`` into the archive tables
+(see :mod:`services.archive`) and prints the hot tables' rows, size and
+query latency before and after.  ``status`` prints the same numbers
+without moving anything.  ``restore`` brings one agency back at once
+instead of on its next command.  Safe while the bot is running.
+
+Latency is the median of each probe, repeated ``--repeat`` times: point
+lookups and roster reads for the ``--samples`` most recently played
+agencies (which stay hot), and full scans of ``users`` and ``user_girls``
+like the ones exports and leaderboard rebuilds do.  Sizes count the pages
+of each table and its indexes and need SQLite's ``dbstat`` table.
+
+Examples::
+
+    python -m tools.archive status
+    python -m tools.archive run --idle-days 30 --batch 500
+    python -m tools.archive restore 123456789012345678
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from db import database
+from db.database import partition_path, partition_paths, set_db_path
+from services import ledger
+from services.archive import archive_idle, idle_days, table_rows
+
+HOT_TABLES = ("users", "user_girls")
+
+# name -> (query, takes a sampled user id)
+PROBES: Dict[str, Tuple[str, bool]] = {
+    "agency lookup": ("SELECT money, last_tick, starter_claimed FROM users WHERE user_id=?", True),
+    "roster": ("SELECT * FROM user_girls WHERE user_id=? ORDER BY id", True),
+    "users scan": ("SELECT COUNT(*), SUM(money) FROM users", False),
+    "girls scan": ("SELECT COUNT(*), SUM(income) FROM user_girls", False),
+}
+
+Measurement = Dict[str, Optional[float]]
+
+
+def table_bytes(con: sqlite3.Connection, table: str) -> Optional[int]:
+    """Bytes in the pages of ``table`` and its indexes, or ``None`` without dbstat."""
+
+    try:
+        row = con.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name=?)",
+            (table,),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return int(row[0] or 0)
+
+
+def sample_agencies(count: int) -> Dict[Path, List[int]]:
+    """The ``count`` most recently settled agencies of every partition."""
+
+    sample: Dict[Path, List[int]] = {}
+    for path in partition_paths():
+        con = database.connect(path)
+        try:
+            rows = con.execute("SELECT user_id FROM users ORDER BY last_tick DESC LIMIT ?", (count,)).fetchall()
+        finally:
+            con.close()
+        sample[path] = [row[0] for row in rows]
+    return sample
+
+
+def _median_seconds(con: sqlite3.Connection, query: str, ids: List[Optional[int]], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        for user_id in ids:
+            params = () if user_id is None else (user_id,)
+            began = time.perf_counter()
+            con.execute(query, params).fetchall()
+            timings.append(time.perf_counter() - began)
+    return statistics.median(timings)
+
+
+def measure(sample: Dict[Path, List[int]], repeat: int) -> Measurement:
+    """Rows, sizes and probe latencies, summed or pooled over every partition."""
+
+    result: Measurement = {f"{table} rows": float(count) for table, count in table_rows().items()}
+    sizes: Dict[str, Optional[float]] = {table: 0.0 for table in HOT_TABLES}
+    latencies: Dict[str, List[float]] = {name: [] for name in PROBES}
+    for path, ids in sample.items():
+        con = database.connect(path)
+        try:
+            for table in HOT_TABLES:
+                size = table_bytes(con, table)
+                current = sizes[table]
+                sizes[table] = None if size is None or current is None else current + size
+            for name, (query, per_agency) in PROBES.items():
+                if per_agency and not ids:
+                    continue
+                probe_ids: List[Optional[int]] = list(ids) if per_agency else [None]
+                latencies[name].append(_median_seconds(con, query, probe_ids, repeat))
+        finally:
+            con.close()
+    for table, size in sizes.items():
+        result[f"{table} MB"] = None if size is None else size / 1e6
+    for name, values in latencies.items():
+        result[f"{name} µs"] = statistics.median(values) * 1e6 if values else None
+    return result
+
+
+def _cell(value: Optional[float]) -> str:
+    if value is None:
+        return f"{'n/a':>12}"
+    return f"{value:>12.0f}" if value >= 100 or value.is_integer() else f"{value:>12.2f}"
+
+
+def print_measurements(columns: Sequence[Tuple[str, Measurement]]) -> None:
+    print(f"{'':<30}" + "".join(f"{title:>12}" for title, _ in columns))
+    for key in columns[0][1]:
+        print(f"{key:<30}" + "".join(_cell(values.get(key)) for _, values in columns))
+
+
+def cmd_status(args: argparse.Namespace) -> int:
+    print_measurements([("now", measure(sample_agencies(args.samples), args.repeat))])
+    return 0
+
+
+def cmd_run(args: argparse.Namespace) -> int:
+    days = args.idle_days if args.idle_days is not None else idle_days()
+    if days <= 0:
+        print("The idle threshold must be a positive number of days")
+        return 2
+    sample = sample_agencies(args.samples)
+    before = measure(sample, args.repeat)
+    report = archive_idle(days, batch=args.batch, pause=args.pause)
+    after = measure(sample, args.repeat)
+    print(f"Idle for {days:g} days: {report.summary()}")
+    print_measurements([("before", before), ("after", after)])
+    return 0
+
+
+def cmd_restore(args: argparse.Namespace) -> int:
+    con = database.connect(partition_path(args.user_id))
+    try:
+        restored = ledger.run_unit(con, lambda cur: database.restore_agency(cur, args.user_id))
+    finally:
+        con.close()
+    if not restored:
+        print(f"{args.user_id} is not archived")
+        return 1
+    print(f"Restored {args.user_id}")
+    return 0
+
+
+COMMANDS = {"status": cmd_status, "run": cmd_run, "restore": cmd_restore}
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m tools.archive", description=__doc__.splitlines()[0])
+    parser.add_argument("--db", type=Path, default=Path("idol_agency.db"), help="home database (partition 0)")
+    parser.add_argument("--samples", type=int, default=200, help="agencies per partition for lookup probes")
+    parser.add_argument("--repeat", type=int, default=5, help="times each probe runs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="rows, size and query latency of the hot tables")
+    run = sub.add_parser("run", help="archive idle agencies now")
+    run.add_argument("--idle-days", type=float, help="idle threshold in days (ARCHIVE_IDLE_DAYS)")
+    run.add_argument("--batch", type=int, help="agencies per transaction (ARCHIVE_BATCH)")
+    run.add_argument("--pause", type=float, help="seconds between transactions (ARCHIVE_PAUSE)")
+    restore = sub.add_parser("restore", help="bring one agency back from the archive")
+    restore.add_argument("user_id", type=int)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if not args.db.exists():
+        print(f"{args.db} does not exist")
+        return 2
+    set_db_path(args.db)
+    database.init_db()
+    return COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
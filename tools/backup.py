@@ -0,0 +1,115 @@
+"""Online backups: ``python -m tools.backup``.
+
+Safe while the bot is running.  ``snapshot`` copies every partition with
+SQLite's backup API in small steps.  ``export`` streams agencies and rosters
+to gzipped JSON lines.  ``--probe`` commits a tiny write every few
+milliseconds during the run and reports how long those commits waited.
+That is the pause a live command would have seen.
+
+Examples::
+
+    python -m tools.backup snapshot
+    python -m tools.backup snapshot --pages 64 --pause 0.01 --probe
+    python -m tools.backup export --out agencies.jsonl.gz
+    python -m tools.backup export --from backups/snapshot-20260101-120000
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from db.database import partition_paths, set_db_path
+from services.backup import backup_database, export_jsonl, snapshot_sources
+
+
+class WriteProbe:
+    """Commits to ``bot_meta`` in a loop and records each commit's latency."""
+
+    def __init__(self, path: Path, interval: float = 0.005) -> None:
+        self.path = path
+        self.interval = interval
+        self.latencies: List[float] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="backup-probe", daemon=True)
+
+    def _run(self) -> None:
+        con = sqlite3.connect(self.path, timeout=30)
+        try:
+            while not self._stop.is_set():
+                began = time.perf_counter()
+                con.execute(
+                    "INSERT INTO bot_meta(key, value) VALUES('backup_probe', ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                    (str(time.time()),),
+                )
+                con.commit()
+                self.latencies.append(time.perf_counter() - began)
+                self._stop.wait(self.interval)
+            con.execute("DELETE FROM bot_meta WHERE key='backup_probe'")
+            con.commit()
+        finally:
+            con.close()
+
+    def __enter__(self) -> "WriteProbe":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self) -> str:
+        if not self.latencies:
+            return "probe: no writes"
+        ordered = sorted(self.latencies)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        return (
+            f"probe: {len(ordered)} writes, p50 {ordered[len(ordered) // 2] * 1000:.1f}ms "
+            f"p99 {p99 * 1000:.1f}ms max {ordered[-1] * 1000:.1f}ms"
+        )
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m tools.backup", description=__doc__.splitlines()[0])
+    parser.add_argument("--db", type=Path, default=Path("idol_agency.db"), help="home database (partition 0)")
+    parser.add_argument("--pause", type=float, help="seconds to sleep between steps (BACKUP_STEP_PAUSE)")
+    parser.add_argument("--probe", action="store_true", help="measure write latency on the home database meanwhile")
+    sub = parser.add_subparsers(dest="command", required=True)
+    snap = sub.add_parser("snapshot", help="online copy of every partition")
+    snap.add_argument("--dest", type=Path, help="target directory (default BACKUP_DIR/snapshot-<time>)")
+    snap.add_argument("--pages", type=int, help="pages per step (BACKUP_STEP_PAGES)")
+    export = sub.add_parser("export", help="agencies and rosters as gzipped JSON lines")
+    export.add_argument("--out", type=Path, help="output file (default BACKUP_DIR/export-<time>.jsonl.gz)")
+    export.add_argument("--batch", type=int, default=500, help="agencies read per query")
+    export.add_argument("--from", dest="source", type=Path, help="export a snapshot directory instead of the live files")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if not args.db.exists():
+        print(f"{args.db} does not exist")
+        return 2
+    set_db_path(args.db)
+    probe = WriteProbe(args.db) if args.probe else None
+    with probe or nullcontext():
+        if args.command == "snapshot":
+            report = backup_database(args.dest, pages=args.pages, pause=args.pause)
+        else:
+            sources = snapshot_sources(args.source) if args.source else partition_paths()
+            report = export_jsonl(args.out, batch=args.batch, pause=args.pause, sources=sources)
+    print(report.summary())
+    if probe is not None:
+        print(probe.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
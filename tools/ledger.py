@@ -0,0 +1,120 @@
+"""Economy ledger maintenance: ``python -m tools.ledger``.
+
+``users.money`` is the running sum of an agency's ledger events (see
+:mod:`services.ledger`).  ``verify`` replays every ledger and reports the
+agencies whose balance disagrees.  ``rebuild`` resets those balances from
+the ledger; stop the bot first.  ``show`` prints one agency's latest events.
+
+Examples::
+
+    python -m tools.ledger verify
+    python -m tools.ledger rebuild
+    python -m tools.ledger show 123456789012345678 --limit 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Optional, Sequence
+
+from db import database
+from db.database import partition_paths, set_db_path
+from services.formatting import format_currency
+from storage.sqlite import SQLiteStorage
+
+# Float sums drift a little when replayed in a different order.  Archived
+# agencies (services.archive) keep their ledger and are checked too.
+_MISMATCH = """
+    SELECT u.user_id, u.money, COALESCE(SUM(l.amount), 0) AS replayed, COUNT(l.id) AS events
+    FROM (SELECT user_id, money FROM users UNION ALL SELECT user_id, money FROM archived_users) u
+    LEFT JOIN economy_ledger l ON l.user_id = u.user_id
+    GROUP BY u.user_id
+    HAVING ABS(u.money - replayed) > 1e-6 * MAX(1, ABS(u.money))
+"""
+
+
+def cmd_verify(args: argparse.Namespace) -> int:
+    agencies = events = bad = 0
+    for path in partition_paths():
+        con = database.connect(path)
+        try:
+            agencies += con.execute(
+                "SELECT (SELECT COUNT(*) FROM users) + (SELECT COUNT(*) FROM archived_users)"
+            ).fetchone()[0]
+            events += con.execute("SELECT COUNT(*) FROM economy_ledger").fetchone()[0]
+            for row in con.execute(_MISMATCH):
+                bad += 1
+                if bad <= args.limit:
+                    print(
+                        f"{row['user_id']}: balance {format_currency(row['money'])}, "
+                        f"ledger {format_currency(row['replayed'])} over {row['events']} events"
+                    )
+        finally:
+            con.close()
+    print(f"{agencies} agencies, {events} events, {bad} mismatched")
+    return 1 if bad else 0
+
+
+def cmd_rebuild(_args: argparse.Namespace) -> int:
+    fixed = 0
+    for path in partition_paths():
+        con = database.connect(path)
+        try:
+            rows = con.execute(_MISMATCH).fetchall()
+            for table in ("users", "archived_users"):
+                con.executemany(
+                    f"UPDATE {table} SET money=? WHERE user_id=?", [(row["replayed"], row["user_id"]) for row in rows]
+                )
+            con.commit()
+            fixed += len(rows)
+        finally:
+            con.close()
+    print(f"Reset {fixed} balances from the ledger")
+    return 0
+
+
+def cmd_show(args: argparse.Namespace) -> int:
+    events = SQLiteStorage().ledger(args.user_id, args.limit)
+    if not events:
+        print(f"No ledger events for {args.user_id}")
+        return 1
+    for event in events:
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(event.ts))
+        print(
+            f"{when}  {event.kind:<9}{format_currency(event.amount):>16}"
+            f"{format_currency(event.balance):>16}  {event.ref or ''}"
+        )
+    return 0
+
+
+COMMANDS = {"verify": cmd_verify, "rebuild": cmd_rebuild, "show": cmd_show}
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m tools.ledger", description=__doc__.splitlines()[0])
+    parser.add_argument("--db", type=Path, default=Path("idol_agency.db"), help="home database (partition 0)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    verify = sub.add_parser("verify", help="replay the ledger against every balance")
+    verify.add_argument("--limit", type=int, default=20, help="mismatches to print")
+    sub.add_parser("rebuild", help="reset mismatched balances from the ledger")
+    show = sub.add_parser("show", help="an agency's latest events")
+    show.add_argument("user_id", type=int)
+    show.add_argument("--limit", type=int, default=20)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if not args.db.exists():
+        print(f"{args.db} does not exist")
+        return 2
+    set_db_path(args.db)
+    database.init_db()
+    return COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""Partition maintenance: ``python -m tools.partitions``.
+
+Agencies live in one of :data:`db.database.SLOT_COUNT` hash slots, and the
+partition map assigns slots to SQLite files (see :mod:`db.database`).  This
+tool shows the layout and moves slots between files.  Stop the bot first:
+a running process keeps using the map it loaded at startup.
+
+Examples::
+
+    python -m tools.partitions status
+    python -m tools.partitions split 0            # half of partition 0 to a new file
+    python -m tools.partitions move 0-63 --to 2
+    python -m tools.partitions rebalance          # even out agencies per file
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from db import database
+from db.database import AGENCY_TABLES, SLOT_COUNT, PartitionMap, partition_map_path, partition_slot
+from services.cluster import parse_shard_ids
+
+
+def load_map(home: Path) -> PartitionMap:
+    path = partition_map_path(home)
+    return PartitionMap.load(path) if path.exists() else PartitionMap.single(home.name)
+
+
+def slot_counts(home: Path, pmap: PartitionMap) -> Counter:
+    """Agencies per slot, read from every partition."""
+
+    counts: Counter = Counter()
+    for name in pmap.files:
+        con = database.connect(home.parent / name)
+        try:
+            for (user_id,) in con.execute("SELECT user_id FROM users"):
+                counts[partition_slot(user_id)] += 1
+        finally:
+            con.close()
+    return counts
+
+
+def move_slots(home: Path, pmap: PartitionMap, slots: Sequence[int], target: int) -> int:
+    """Copy the agencies in ``slots`` to partition ``target``, save the map, then
+    delete them from their old files.  Returns the number of agencies moved."""
+
+    target_path = home.parent / pmap.files[target]
+    con = database.connect(target_path)
+    try:
+        database._init_schema(con)
+    finally:
+        con.close()
+
+    by_source: Dict[int, List[int]] = {}
+    for slot in slots:
+        if pmap.slots[slot] != target:
+            by_source.setdefault(pmap.slots[slot], []).append(slot)
+
+    moved = 0
+    copied: List[int] = []
+    for source, source_slots in sorted(by_source.items()):
+        con = database.connect(home.parent / pmap.files[source])
+        try:
+            con.create_function("partition_slot", 1, partition_slot, deterministic=True)
+            con.execute("ATTACH DATABASE ? AS target", (str(target_path),))
+            con.execute("CREATE TEMP TABLE moving(slot INTEGER PRIMARY KEY)")
+            con.executemany("INSERT INTO moving(slot) VALUES(?)", [(slot,) for slot in source_slots])
+            where = "partition_slot(user_id) IN (SELECT slot FROM moving)"
+            moved += con.execute(f"SELECT COUNT(*) FROM main.users WHERE {where}").fetchone()[0]
+            # Rows for these slots in the target are left over from an
+            # attempt that crashed before the map flipped.  Surrogate ids are
+            # not copied, so they would be duplicated rather than replaced.
+            for table in reversed(list(AGENCY_TABLES)):
+                con.execute(f"DELETE FROM target.{table} WHERE {where}")
+            for table, surrogate in AGENCY_TABLES.items():
+                source_cols = [row[1] for row in con.execute(f"PRAGMA main.table_info({table})")]
+                target_cols = {row[1] for row in con.execute(f"PRAGMA target.table_info({table})")}
+                cols = ", ".join(c for c in source_cols if c in target_cols and not (surrogate and c == "id"))
+                con.execute(f"INSERT INTO target.{table}({cols}) SELECT {cols} FROM main.{table} WHERE {where}")
+            con.commit()
+            copied.append(source)
+        finally:
+            con.close()
+
+    # The map flips only after every copy committed; a crash before this
+    # leaves the old rows authoritative, and the next attempt deletes the
+    # partial copies before copying again.
+    for slot in slots:
+        pmap.slots[slot] = target
+    pmap.save(partition_map_path(home))
+
+    for source in copied:
+        delete_unowned(home, pmap, source)
+    return moved
+
+
+def delete_unowned(home: Path, pmap: PartitionMap, index: int) -> int:
+    """Delete the rows of partition ``index`` whose slot the map assigns to
+    another file; returns the number of agencies removed."""
+
+    con = database.connect(home.parent / pmap.files[index])
+    try:
+        con.create_function("partition_slot", 1, partition_slot, deterministic=True)
+        owned = [slot for slot in range(SLOT_COUNT) if pmap.slots[slot] == index]
+        con.execute("CREATE TEMP TABLE keeping(slot INTEGER PRIMARY KEY)")
+        con.executemany("INSERT INTO keeping(slot) VALUES(?)", [(slot,) for slot in owned])
+        unowned = "partition_slot(user_id) NOT IN (SELECT slot FROM keeping)"
+        removed = con.execute(f"SELECT COUNT(*) FROM users WHERE {unowned}").fetchone()[0]
+        # Children first: the agency tables reference users(user_id).
+        for table in reversed(list(AGENCY_TABLES)):
+            con.execute(f"DELETE FROM {table} WHERE {unowned}")
+        con.commit()
+    finally:
+        con.close()
+    return removed
+
+
+def purge_unowned(home: Path, pmap: PartitionMap) -> int:
+    """Finish an interrupted move: a crash after the map was saved leaves
+    the moved agencies in their old file too, where every reader that walks
+    all partitions would see them twice."""
+
+    removed = 0
+    for index, name in enumerate(pmap.files):
+        if (home.parent / name).exists():
+            removed += delete_unowned(home, pmap, index)
+    return removed
+
+
+def new_partition(home: Path, pmap: PartitionMap) -> int:
+    index = len(pmap.files)
+    pmap.files.append(f"{home.stem}.p{index}{home.suffix}")
+    return index
+
+
+def cmd_status(home: Path, pmap: PartitionMap, _args: argparse.Namespace) -> int:
+    counts = slot_counts(home, pmap)
+    print(f"{home}: {len(pmap.files)} partition(s), {SLOT_COUNT} slots")
+    for index, name in enumerate(pmap.files):
+        slots = [slot for slot in range(SLOT_COUNT) if pmap.slots[slot] == index]
+        agencies = sum(counts[slot] for slot in slots)
+        path = home.parent / name
+        size = path.stat().st_size if path.exists() else 0
+        print(f"  {index:>3}  {name:<32} {len(slots):>5} slots  {agencies:>8} agencies  {size / 1e6:8.1f} MB")
+    return 0
+
+
+def cmd_split(home: Path, pmap: PartitionMap, args: argparse.Namespace) -> int:
+    slots = [slot for slot in range(SLOT_COUNT) if pmap.slots[slot] == args.partition]
+    if len(slots) < 2:
+        print(f"Partition {args.partition} has fewer than two slots; nothing to split")
+        return 1
+    target = new_partition(home, pmap)
+    moved = move_slots(home, pmap, slots[len(slots) // 2 :], target)
+    print(f"Moved {moved} agencies in {len(slots) - len(slots) // 2} slots to partition {target} ({pmap.files[target]})")
+    return 0
+
+
+def cmd_move(home: Path, pmap: PartitionMap, args: argparse.Namespace) -> int:
+    slots = parse_shard_ids(args.slots)
+    bad = [slot for slot in slots if not 0 <= slot < SLOT_COUNT]
+    if bad:
+        print(f"Slots must be in 0-{SLOT_COUNT - 1}; got {bad[:5]}")
+        return 2
+    if args.to == len(pmap.files):
+        new_partition(home, pmap)
+    elif not 0 <= args.to < len(pmap.files):
+        print(f"Partition {args.to} does not exist (use {len(pmap.files)} to create one)")
+        return 2
+    moved = move_slots(home, pmap, slots, args.to)
+    print(f"Moved {moved} agencies in {len(slots)} slots to partition {args.to}")
+    return 0
+
+
+def cmd_rebalance(home: Path, pmap: PartitionMap, _args: argparse.Namespace) -> int:
+    counts = slot_counts(home, pmap)
+    # Largest slots first onto the lightest partition, keeping a slot where it
+    # is when that partition is already among the lightest.
+    load = [0] * len(pmap.files)
+    plan = list(pmap.slots)
+    for slot in sorted(range(SLOT_COUNT), key=lambda s: (-counts[s], s)):
+        lightest = min(range(len(load)), key=lambda p: (load[p], p))
+        current = pmap.slots[slot]
+        if load[current] <= load[lightest]:
+            lightest = current
+        plan[slot] = lightest
+        load[lightest] += counts[slot]
+    moved = 0
+    for target in range(len(pmap.files)):
+        slots = [slot for slot in range(SLOT_COUNT) if plan[slot] == target and pmap.slots[slot] != target]
+        if slots:
+            moved += move_slots(home, pmap, slots, target)
+    print(f"Moved {moved} agencies; agencies per partition: {load}")
+    return 0
+
+
+COMMANDS = {"status": cmd_status, "split": cmd_split, "move": cmd_move, "rebalance": cmd_rebalance}
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m tools.partitions", description=__doc__.splitlines()[0])
+    parser.add_argument("--db", type=Path, default=database.DB_PATH, help="home database (partition 0)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="slots, agencies and size per partition")
+    split = sub.add_parser("split", help="move half of a partition's slots to a new file")
+    split.add_argument("partition", type=int)
+    move = sub.add_parser("move", help="move slots (e.g. 0-63,100) to a partition")
+    move.add_argument("slots")
+    move.add_argument("--to", type=int, required=True, help="target partition; the next index creates a file")
+    sub.add_parser("rebalance", help="spread agencies evenly over the existing files")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    home: Path = args.db
+    if not home.exists():
+        print(f"{home} does not exist")
+        return 2
+    pmap = load_map(home)
+    if args.command == "split" and not 0 <= args.partition < len(pmap.files):
+        print(f"Partition {args.partition} does not exist")
+        return 2
+    started = time.perf_counter()
+    if args.command != "status":
+        removed = purge_unowned(home, pmap)
+        if removed:
+            print(f"Removed {removed} agencies left behind by an interrupted move")
+    code = COMMANDS[args.command](home, pmap, args)
+    if args.command != "status":
+        print(f"Done in {time.perf_counter() - started:.2f}s")
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
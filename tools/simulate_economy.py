@@ -0,0 +1,434 @@
+"""Offline economy simulator: ``python -m tools.simulate_economy``.
+
+Plays synthetic agencies through simulated weeks with the real tick math
+(:func:`services.game.stamina_tick`, level requirements, passive income) and
+the real gacha (:func:`services.gacha.rarity_roll` and ``pick_by_rarity``
+over the compiled pool).  It reports distributions of money, best level,
+roster size and time to the first UR per player behaviour, so changes to
+:mod:`services.balance` can be judged before they ship.
+
+Girls pulled in the same session share their stamina, level and XP forever
+after, so each agency settles one *cohort* per pull session instead of one
+row per girl.  Once the roster owns the whole pool, further pulls are pure
+cashback and are settled in closed form.  Agencies are simulated in chunks
+on a process pool.
+
+Examples::
+
+    python -m tools.simulate_economy --agencies 100000 --days 30
+    python -m tools.simulate_economy --mix casual=3,active=1 --set GACHA_COST=800
+    python -m tools.simulate_economy --behavior "weekend:sessions=0.3,pulls=40,rotate=1"
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from array import array
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from models.girl_pool import compile_pool
+from services import balance, game, gacha
+from services.roster import ROTATE_REST_BELOW, ROTATE_WORK_ABOVE
+
+DAY = 86400.0
+METRIC_NAMES: Tuple[str, ...] = ("money", "level", "roster", "pulls", "hours_to_ur")
+PERCENTILES: Tuple[float, ...] = (0.10, 0.50, 0.90, 0.99)
+# Constants --set may override, with the modules that read them at call time.
+TUNABLE: Tuple[str, ...] = (
+    "GACHA_COST",
+    "DUP_CASHBACK",
+    "LEVEL_INCOME_GROWTH",
+    "FANS_GAIN_PER_POP",
+    "PASSIVE_PER_FAN_PER_SEC",
+    "STAM_DOWN_SEC_PER_1",
+    "STAM_UP_SEC_PER_1",
+    "STARTER_MONEY",
+    "RARITY_WEIGHTS",
+)
+
+
+@dataclass(frozen=True)
+class Behavior:
+    name: str
+    sessions: float = 2.0  # play sessions per day
+    pulls: int = 10  # most scouts per session
+    batch: int = 1  # only scout when this many are affordable
+    rotate: bool = False  # run /roster rotate every session
+    jitter: float = 0.25  # +/- fraction applied to the gap between sessions
+
+
+BEHAVIORS: Dict[str, Behavior] = {
+    "casual": Behavior("casual", sessions=2, pulls=10),
+    "active": Behavior("active", sessions=8, pulls=30, rotate=True),
+    "saver": Behavior("saver", sessions=1, pulls=50, batch=10),
+    "idle": Behavior("idle", sessions=1 / 3, pulls=3),
+}
+DEFAULT_MIX = "casual=5,active=2,saver=2,idle=1"
+
+
+def parse_behavior(text: str) -> Behavior:
+    """``name:sessions=4,pulls=20,batch=1,rotate=1,jitter=0.25``."""
+
+    name, _, spec = text.partition(":")
+    known = {f.name for f in fields(Behavior)} - {"name"}
+    values: Dict[str, Any] = {}
+    for part in spec.split(","):
+        key, _, raw = part.partition("=")
+        key = key.strip()
+        if not key:
+            continue
+        if key not in known:
+            raise argparse.ArgumentTypeError(f"unknown behaviour field: {key}")
+        if key == "rotate":
+            values[key] = raw.strip().lower() in ("1", "true", "yes", "on")
+        elif key in ("pulls", "batch"):
+            values[key] = int(raw)
+        else:
+            values[key] = float(raw)
+    base = BEHAVIORS.get(name.strip(), Behavior(name.strip()))
+    return Behavior(**{**base.__dict__, **values, "name": name.strip()})
+
+
+def parse_override(text: str) -> Tuple[str, Any]:
+    """``NAME=value``; ``RARITY_WEIGHTS=N:50,R:25,...``."""
+
+    name, _, raw = text.partition("=")
+    name = name.strip().upper()
+    if name not in TUNABLE:
+        raise argparse.ArgumentTypeError(f"{name} is not tunable; choose from {', '.join(TUNABLE)}")
+    if name == "RARITY_WEIGHTS":
+        weights = []
+        for part in raw.split(","):
+            code, _, weight = part.partition(":")
+            weights.append((code.strip(), float(weight)))
+        return name, tuple(weights)
+    kind = type(getattr(balance, name))
+    return name, kind(float(raw)) if kind is int else float(raw)
+
+
+def apply_overrides(overrides: Dict[str, Any]) -> None:
+    """Patch balance constants in this process; workers call it on start."""
+
+    for name, value in overrides.items():
+        for module in (balance, game, gacha):
+            if hasattr(module, name):
+                setattr(module, name, value)
+    # Derived from the stamina rates at import time.
+    game.WORK_PHASE_SEC = 100 * game.STAM_DOWN_SEC_PER_1
+    game.REST_PHASE_SEC = 100 * game.STAM_UP_SEC_PER_1
+    game.CYCLE_SEC = game.WORK_PHASE_SEC + game.REST_PHASE_SEC
+
+
+# -- one agency -------------------------------------------------------------
+
+# A cohort: [stamina, working, level, xp, next requirement (or None), income, popularity, fans, girls]
+Cohort = List[Any]
+
+
+def _requirement(level: int) -> Optional[float]:
+    requirement = balance.level_xp_required(level)
+    return float(requirement) if requirement is not None else None
+
+
+def _new_cohort(income: float, popularity: float, girls: int) -> Cohort:
+    return [100.0, True, 1, 0.0, _requirement(1), income, popularity, 0.0, girls]
+
+
+def _settle(cohorts: List[Cohort], dt: float) -> Tuple[float, int]:
+    """Money earned over ``dt`` (work plus passive) and the best level."""
+
+    stamina_tick = game.stamina_tick
+    fans_per_pop = balance.FANS_GAIN_PER_POP
+    growth = 1 + balance.LEVEL_INCOME_GROWTH
+    earned = 0.0
+    total_fans = 0.0
+    best = 0
+    for cohort in cohorts:
+        s, w, work, _rest = stamina_tick(cohort[0], cohort[1], dt)
+        cohort[0] = s
+        cohort[1] = w
+        if work > 0:
+            earned += cohort[5] * work
+            cohort[7] += cohort[6] * fans_per_pop * work
+            cohort[3] += work
+            requirement = cohort[4]
+            while requirement is not None and cohort[3] >= requirement:
+                cohort[3] -= requirement
+                cohort[2] += 1
+                cohort[5] *= growth
+                requirement = _requirement(cohort[2])
+            if requirement is None:
+                cohort[3] = 0.0
+            cohort[4] = requirement
+        total_fans += cohort[7]
+        if cohort[2] > best:
+            best = cohort[2]
+    return earned + total_fans * balance.PASSIVE_PER_FAN_PER_SEC * dt, best
+
+
+def _rotate(cohorts: List[Cohort]) -> None:
+    for cohort in cohorts:
+        if cohort[1] and cohort[0] < ROTATE_REST_BELOW:
+            cohort[1] = False
+        elif not cohort[1] and cohort[0] >= ROTATE_WORK_ABOVE:
+            cohort[1] = True
+
+
+def simulate_agency(behavior: Behavior, days: float, pool, rng: random.Random) -> Tuple[float, ...]:
+    """Play one agency for ``days``; returns the :data:`METRIC_NAMES` values."""
+
+    cost = balance.GACHA_COST
+    cashback = int(round(cost * balance.DUP_CASHBACK))
+    starter = balance.STARTER_GIRL
+    cohorts = [_new_cohort(float(starter["income"]), float(starter["popularity"]), 1)]
+    owned = {starter["name"]}
+    # Pool girls still missing from the roster.
+    missing = len(pool.by_name) - (starter["name"] in pool.by_name)
+    money = float(balance.STARTER_MONEY)
+    pulls = 0
+    first_ur: Optional[float] = None
+    horizon = days * DAY
+    gap = DAY / behavior.sessions
+    now = 0.0
+    best = 1
+
+    while True:
+        step = gap * rng.uniform(1 - behavior.jitter, 1 + behavior.jitter)
+        last = now + step >= horizon
+        step = horizon - now if last else step
+        now += step
+        earned, best = _settle(cohorts, step)
+        money += earned
+        if last:
+            break
+        if behavior.rotate:
+            _rotate(cohorts)
+        if money < cost * behavior.batch:
+            continue
+        if not missing:
+            # Every pull is a duplicate now: spend down in closed form.
+            net = cost - cashback
+            affordable = int((money - cost) // net) + 1 if net > 0 else behavior.pulls
+            done = min(behavior.pulls, affordable)
+            money -= done * net
+            pulls += done
+            continue
+        new: Optional[Cohort] = None
+        for _ in range(behavior.pulls):
+            if money < cost:
+                break
+            money -= cost
+            pulls += 1
+            girl = gacha.pick_by_rarity(pool.entries, gacha.rarity_roll(), pool.by_rarity)
+            if girl["name"] in owned:
+                money += cashback
+                continue
+            owned.add(girl["name"])
+            missing -= 1
+            if girl["rarity"] == "UR" and first_ur is None:
+                first_ur = now
+            if new is None:
+                new = _new_cohort(0.0, 0.0, 0)
+                cohorts.append(new)
+            new[5] += float(girl["income"])
+            new[6] += float(girl["popularity"])
+            new[8] += 1
+
+    hours_to_ur = first_ur / 3600 if first_ur is not None else float("inf")
+    return money, float(best), float(len(owned)), float(pulls), hours_to_ur
+
+
+# -- process pool -----------------------------------------------------------
+
+_POOL = None
+
+
+def _init_worker(pool_path: str, overrides: Dict[str, Any]) -> None:
+    global _POOL
+    apply_overrides(overrides)
+    _POOL = compile_pool(pool_path)
+
+
+ChunkResult = Dict[str, Dict[str, array]]
+
+
+def _run_chunk(task: Tuple[int, Sequence[Tuple[Behavior, int]], float, int]) -> ChunkResult:
+    index, plan, days, seed = task
+    # gacha.rarity_roll draws from the module RNG, so seed it per chunk.
+    random.seed(seed * 1_000_003 + index)
+    rng = random.Random(seed * 7_919 + index)
+    out: ChunkResult = {}
+    for behavior, count in plan:
+        metrics = out.setdefault(behavior.name, {name: array("d") for name in METRIC_NAMES})
+        for _ in range(count):
+            for name, value in zip(METRIC_NAMES, simulate_agency(behavior, days, _POOL, rng)):
+                metrics[name].append(value)
+    return out
+
+
+def plan_chunks(
+    agencies: int, mix: Sequence[Tuple[Behavior, int]], chunk: int
+) -> List[List[Tuple[Behavior, int]]]:
+    """Split ``agencies`` by ``mix`` weights into chunks of about ``chunk``."""
+
+    total_weight = sum(weight for _behavior, weight in mix)
+    counts = [(behavior, agencies * weight // total_weight) for behavior, weight in mix]
+    counts[0] = (counts[0][0], counts[0][1] + agencies - sum(count for _b, count in counts))
+    chunks: List[List[Tuple[Behavior, int]]] = []
+    for behavior, count in counts:
+        while count > 0:
+            take = min(chunk, count)
+            chunks.append([(behavior, take)])
+            count -= take
+    return chunks
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted ``values``; ``None`` for "never"."""
+
+    if not values:
+        return None
+    value = values[min(len(values) - 1, int(q * len(values)))]
+    return None if value == float("inf") else value
+
+
+def summarise(results: Dict[str, Dict[str, array]]) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {}
+    for behavior, metrics in sorted(results.items()):
+        entry: Dict[str, Any] = {"agencies": len(metrics["money"])}
+        for name in METRIC_NAMES:
+            values = sorted(metrics[name])
+            finite = [v for v in values if v != float("inf")]
+            entry[name] = {f"p{int(q * 100)}": percentile(values, q) for q in PERCENTILES}
+            entry[name]["mean"] = sum(finite) / len(finite) if finite else None
+            if name == "hours_to_ur":
+                entry[name]["never"] = (len(values) - len(finite)) / len(values) if values else 0.0
+        summary[behavior] = entry
+    return summary
+
+
+def _cell(value: Optional[float]) -> str:
+    if value is None:
+        return "never"
+    if abs(value) >= 1_000_000:
+        return f"{value:.3g}"
+    return f"{value:,.1f}"
+
+
+def report(summary: Dict[str, Any]) -> None:
+    header = "  ".join(f"{f'p{int(q * 100)}':>10}" for q in PERCENTILES)
+    for behavior, entry in summary.items():
+        print(f"\n== {behavior} ({entry['agencies']} agencies)")
+        print(f"  {'metric':<12}  {header}  {'mean':>10}")
+        for name in METRIC_NAMES:
+            stats = entry[name]
+            cells = "  ".join(f"{_cell(stats[f'p{int(q * 100)}']):>10}" for q in PERCENTILES)
+            line = f"  {name:<12}  {cells}  {_cell(stats['mean']):>10}"
+            if "never" in stats:
+                line += f"  (never: {stats['never']:.1%})"
+            print(line)
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m tools.simulate_economy", description=__doc__.splitlines()[0])
+    parser.add_argument("--agencies", type=int, default=100_000, help="synthetic agencies to play")
+    parser.add_argument("--days", type=float, default=30.0, help="simulated days per agency")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="behaviour weights (default: %(default)s)")
+    parser.add_argument(
+        "--behavior",
+        action="append",
+        type=parse_behavior,
+        default=[],
+        metavar="NAME:FIELD=VALUE,...",
+        help="define or adjust a behaviour (fields: sessions, pulls, batch, rotate, jitter)",
+    )
+    parser.add_argument(
+        "--set",
+        dest="overrides",
+        action="append",
+        type=parse_override,
+        default=[],
+        metavar="NAME=VALUE",
+        help=f"override a balance constant ({', '.join(TUNABLE)})",
+    )
+    parser.add_argument("--pool", default=os.getenv("GIRLS_JSON_PATH", "data/girls.json"), help="girls.json to scout from")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--chunk", type=int, default=5_000, help="agencies per work item")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--json", help="also write the summary as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str]) -> int:
+    args = parse_args(argv)
+    behaviors = dict(BEHAVIORS)
+    behaviors.update((behavior.name, behavior) for behavior in args.behavior)
+    mix = []
+    for part in args.mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip():
+            if name.strip() not in behaviors:
+                print(f"Unknown behaviour {name.strip()!r}; define it with --behavior")
+                return 2
+            mix.append((behaviors[name.strip()], int(weight or 1)))
+    overrides = dict(args.overrides)
+    pool = compile_pool(args.pool)
+    if not pool.entries:
+        print(f"No girls to scout in {args.pool}: {pool.warnings}")
+        return 2
+
+    chunks = plan_chunks(args.agencies, mix, args.chunk)
+    tasks = [(index, plan, args.days, args.seed) for index, plan in enumerate(chunks)]
+    print(
+        f"Simulating {args.agencies} agencies x {args.days:g} days "
+        f"({len(pool.entries)} girls in the pool, {len(tasks)} chunks, {args.processes} processes)"
+    )
+    started = time.perf_counter()
+    results: Dict[str, Dict[str, array]] = {}
+    if args.processes <= 1:
+        _init_worker(args.pool, overrides)
+        parts = map(_run_chunk, tasks)
+        pool_ctx = None
+    else:
+        pool_ctx = multiprocessing.Pool(args.processes, initializer=_init_worker, initargs=(args.pool, overrides))
+        parts = pool_ctx.imap_unordered(_run_chunk, tasks)
+    try:
+        for done, part in enumerate(parts, start=1):
+            for behavior, metrics in part.items():
+                target = results.setdefault(behavior, {name: array("d") for name in METRIC_NAMES})
+                for name, values in metrics.items():
+                    target[name].extend(values)
+            if done % max(1, len(tasks) // 10) == 0:
+                print(f"  {done}/{len(tasks)} chunks, {time.perf_counter() - started:.1f}s")
+    finally:
+        if pool_ctx is not None:
+            pool_ctx.close()
+            pool_ctx.join()
+    elapsed = time.perf_counter() - started
+    print(f"Done in {elapsed:.1f}s ({args.agencies / elapsed:,.0f} agencies/s)")
+
+    summary = summarise(results)
+    report(summary)
+    if args.json:
+        payload = {
+            "agencies": args.agencies,
+            "days": args.days,
+            "overrides": overrides,
+            "behaviors": {name: behavior.__dict__ for name, behavior in behaviors.items()},
+            "elapsed": elapsed,
+            "results": summary,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))